@@ -0,0 +1,281 @@
+"""
+Cold storage for append-only log tables.
+
+Rows older than a horizon are moved out of the database into one gzipped
+JSONL file per table and day (``<dir>/<table>/YYYY-MM-DD.jsonl.gz``). Each
+table directory has a ``manifest.json`` recording, per partition, the row
+count, first/last timestamps and the distinct values of a few entity
+columns, so a lookup only opens the partitions that can contain a match.
+
+``search`` answers a date-range/entity query from the hot table and the
+relevant partitions together, newest first.
+"""
+
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+MANIFEST_NAME = 'manifest.json'
+# Partitions with more distinct values than this store no index for the column
+MANIFEST_INDEX_LIMIT = 1000
+
+
+class ArchivedTable:
+    """An append-only table that can be rolled into cold storage"""
+
+    def __init__(self, name, model_label, timestamp_field='timestamp', index_fields=(),
+                 filter_fields=(), directory_setting=None):
+        self.name = name
+        self.model_label = model_label
+        self.timestamp_field = timestamp_field
+        # Columns whose distinct values go into the manifest
+        self.index_fields = tuple(index_fields)
+        # Columns ``search`` accepts as filters
+        self.filter_fields = tuple(filter_fields)
+        self.directory_setting = directory_setting
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def directory(self):
+        if self.directory_setting:
+            return Path(getattr(settings, self.directory_setting))
+        return Path(settings.AUDIT_ARCHIVE['DIR']) / self.name
+
+    def field(self, attname):
+        for field in self.model._meta.concrete_fields:
+            if field.attname == attname:
+                return field
+        raise KeyError(attname)
+
+
+TABLES = {
+    table.name: table for table in (
+        ArchivedTable(
+            'ticket_audit', 'tickets.TicketAuditLog',
+            index_fields=('ticket_id', 'user_id'),
+            filter_fields=('ticket_id', 'user_id', 'action', 'bulk_upload_id'),
+        ),
+        ArchivedTable(
+            'audit', 'users.AuditLog',
+            index_fields=('user_id', 'entity_id'),
+            filter_fields=('user_id', 'action', 'entity_type', 'entity_id'),
+        ),
+        ArchivedTable(
+            'login_history', 'users.LoginHistory', timestamp_field='login_time',
+            index_fields=('user_id',),
+            filter_fields=('user_id', 'success'),
+        ),
+        ArchivedTable(
+            'transaction_logs', 'payments.TransactionLog',
+            index_fields=('payment_id',),
+            filter_fields=('payment_id', 'transaction_type', 'is_successful'),
+            directory_setting='TRANSACTION_LOG_ARCHIVE_DIR',
+        ),
+    )
+}
+
+
+def get_table(name):
+    try:
+        return TABLES[name]
+    except KeyError:
+        raise ValueError(f'Unknown archive table: {name}')
+
+
+def serialize(instance):
+    """Row as stored in the archive: column attname -> JSON value"""
+    row = {}
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        if value is not None and not isinstance(value, (bool, int, float, str, dict, list)):
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        row[field.attname] = value
+    return row
+
+
+# -- Manifest ---------------------------------------------------------------
+
+def load_manifest(directory):
+    path = Path(directory) / MANIFEST_NAME
+    if not path.exists():
+        return {'partitions': {}}
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _save_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST_NAME
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+def _update_partition(entry, table, rows):
+    timestamps = [row[table.timestamp_field] for row in rows]
+    entry['rows'] = entry.get('rows', 0) + len(rows)
+    entry['first'] = min([entry['first']] + timestamps if entry.get('first') else timestamps)
+    entry['last'] = max([entry['last']] + timestamps if entry.get('last') else timestamps)
+    index = entry.setdefault('index', {})
+    for attname in table.index_fields:
+        if attname in index and index[attname] is None:
+            continue
+        values = set(index.get(attname, [])) | {row[attname] for row in rows if row[attname] is not None}
+        index[attname] = sorted(values) if len(values) <= MANIFEST_INDEX_LIMIT else None
+
+
+def rebuild_manifest(table, directory=None):
+    """Recreate the manifest from the partition files themselves"""
+    directory = Path(directory or table.directory)
+    manifest = {'partitions': {}}
+    for path in sorted(directory.glob('*.jsonl.gz')):
+        day = path.name[:-len('.jsonl.gz')]
+        entry = manifest['partitions'][day] = {'file': path.name}
+        rows = list(_read_partition(path))
+        if rows:
+            _update_partition(entry, table, rows)
+    _save_manifest(directory, manifest)
+    return manifest
+
+
+# -- Archiving --------------------------------------------------------------
+
+def archive(table, before, directory=None, batch_size=1000):
+    """
+    Move rows older than ``before`` into ``<directory>/YYYY-MM-DD.jsonl.gz``.
+
+    Each batch is appended (as its own gzip member) and flushed to disk, and
+    the manifest updated, before its rows are deleted, so an interrupted run
+    never loses a row. Rows a partition already holds (from a run that
+    stopped before deleting them) are not written again, and the first time
+    a run touches a day its manifest entry is rebuilt from the file, so
+    re-running is idempotent.
+    """
+    directory = Path(directory or table.directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(directory)
+    model = table.model
+    field = table.timestamp_field
+    archived = 0
+    # Day -> ids already in its partition file, for the days this run touched
+    stored = {}
+
+    while True:
+        batch = list(model.objects.filter(**{f'{field}__lt': before}).order_by(field, 'pk')[:batch_size])
+        if not batch:
+            return archived
+
+        by_day = defaultdict(list)
+        for instance in batch:
+            by_day[getattr(instance, field).date().isoformat()].append(serialize(instance))
+
+        for day, rows in by_day.items():
+            path = directory / f'{day}.jsonl.gz'
+            if day not in stored:
+                existing = list(_read_partition(path)) if path.exists() else []
+                stored[day] = {row['id'] for row in existing}
+                # Overwrite the entry: it may count rows an earlier run wrote twice or never recorded
+                manifest['partitions'][day] = {'file': path.name}
+                if existing:
+                    _update_partition(manifest['partitions'][day], table, existing)
+            rows = [row for row in rows if row['id'] not in stored[day]]
+            if not rows:
+                continue
+            with gzip.open(path, 'at', encoding='utf-8') as handle:
+                for row in rows:
+                    handle.write(json.dumps(row, default=str) + '\n')
+                handle.flush()
+                os.fsync(handle.fileno())
+            stored[day].update(row['id'] for row in rows)
+            _update_partition(manifest['partitions'][day], table, rows)
+        _save_manifest(directory, manifest)
+
+        model.objects.filter(pk__in=[instance.pk for instance in batch]).delete()
+        archived += len(batch)
+
+
+# -- Querying ---------------------------------------------------------------
+
+def _read_partition(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _day(value):
+    return value.astimezone(dt_timezone.utc).date() if timezone.is_aware(value) else value.date()
+
+
+def _partitions(table, directory, start, end, filters):
+    """Partition files that may hold matching rows, newest first"""
+    manifest = load_manifest(directory)
+    if not manifest['partitions'] and any(directory.glob('*.jsonl.gz')):
+        manifest = rebuild_manifest(table, directory)
+
+    for day, entry in sorted(manifest['partitions'].items(), reverse=True):
+        day = parse_date(day)
+        if (start and day < _day(start)) or (end and day > _day(end)):
+            continue
+        index = entry.get('index', {})
+        if any(
+            index.get(attname) is not None and str(value) not in index[attname]
+            for attname, value in filters.items()
+        ):
+            continue
+        yield directory / entry['file']
+
+
+def search(table, start=None, end=None, limit=100, directory=None, **filters):
+    """
+    Rows of ``table`` with a timestamp in ``[start, end]`` matching
+    ``filters`` (column attname -> value), newest first, from the database
+    and then the archive. Raises ValueError for an unsupported filter and
+    ValidationError for a value the column can't hold.
+    """
+    unknown = set(filters) - set(table.filter_fields)
+    if unknown:
+        raise ValueError(f"Unsupported filter(s) for {table.name}: {', '.join(sorted(unknown))}")
+    fields = {attname: table.field(attname) for attname in filters}
+    filters = {attname: fields[attname].to_python(value) for attname, value in filters.items()}
+    timestamp_field = table.timestamp_field
+
+    queryset = table.model.objects.filter(**filters)
+    if start:
+        queryset = queryset.filter(**{f'{timestamp_field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{timestamp_field}__lte': end})
+    rows = [serialize(instance) for instance in queryset.order_by(f'-{timestamp_field}', '-pk')[:limit]]
+    if len(rows) >= limit:
+        return rows
+
+    seen = {row['id'] for row in rows}
+    directory = Path(directory or table.directory)
+    for path in _partitions(table, directory, start, end, filters):
+        matches = []
+        for row in _read_partition(path):
+            timestamp = parse_datetime(row[timestamp_field])
+            if (start and timestamp < start) or (end and timestamp > end) or row['id'] in seen:
+                continue
+            if all(fields[attname].to_python(row[attname]) == value for attname, value in filters.items()):
+                seen.add(row['id'])
+                matches.append((timestamp, row['id'], row))
+        matches.sort(key=lambda match: match[:2], reverse=True)
+        rows.extend(row for _, _, row in matches[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+    return rows
+
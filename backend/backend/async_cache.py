@@ -0,0 +1,73 @@
+"""
+Non-blocking access to the shared cache for async views.
+
+With django-redis, reads and writes go through a ``redis.asyncio`` client
+(one per event loop) using django-redis's own key format and value
+encoding, so async and sync code share entries. Like the sync cache
+(IGNORE_EXCEPTIONS), an unreachable Redis counts as a miss and a write
+that fails is skipped. Other cache backends (LocMem in tests and
+development) fall back to Django's ``aget``/``aset`` family, which runs
+the sync calls in a thread.
+"""
+
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import registry
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def _redis():
+    """This event loop's redis.asyncio client, or None without django-redis"""
+    try:
+        import redis.asyncio
+        from django_redis import get_redis_connection
+        get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        location = settings.CACHES['default']['LOCATION']
+        if not isinstance(location, str):
+            location = location[0]
+        client = _clients[loop] = redis.asyncio.from_url(location.split(',')[0])
+    return client
+
+
+def _failed(e):
+    registry.incr('async_cache.errors', error=type(e).__name__)
+
+
+async def aget_many(keys):
+    client = _redis()
+    if client is None:
+        return await cache.aget_many(keys)
+    if not keys:
+        return {}
+    full_keys = [str(cache.client.make_key(key)) for key in keys]
+    try:
+        values = await client.mget(full_keys)
+    except Exception as e:
+        _failed(e)
+        return {}
+    return {key: cache.client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def aget(key, default=None):
+    return (await aget_many([key])).get(key, default)
+
+
+async def aset(key, value, timeout):
+    client = _redis()
+    if client is None:
+        await cache.aset(key, value, timeout)
+        return
+    try:
+        await client.set(str(cache.client.make_key(key)), cache.client.encode(value), ex=timeout)
+    except Exception as e:
+        _failed(e)
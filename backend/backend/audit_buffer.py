@@ -0,0 +1,206 @@
+"""
+Buffered audit-log writes.
+
+``record()`` takes an unsaved audit row (TicketAuditLog, AuditLog,
+LoginHistory, ...) instead of calling ``objects.create``:
+
+* inside a transaction the row joins a batch that is written with one
+  ``bulk_create`` when the transaction commits (``on_commit``), so rolled
+  back work leaves no audit trail;
+* in autocommit inside an ``audit_scope`` (every request, via
+  AuditBufferMiddleware, and jobs such as CSV imports) rows are collected
+  and written when the scope ends or BATCH_SIZE rows have built up;
+* with no scope the row is written straight away.
+
+Non-critical rows (``critical=False``) are handed to a BackgroundBulkWriter
+after commit when AUDIT_BUFFER['BACKGROUND'] is on.
+
+``record()`` stamps the row's ``timestamp`` at once, from a clock that
+never repeats a value within the process, so rows inserted together still
+sort in the order they were recorded.
+
+The rows land after the audited object's post_save has already bumped its
+caches, so ``written`` is sent once they are in the table; receivers drop
+whatever was cached from the rows in between.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .bulk_writer import BackgroundBulkWriter
+
+_current = ContextVar('audit_buffer', default=None)
+
+# Sent with sender=<audit model>, instances=[...] after each write
+written = Signal()
+
+
+def _config(key, default):
+    return getattr(settings, 'AUDIT_BUFFER', {}).get(key, default)
+
+
+def _by_model(entries):
+    by_model = {}
+    for instance in entries:
+        by_model.setdefault(type(instance), []).append(instance)
+    return by_model.items()
+
+
+def _write(entries, batch_size=None):
+    for model, instances in _by_model(entries):
+        model.objects.bulk_create(instances, batch_size=batch_size or _config('BATCH_SIZE', 500))
+        written.send(sender=model, instances=instances)
+
+
+def _written_in_background(entries):
+    for model, instances in _by_model(entries):
+        written.send(sender=model, instances=instances)
+
+
+background_writer = BackgroundBulkWriter(
+    'audit',
+    batch_size=_config('BATCH_SIZE', 500),
+    flush_interval=_config('FLUSH_INTERVAL', 1.0),
+    async_writes=_config('BACKGROUND', True),
+    on_insert=_written_in_background,
+)
+
+
+class _CommitBatch:
+    """Rows recorded in one transaction (or savepoint), written on commit"""
+
+    def __init__(self):
+        self.entries = []
+
+    def __call__(self):
+        _write(self.entries)
+        self.entries = []
+
+
+class AuditBuffer:
+    """Collects audit rows for one request or job"""
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or _config('BATCH_SIZE', 500)
+        self.entries = []
+        self._batches = {}
+
+    def add(self, instance, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        if not connection.in_atomic_block:
+            self.entries.append(instance)
+            if len(self.entries) >= self.batch_size:
+                self.flush()
+            return
+
+        # One batch per savepoint: rolling a savepoint back drops its
+        # on_commit callback, and with it the rows recorded inside it.
+        key = (using, tuple(connection.savepoint_ids))
+        batch = self._batches.get(key)
+        if batch is None or not any(func is batch for _, func, _ in connection.run_on_commit):
+            batch = self._batches[key] = _CommitBatch()
+            transaction.on_commit(batch, using=using)
+        batch.entries.append(instance)
+
+    def flush(self):
+        """Write rows collected outside a transaction"""
+        entries, self.entries = self.entries, []
+        if entries:
+            _write(entries, self.batch_size)
+
+
+def current_buffer():
+    return _current.get()
+
+
+@contextmanager
+def audit_scope(batch_size=None):
+    """Buffer audit rows until the block ends (nested scopes share the outer one)"""
+    buffer = _current.get()
+    if buffer is not None:
+        yield buffer
+        return
+
+    buffer = AuditBuffer(batch_size)
+    token = _current.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current.reset(token)
+        buffer.flush()
+
+
+_last_stamp = None
+_stamp_lock = threading.Lock()
+
+
+def _now():
+    """``timezone.now()``, but strictly increasing within the process"""
+    global _last_stamp
+    with _stamp_lock:
+        now = timezone.now()
+        if _last_stamp is not None and now <= _last_stamp:
+            now = _last_stamp + timedelta(microseconds=1)
+        _last_stamp = now
+        return now
+
+
+def _stamp(instance):
+    try:
+        field = instance._meta.get_field('timestamp')
+    except FieldDoesNotExist:
+        return
+    setattr(instance, field.attname, _now())
+
+
+def record(instance, critical=True, using=DEFAULT_DB_ALIAS):
+    """Queue an unsaved audit row for writing"""
+    _stamp(instance)
+    if not critical and background_writer.async_writes:
+        transaction.on_commit(lambda: background_writer.write(instance), using=using)
+        return
+
+    buffer = _current.get()
+    if buffer is not None:
+        buffer.add(instance, using)
+    elif connections[using].in_atomic_block:
+        transaction.on_commit(lambda: _write([instance]), using=using)
+    else:
+        _write([instance])
+
+
+class AuditBufferMiddleware:
+    """Give every request its own audit buffer"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with audit_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # audit_scope() would flush (write) on the event loop
+        buffer = AuditBuffer()
+        token = _current.set(buffer)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            if buffer.entries:
+                await sync_to_async(buffer.flush)()
@@ -0,0 +1,84 @@
+"""
+Helpers for the benchmark management commands.
+
+StepRecorder times named steps and counts the queries each one runs;
+``summary`` turns the samples into throughput, latency percentiles and
+query counts, and ``format_table`` prints them.
+"""
+
+import math
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class StepRecorder:
+    """Collect latency and query-count samples per named step"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._order = []
+
+    @contextmanager
+    def step(self, name, using=None):
+        """Time the wrapped block and count the queries it runs"""
+        conn = connection if using is None else using
+        if name not in self.samples:
+            self.samples[name] = []
+            self._order.append(name)
+        with CaptureQueriesContext(conn) as queries:
+            start = time.perf_counter()
+            try:
+                yield
+            except Exception:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+        self.samples[name].append((elapsed, len(queries)))
+
+    def summary(self):
+        """Per-step statistics, in the order the steps first ran"""
+        rows = []
+        for name in self._order:
+            samples = self.samples[name]
+            latencies = [elapsed for elapsed, _ in samples]
+            queries = [count for _, count in samples]
+            total = sum(latencies)
+            rows.append({
+                'step': name,
+                'count': len(samples),
+                'errors': self.errors.get(name, 0),
+                'throughput': len(samples) / total if total else 0.0,
+                'mean_ms': total / len(samples) * 1000 if samples else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'queries': sum(queries) / len(queries) if queries else 0.0,
+                'max_queries': max(queries) if queries else 0,
+            })
+        return rows
+
+
+def format_table(rows):
+    """Render ``StepRecorder.summary()`` rows as a fixed-width table"""
+    header = f"{'step':<24}{'n':>6}{'err':>5}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['step']:<24}{row['count']:>6}{row['errors']:>5}{row['throughput']:>9.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['queries']:>9.1f}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,214 @@
+"""
+Write-behind bulk inserts.
+
+BackgroundBulkWriter takes unsaved model instances off the request path,
+batches them on a daemon thread and inserts them with ``bulk_create``.
+With ``async_writes=False`` (tests, management commands that need the rows
+immediately) every write is inserted straight away.
+
+When a batch fails its rows are inserted one at a time, so one bad row
+does not lose the rest. A row that hits an IntegrityError (typically a
+foreign key to a row whose transaction has not committed yet) goes back
+on the queue up to ``max_retries`` times; rows that still fail are
+logged and counted as ``bulk_writer.dropped``.
+
+``on_insert`` is called with the instances of each write that made it to
+the database, e.g. to invalidate caches that show them.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+from django.db import IntegrityError, close_old_connections, connections
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Every writer in the process, for queue depth metrics
+writers = weakref.WeakSet()
+
+
+class BackgroundBulkWriter:
+    """Buffered, batched writer for one or more models"""
+
+    def __init__(self, name, batch_size=200, flush_interval=1.0, max_queue=10000, async_writes=True,
+                 max_retries=3, on_insert=None):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.async_writes = async_writes
+        self.max_retries = max_retries
+        self.on_insert = on_insert
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._pending = 0
+        self._done = threading.Condition()
+        atexit.register(self.flush)
+        writers.add(self)
+
+    @property
+    def depth(self):
+        """Number of entries waiting to be written"""
+        return self._queue.qsize()
+
+    def write(self, instance):
+        """Queue an unsaved model instance for insertion"""
+        if not self.async_writes:
+            self._insert([instance])
+            return
+
+        self._ensure_thread()
+        try:
+            with self._done:
+                self._pending += 1
+            self._queue.put_nowait(instance)
+        except queue.Full:
+            with self._done:
+                self._pending -= 1
+            # Backpressure: never drop entries, write this one inline
+            logger.warning("%s writer queue full, writing inline", self.name)
+            self._insert([instance])
+
+    def write_many(self, instances):
+        for instance in instances:
+            self.write(instance)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            batch = self._drain()
+            while batch:
+                self._insert(batch)
+                self._mark_done(len(batch))
+                batch = self._drain()
+            return
+        deadline = time.monotonic() + timeout
+        with self._done:
+            while self._pending and time.monotonic() < deadline:
+                self._done.wait(max(deadline - time.monotonic(), 0))
+
+    def _mark_done(self, count):
+        with self._done:
+            self._pending = max(self._pending - count, 0)
+            self._done.notify_all()
+
+    def _ensure_thread(self):
+        # Threads do not survive fork (e.g. gunicorn --preload), so restart per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name=f'{self.name}-writer', daemon=True
+                )
+                self._thread.start()
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _collect(self, first):
+        # Linger up to flush_interval so bursts go out as full batches
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = self._collect(first)
+            try:
+                close_old_connections()
+                self._insert(batch)
+            finally:
+                self._mark_done(len(batch))
+
+    def _insert(self, batch):
+        if not batch:
+            return
+        by_model = {}
+        for instance in batch:
+            by_model.setdefault(type(instance), []).append(instance)
+        inserted = []
+        for model, instances in by_model.items():
+            if len(instances) == 1:
+                inserted += self._insert_each(model, instances)
+                continue
+            try:
+                model.objects.bulk_create(instances, batch_size=self.batch_size)
+                inserted += instances
+            except Exception:
+                logger.warning("%s writer failed to insert %d %s rows, retrying one by one",
+                               self.name, len(instances), model.__name__, exc_info=True)
+                self._reset_connection()
+                inserted += self._insert_each(model, instances)
+
+        if inserted and self.on_insert is not None:
+            try:
+                self.on_insert(inserted)
+            except Exception:
+                logger.exception("%s writer on_insert callback failed", self.name)
+
+    def _insert_each(self, model, instances):
+        inserted = []
+        for instance in instances:
+            try:
+                model.objects.bulk_create([instance])
+                inserted.append(instance)
+            except IntegrityError:
+                self._reset_connection()
+                self._retry(instance)
+            except Exception:
+                logger.exception("%s writer failed to insert a %s row", self.name, model.__name__)
+                self._reset_connection()
+                self._dropped(instance)
+        return inserted
+
+    def _retry(self, instance):
+        attempts = getattr(instance, '_bulk_write_attempts', 0) + 1
+        if attempts > self.max_retries or not self.async_writes:
+            logger.error("%s writer gave up on a %s row after %d attempts",
+                         self.name, type(instance).__name__, attempts)
+            self._dropped(instance)
+            return
+        instance._bulk_write_attempts = attempts
+        with self._done:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(instance)
+        except queue.Full:
+            self._mark_done(1)
+            self._dropped(instance)
+
+    def _dropped(self, instance):
+        registry.incr('bulk_writer.dropped', writer=self.name, model=type(instance).__name__)
+
+    def _reset_connection(self):
+        # A failed statement can leave the writer thread's connection unusable
+        if threading.current_thread() is self._thread:
+            connections.close_all()
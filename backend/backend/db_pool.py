@@ -0,0 +1,90 @@
+"""
+Database connection settings for production.
+
+Without pooling, connections persist for DB_CONN_MAX_AGE seconds and are
+health-checked before reuse, so a worker thread does not reconnect on
+every request. With DB_POOL on, a PostgreSQL database gets Django's psycopg
+pool instead (this needs psycopg 3 and psycopg_pool; with psycopg2 alone the
+settings fall back to persistent connections and warn).
+
+Each gunicorn worker has its own pool. The pool holds at most one
+connection per worker thread, capped so that workers * max_size leaves
+DB_RESERVED_CONNECTIONS of DB_MAX_CONNECTIONS for migrations, cron jobs
+and psql. Gunicorn (gunicorn.conf.py) and the settings read the worker
+and thread counts from the same environment variables, through
+``gunicorn_concurrency``.
+"""
+
+import importlib.util
+import multiprocessing
+import os
+import warnings
+
+from .metrics import registry
+
+POSTGRES_ENGINES = {'django.db.backends.postgresql', 'django.contrib.gis.db.backends.postgis'}
+
+
+def gunicorn_concurrency():
+    """(workers, threads per worker) gunicorn is started with"""
+    workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+    return max(workers, 1), max(threads, 1)
+
+
+def pool_options(workers, threads, max_connections=100, reserved=10, timeout=10):
+    """Per-worker pool sizes that keep every worker together under the server's limit"""
+    budget = max((max_connections - reserved) // workers, 1)
+    max_size = min(threads, budget)
+    return {
+        'min_size': max(max_size // 2, 1),
+        'max_size': max_size,
+        # Seconds a request waits for a free connection before failing
+        'timeout': timeout,
+    }
+
+
+def pooling_available():
+    """Django pools PostgreSQL connections only through psycopg 3"""
+    return all(importlib.util.find_spec(name) is not None for name in ('psycopg', 'psycopg_pool'))
+
+
+def database_config(url, conn_max_age=60, pool=None):
+    """
+    DATABASES entry for ``url``: persistent, health-checked connections,
+    or ``pool`` options (see ``pool_options``) where pooling is possible.
+    """
+    import dj_database_url
+
+    config = dj_database_url.parse(url, conn_max_age=conn_max_age, conn_health_checks=conn_max_age > 0)
+    if pool and config['ENGINE'] in POSTGRES_ENGINES:
+        if pooling_available():
+            # Django refuses persistent connections alongside a pool
+            config['CONN_MAX_AGE'] = 0
+            config['CONN_HEALTH_CHECKS'] = False
+            config.setdefault('OPTIONS', {})['pool'] = pool
+        else:
+            warnings.warn('DB_POOL needs psycopg 3 and psycopg_pool; using persistent connections')
+    return config
+
+
+def _existing_pool(connection):
+    # ``connection.pool`` would create the pool on first access
+    return getattr(type(connection), '_connection_pools', {}).get(connection.alias)
+
+
+def record_pool_stats():
+    """Gauges for this process's connection pools (called when metrics are published)"""
+    from django.db import connections
+
+    for alias in connections:
+        pool = _existing_pool(connections[alias])
+        if pool is None:
+            continue
+        stats = pool.get_stats()
+        size, available = stats.get('pool_size', 0), stats.get('pool_available', 0)
+        registry.set_gauge('db.pool.max_size', stats.get('pool_max', 0), database=alias)
+        registry.set_gauge('db.pool.size', size, database=alias)
+        registry.set_gauge('db.pool.in_use', size - available, database=alias)
+        registry.set_gauge('db.pool.waiting', stats.get('requests_waiting', 0), database=alias)
+        registry.set_gauge('db.pool.connections_opened', stats.get('connections_num', 0), database=alias)
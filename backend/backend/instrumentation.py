@@ -0,0 +1,219 @@
+"""
+Per-request performance instrumentation.
+
+InstrumentationMiddleware gives each request a RequestTimings and records
+into it:
+
+* every database query, through an execute wrapper installed on each
+  connection as it opens (count, total time and the slowest few
+  statements). Connections belong to threads, and under ASGI the ORM runs
+  in sync_to_async threads rather than on the event loop, so the wrapper
+  finds the request through the context variable, which follows it there;
+* cache hits and misses reported by the code that does the lookups
+  (``cache_lookup``: response cache, facet counts, list totals, token
+  authentication);
+* time spent turning objects into response data (``TimedSerializerMixin``);
+* outbound calls timed with ``span`` (the Paystack client).
+
+The totals go out as a ``Server-Timing`` header (when HEADER is on) and as
+the fields of one log record per request on ``backend.instrumentation``. Requests
+slower than SLOW_REQUEST_MS are, at SLOW_SAMPLE_RATE, also logged on
+``backend.instrumentation.slow`` with their slowest queries.
+
+With INSTRUMENTATION['ENABLED'] off the middleware removes itself at
+startup (MiddlewareNotUsed) and the hooks cost one context variable lookup.
+"""
+
+import heapq
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger(f'{__name__}.slow')
+
+_current = ContextVar('request_timings', default=None)
+
+
+def _config(key, default):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(key, default)
+
+
+class RequestTimings:
+    """What one request spent its time on"""
+
+    def __init__(self, top_queries=5):
+        self.durations = {}
+        self.counts = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.top_queries = top_queries
+        self._slowest = []
+        self._active = set()
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add('db', elapsed)
+            # Keep the ``top_queries`` slowest (min-heap on duration)
+            entry = (elapsed, self.counts['db'], sql)
+            if len(self._slowest) < self.top_queries:
+                heapq.heappush(self._slowest, entry)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def slowest_queries(self):
+        return [
+            {'ms': round(elapsed * 1000, 2), 'sql': sql}
+            for elapsed, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+    def server_timing(self, total):
+        """The ``Server-Timing`` header value"""
+        metrics = [
+            f'{name};dur={seconds * 1000:.1f};desc="{self.counts[name]} calls"'
+            for name, seconds in self.durations.items()
+        ]
+        if self.cache_hits or self.cache_misses:
+            metrics.append(f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        record = {
+            f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.durations.items()
+        }
+        record.update({f'{name}_count': count for name, count in self.counts.items()})
+        record.update(cache_hits=self.cache_hits, cache_misses=self.cache_misses)
+        return record
+
+
+def current():
+    """The running request's RequestTimings, or None"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.execute_wrapper(execute, sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@contextmanager
+def span(name):
+    """Time the block as ``name`` in the current request (nested spans of the same name count once)"""
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, time.perf_counter() - start)
+
+
+def cache_lookup(hit):
+    """Count a cache hit or miss against the current request"""
+    timings = _current.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+class TimedSerializerMixin:
+    """Counts ``to_representation`` (lists, nested serializers included once) as serializer time"""
+
+    def to_representation(self, instance):
+        with span('serializer'):
+            return super().to_representation(instance)
+
+
+class InstrumentationMiddleware:
+    """Records RequestTimings for each request and reports them"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _config('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = _config('HEADER', False)
+        self.slow_seconds = _config('SLOW_REQUEST_MS', 500) / 1000
+        self.sample_rate = _config('SLOW_SAMPLE_RATE', 1.0)
+        self.top_queries = _config('TOP_QUERIES', 5)
+        # Every thread's connections, whichever thread ends up running the queries
+        connection_created.connect(_install)
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def _timed(self, timings):
+        token = _current.set(timings)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings(self.top_queries)
+        start = time.perf_counter()
+        with self._timed(timings):
+            response = self.get_response(request)
+        return self._report(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings(self.top_queries)
+        start = time.perf_counter()
+        with self._timed(timings):
+            response = await self.get_response(request)
+        return self._report(request, response, timings, time.perf_counter() - start)
+
+    def _report(self, request, response, timings, total):
+        if self.header:
+            response['Server-Timing'] = timings.server_timing(total)
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            **timings.as_dict(),
+        }
+        # As fields of the record: JSONFormatter writes ``extra`` at the top level
+        logger.info('request', extra=record)
+
+        if total >= self.slow_seconds and random.random() < self.sample_rate:
+            slow_logger.warning('slow request', extra=dict(record, slowest_queries=timings.slowest_queries()))
+        return response
@@ -0,0 +1,246 @@
+"""
+Non-blocking, structured logging.
+
+Request threads never write log files. ``QueuedHandler`` puts each record
+on a bounded in-memory queue and a ``QueueListener`` thread (one per worker
+process, started on first use so it survives gunicorn's fork) formats it
+as one JSON line and writes it to the console and a rotating file. When
+the queue is full the record is dropped and counted (``logging.dropped``)
+rather than waiting for the disk.
+
+* ``RequestIdMiddleware`` gives every request an ID (the incoming
+  ``X-Request-ID`` when it looks sane), returns it in the response and
+  stamps it on every record logged while the request runs.
+* ``SamplingFilter`` keeps only a fraction of the INFO and DEBUG records of
+  noisy loggers (per-request instrumentation lines); warnings and errors
+  always pass.
+* ``SizeAndTimeRotatingFileHandler`` rolls the file over when it reaches
+  max_bytes or when the interval has passed, whichever comes first.
+"""
+
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import registry
+
+_request_id = ContextVar('request_id', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming IDs are reused for correlation only when they look like one
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the running request's ID"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep ``rates[name]`` of the records below WARNING from logger ``name``
+    and its children (the most specific name wins); other loggers keep all.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, including any ``extra`` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'process': record.process,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that also rolls over every ``interval`` seconds"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, interval=0, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Stopping may wait for room; only records are dropped when full
+        self.queue.put(self._sentinel)
+
+
+class QueuedHandler(QueueHandler):
+    """
+    Hands records to a per-process listener thread that writes them out.
+
+    ``filename`` empty means console only. A ``{pid}`` in the filename
+    gives each worker process its own file, which keeps rotation safe when
+    several workers log to the same directory.
+    """
+
+    def __init__(self, filename='', max_bytes=50 * 1024 * 1024, backup_count=5, interval=24 * 60 * 60,
+                 console=True, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.interval = interval
+        self.console = console
+        self.queue_size = queue_size
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _targets(self):
+        formatter = JSONFormatter()
+        targets = []
+        if self.console:
+            targets.append(logging.StreamHandler(sys.stderr))
+        if self.filename:
+            filename = self.filename.format(pid=os.getpid())
+            os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+            targets.append(SizeAndTimeRotatingFileHandler(
+                filename, self.max_bytes, self.backup_count, self.interval
+            ))
+        for target in targets:
+            target.setFormatter(formatter)
+        return targets
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's listener thread is gone; start afresh
+            self.queue = queue.Queue(self.queue_size)
+            self.listener = _Listener(self.queue, *self._targets(), respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        """
+        Resolve the message and traceback here; JSON formatting is left to
+        the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            registry.incr('logging.dropped', logger=record.name)
+
+    def close(self):
+        """Flush what is queued (logging.shutdown calls this at exit)"""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+        super().close()
+
+
+class RequestIdMiddleware:
+    """Correlate a request's log records through an ``X-Request-ID``"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _request_id(self, request):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        request.request_id = incoming if VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        return request.request_id
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self._request_id(request)
+        token = _request_id.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self._request_id(request)
+        token = _request_id.set(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
@@ -0,0 +1,104 @@
+"""
+Lightweight in-process metrics registry.
+
+Background jobs and services record counters, gauges, timings and
+histograms here so they can be inspected without each one inventing its
+own bookkeeping. backend.prometheus merges the registries of all worker
+processes and serves them in Prometheus text format.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds (seconds) for latency histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class MetricsRegistry:
+    """Thread-safe store for counters, gauges and timing summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._histograms = {}
+
+    def incr(self, name, value=1, **labels):
+        """Increase a counter"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Record a single timing/size observation"""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._timings.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0, 'last': 0.0})
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+            summary['last'] = value
+
+    def histogram(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """Count an observation into cumulative ``le`` buckets"""
+        key = _key(name, labels)
+        with self._lock:
+            entry = self._histograms.setdefault(
+                key, {'buckets': list(buckets), 'counts': [0] * len(buckets), 'count': 0, 'sum': 0.0}
+            )
+            for i, bound in enumerate(entry['buckets']):
+                if value <= bound:
+                    entry['counts'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the wrapped block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Return a plain-dict copy of every metric"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': {key: dict(value) for key, value in self._timings.items()},
+                'histograms': {
+                    key: dict(value, counts=list(value['counts'])) for key, value in self._histograms.items()
+                },
+            }
+
+    def get(self, name, **labels):
+        """Return the current value of a counter or gauge (None if unset)"""
+        key = _key(name, labels)
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            return self._gauges.get(key)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
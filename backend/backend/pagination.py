@@ -0,0 +1,265 @@
+"""
+Keyset (cursor) pagination.
+
+Offset pagination makes the database walk and discard every row before the
+requested page, so deep pages get slower linearly, and PageNumberPagination
+adds a ``COUNT(*)`` per page on top. KeysetPagination orders by
+``(field, id)`` and continues from the last row of the previous page
+(``WHERE (field, id) < (last_value, last_id)``), which an index on
+``(field, id)`` answers directly at every depth. It never counts;
+PageOrCursorPagination lets a client ask for a cached or estimated total.
+"""
+
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .instrumentation import cache_lookup
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on (ordering field, id); newest first on timestamp by default"""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering_field = 'timestamp'
+    descending = True
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 20
+        requested = request.query_params.get(self.page_size_query_param)
+        if requested and requested.isdigit() and int(requested) > 0:
+            page_size = min(int(requested), self.max_page_size)
+        return page_size
+
+    def get_ordering(self, request, view):
+        """``(field, descending)`` the pages are ordered by (id breaks ties)"""
+        return self.ordering_field, self.descending
+
+    def encode_cursor(self, position, reverse=False):
+        value = position[0]
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif value is not None and not isinstance(value, (str, int, float)):
+            # UUID, Decimal, ...: decode_cursor reads them back with to_python()
+            value = str(value)
+        payload = {'v': value, 'i': str(position[1])}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request, model=None):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value, pk = payload['v'], payload['i']
+            if model is not None:
+                value = model._meta.get_field(self.field).to_python(value)
+                pk = model._meta.pk.to_python(pk)
+            return (value, pk), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+        if self.field == 'pk':
+            # An alias, not a field: get_field('pk') would raise
+            self.field = queryset.model._meta.pk.name
+        position, reverse = self.decode_cursor(request, queryset.model)
+        field = self.field
+        # Walking back from a cursor runs the ordering the other way round
+        descending = self.descending != reverse
+
+        if position is not None:
+            value, pk = position
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk}))
+
+        prefix = '-' if descending else ''
+        # One extra row tells us whether there is another page
+        rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}pk')[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def _position(self, row):
+        return getattr(row, self.field), row.pk
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self._position(self.last)))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self._position(self.first), reverse=True)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor from the next/previous link',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Rows per page (max {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class OrderingKeysetPagination(KeysetPagination):
+    """KeysetPagination on the view's ``?ordering=`` (one of ``ordering_fields``)"""
+
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def get_ordering(self, request, view):
+        allowed = getattr(view, 'ordering_fields', None) or []
+        requested = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if requested.lstrip('-') in allowed:
+            return requested.lstrip('-'), requested.startswith('-')
+        default = (getattr(view, 'ordering', None) or ['-pk'])[0]
+        return default.lstrip('-'), default.startswith('-')
+
+
+def cached_count(queryset, timeout=None):
+    """``queryset.count()``, cached per query for COUNT_CACHE_TIMEOUT seconds"""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    key = f'pagination-count:{digest}'
+    count = cache.get(key)
+    cache_lookup(count is not None)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout if timeout is not None else settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def estimated_count(queryset):
+    """
+    The planner's row estimate on PostgreSQL (no scan at all); None on
+    databases without one.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PageOrCursorPagination(PageNumberPagination):
+    """
+    Page numbers (with a total) by default. ``?pagination=cursor`` (and any
+    ``?cursor=``) switches to OrderingKeysetPagination, which has no total
+    unless ``?count=exact`` (cached) or ``?count=estimate`` is given.
+    """
+
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    cursor_class = OrderingKeysetPagination
+
+    def _cursor_mode(self, request):
+        params = request.query_params
+        return params.get(self.mode_query_param) == 'cursor' or self.cursor_class.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if not self._cursor_mode(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor = self.cursor_class()
+        self.count = None
+        self.count_is_estimate = False
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'estimate':
+            self.count = estimated_count(queryset)
+            self.count_is_estimate = self.count is not None
+        if mode in ('exact', 'estimate') and self.count is None:
+            self.count = cached_count(queryset)
+        return self.cursor.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        response = self.cursor.get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data['count_is_estimate'] = self.count_is_estimate
+        return response
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': '"cursor" for keyset pages (no total, stable at any depth)',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            *self.cursor_class().get_schema_operation_parameters(view)[:1],
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor mode only: include a cached ("exact") or planner ("estimate") total',
+                'schema': {'type': 'string', 'enum': ['exact', 'estimate']},
+            },
+        ]
@@ -0,0 +1,400 @@
+"""
+Prometheus export of backend.metrics, aggregated across worker processes.
+
+Each gunicorn worker records into its own in-process registry and, at
+most every PUBLISH_INTERVAL seconds (from MetricsMiddleware) and whenever
+it serves a scrape, shares it through Redis:
+
+* counters, timing summaries and histogram buckets are added to the
+  shared hash ``metrics:totals`` as the increase since the worker's last
+  publish (HINCRBYFLOAT). The totals outlive the workers that counted
+  them, so recycling a worker (gunicorn's max_requests) never makes an
+  exported counter go down;
+* gauges go to the hash ``metrics:workers`` (one field per host:pid) and
+  keep a ``worker`` label (queue depths, connection pool usage, requests
+  in flight); Prometheus can aggregate them with sum() or max(). A worker
+  removes its field when it exits (``retire``, from gunicorn's
+  worker_exit), and one that stops publishing drops out after WORKER_TTL.
+
+Cache hit ratios are computed from the merged hit/miss counters; apps can
+register ``collector`` functions for gauges read at scrape time (check-ins
+in the last minute are counted in the database this way).
+Without Redis, only the serving process's own registry is exported.
+
+``/metrics`` needs ``Authorization: Bearer <METRICS['TOKEN']>``; without a
+token it answers only in DEBUG or to addresses in METRICS['ALLOWED_IPS'].
+"""
+
+import hmac
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from . import db_pool
+from .bulk_writer import writers
+from .metrics import registry
+
+WORKERS_KEY = 'metrics:workers'
+TOTALS_KEY = 'metrics:totals'
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+# Per-worker gauges that are exported as a value computed from the merged counters instead
+DERIVED_GAUGES = {'response_cache.hit_ratio'}
+
+
+def _config(key, default):
+    return getattr(settings, 'METRICS', {}).get(key, default)
+
+
+def _redis():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def view_label(request):
+    """``ViewClass.action`` for DRF views (``TicketViewSet.verify``), else the function name"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    cls = getattr(func, 'cls', None)
+    if cls is None:
+        return getattr(func, '__name__', 'unknown')
+    actions = getattr(func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+
+
+def _record_worker_gauges():
+    for writer in list(writers):
+        registry.set_gauge('background_queue.depth', writer.depth, queue=writer.name)
+    db_pool.record_pool_stats()
+
+
+def _encode(snapshot):
+    """JSON-safe snapshot: label tuples become lists"""
+    return {
+        kind: [[name, [list(pair) for pair in labels], value] for (name, labels), value in metrics.items()]
+        for kind, metrics in snapshot.items()
+    }
+
+
+def _decode(data):
+    return {
+        kind: {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in metrics}
+        for kind, metrics in data.items()
+    }
+
+
+def _field(kind, name, labels, part=None):
+    return json.dumps([kind, name, [list(pair) for pair in labels], part])
+
+
+def _fields(snapshot):
+    """{TOTALS_KEY field: cumulative value} for the summed metrics of a snapshot"""
+    fields = {}
+    for (name, labels), value in snapshot['counters'].items():
+        fields[_field('counters', name, labels)] = value
+    for (name, labels), value in snapshot['timings'].items():
+        fields[_field('timings', name, labels, 'count')] = value['count']
+        fields[_field('timings', name, labels, 'sum')] = value['sum']
+    for (name, labels), value in snapshot['histograms'].items():
+        for bound, count in zip(value['buckets'], value['counts']):
+            fields[_field('histograms', name, labels, bound)] = count
+        fields[_field('histograms', name, labels, 'count')] = value['count']
+        fields[_field('histograms', name, labels, 'sum')] = value['sum']
+    return fields
+
+
+def _totals(entries):
+    """The TOTALS_KEY hash back as a snapshot (no gauges)"""
+    totals = {'counters': {}, 'timings': {}, 'histograms': {}}
+    histograms = {}
+    for field, value in entries.items():
+        kind, name, labels, part = json.loads(field)
+        key = (name, tuple(tuple(pair) for pair in labels))
+        value = float(value)
+        if value.is_integer() and part != 'sum':
+            value = int(value)
+        if kind == 'counters':
+            totals['counters'][key] = value
+        elif kind == 'timings':
+            totals['timings'].setdefault(key, {'count': 0, 'sum': 0.0})[part] = value
+        else:
+            histograms.setdefault(key, {})[part] = value
+    for key, parts in histograms.items():
+        count, total = parts.pop('count', 0), parts.pop('sum', 0.0)
+        buckets = sorted(parts)
+        totals['histograms'][key] = {
+            'buckets': buckets, 'counts': [parts[bound] for bound in buckets], 'count': count, 'sum': total,
+        }
+    return totals
+
+
+_last_publish = 0.0
+_publish_lock = threading.Lock()
+# TOTALS_KEY fields as this worker last added them
+_published = {}
+
+
+def publish_due():
+    return time.time() - _last_publish >= _config('PUBLISH_INTERVAL', 5)
+
+
+def publish(force=False):
+    """Share this worker's metrics (at most every PUBLISH_INTERVAL seconds unless forced)"""
+    global _last_publish
+    now = time.time()
+    if not force and not publish_due():
+        return
+    _last_publish = now
+    client = _redis()
+    if client is None:
+        return
+    _record_worker_gauges()
+    snapshot = registry.snapshot()
+    with _publish_lock:
+        fields = _fields(snapshot)
+        pipe = client.pipeline()
+        for field, value in fields.items():
+            previous = _published.get(field, 0)
+            # Below what was published: the registry was reset, so all of it is new
+            delta = value - previous if value >= previous else value
+            # Zeros too the first time, so every histogram has all its buckets
+            if delta or field not in _published:
+                pipe.hincrbyfloat(TOTALS_KEY, field, delta)
+        gauges = _encode({'gauges': snapshot['gauges']})['gauges']
+        pipe.hset(WORKERS_KEY, WORKER_ID, json.dumps({'at': now, 'gauges': gauges}))
+        try:
+            pipe.execute()
+        except Exception:
+            registry.incr('metrics.publish_errors')
+            return
+        _published.update(fields)
+
+
+def retire():
+    """Publish what is left and drop this worker's gauges (gunicorn worker_exit)"""
+    client = _redis()
+    if client is None:
+        return
+    publish(force=True)
+    try:
+        client.hdel(WORKERS_KEY, WORKER_ID)
+    except Exception:
+        registry.incr('metrics.publish_errors')
+
+
+def _worker_snapshots():
+    """{worker id: gauges} of every live worker plus the shared totals; just this one without Redis"""
+    _record_worker_gauges()
+    local = {WORKER_ID: registry.snapshot()}
+    client = _redis()
+    if client is None:
+        return local
+    try:
+        publish(force=True)
+        totals = client.hgetall(TOTALS_KEY)
+        entries = client.hgetall(WORKERS_KEY)
+    except Exception:
+        registry.incr('metrics.publish_errors')
+        return local
+
+    # The shared totals carry no gauges, so need no worker id
+    snapshots, stale = {'': _totals(totals)}, []
+    cutoff = time.time() - _config('WORKER_TTL', 300)
+    for worker, payload in entries.items():
+        worker = worker.decode() if isinstance(worker, bytes) else worker
+        data = json.loads(payload)
+        if data['at'] < cutoff:
+            stale.append(worker)
+            continue
+        snapshots[worker] = _decode({'gauges': data.get('gauges', [])})
+    if stale:
+        client.hdel(WORKERS_KEY, *stale)
+    snapshots[WORKER_ID] = {'gauges': local[WORKER_ID]['gauges']}
+    return snapshots
+
+
+def merge(snapshots):
+    """One snapshot from many workers' (see module docstring for how)"""
+    merged = {'counters': {}, 'gauges': {}, 'timings': {}, 'histograms': {}}
+    for worker, snapshot in snapshots.items():
+        for key, value in snapshot.get('counters', {}).items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for (name, labels), value in snapshot.get('gauges', {}).items():
+            if name not in DERIVED_GAUGES:
+                merged['gauges'][(name, tuple(sorted(labels + (('worker', worker),))))] = value
+        for key, value in snapshot.get('timings', {}).items():
+            total = merged['timings'].setdefault(key, {'count': 0, 'sum': 0.0})
+            total['count'] += value['count']
+            total['sum'] += value['sum']
+        for key, value in snapshot.get('histograms', {}).items():
+            total = merged['histograms'].get(key)
+            if total is None or total['buckets'] != value['buckets']:
+                merged['histograms'][key] = dict(value, counts=list(value['counts']))
+                continue
+            total['counts'] = [a + b for a, b in zip(total['counts'], value['counts'])]
+            total['count'] += value['count']
+            total['sum'] += value['sum']
+    return merged
+
+
+# Functions returning {(name, labels): value} gauges computed at scrape
+# time, e.g. from the database, so every worker's activity counts once
+collectors = []
+
+
+def collector(func):
+    """Register a scrape-time gauge collector"""
+    collectors.append(func)
+    return func
+
+
+def _derived(merged):
+    """Gauges computed from the merged data and the registered collectors"""
+    gauges = {}
+    requests = {}
+    for (name, labels), value in merged['counters'].items():
+        if name == 'response_cache.requests':
+            labels = dict(labels)
+            requests.setdefault(labels['endpoint'], {})[labels['result']] = value
+    for endpoint, results in requests.items():
+        total = results.get('hit', 0) + results.get('miss', 0)
+        if total:
+            gauges[('response_cache.hit_ratio', (('endpoint', endpoint),))] = results.get('hit', 0) / total
+
+    for func in collectors:
+        gauges.update(func())
+    return gauges
+
+
+def _name(name):
+    return re.sub(r'[^a-zA-Z0-9_:]', '_', name)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{_name(key)}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _group(metrics):
+    grouped = {}
+    for (name, labels), value in sorted(metrics.items(), key=lambda item: (item[0][0], item[0][1])):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+
+def render(merged):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name, series in _group(merged['counters']).items():
+        metric = _name(name) if name.endswith('_total') else f'{_name(name)}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines += [f'{metric}{_labels(labels)} {value}' for labels, value in series]
+    for name, series in _group(merged['gauges']).items():
+        lines.append(f'# TYPE {_name(name)} gauge')
+        lines += [f'{_name(name)}{_labels(labels)} {value}' for labels, value in series]
+    for name, series in _group(merged['timings']).items():
+        lines.append(f'# TYPE {_name(name)} summary')
+        for labels, value in series:
+            lines.append(f'{_name(name)}_sum{_labels(labels)} {value["sum"]}')
+            lines.append(f'{_name(name)}_count{_labels(labels)} {value["count"]}')
+    for name, series in _group(merged['histograms']).items():
+        lines.append(f'# TYPE {_name(name)} histogram')
+        for labels, value in series:
+            for bound, count in zip(value['buckets'], value['counts']):
+                lines.append(f'{_name(name)}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{_name(name)}_bucket{_labels(labels, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f'{_name(name)}_sum{_labels(labels)} {value["sum"]}')
+            lines.append(f'{_name(name)}_count{_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    """The merged snapshot of every live worker, with the derived gauges"""
+    merged = merge(_worker_snapshots())
+    merged['gauges'].update(_derived(merged))
+    return merged
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Needs ``Authorization: Bearer <METRICS['TOKEN']>``
+    when a token is set; without one, only DEBUG/test runs and the
+    addresses in METRICS['ALLOWED_IPS'] may scrape.
+    """
+    token = _config('TOKEN', '')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not (settings.DEBUG or getattr(settings, 'TESTING', False)
+              or request.META.get('REMOTE_ADDR') in _config('ALLOWED_IPS', ())):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """Request latency histograms per view/action, request counts and requests in flight"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _config('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _track(self, delta):
+        with self._lock:
+            self._in_flight += delta
+            registry.set_gauge('http.requests_in_flight', self._in_flight)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._track(1)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._track(-1)
+        self._record(request, response, time.perf_counter() - start)
+        publish()
+        return response
+
+    async def __acall__(self, request):
+        self._track(1)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._track(-1)
+        self._record(request, response, time.perf_counter() - start)
+        if publish_due():
+            # Publishing talks to Redis synchronously
+            await sync_to_async(publish)()
+        return response
+
+    def _record(self, request, response, elapsed):
+        view = view_label(request)
+        registry.histogram('http.request.duration_seconds', elapsed, view=view, method=request.method)
+        registry.incr('http.requests', view=view, status=f'{response.status_code // 100}xx')
@@ -0,0 +1,219 @@
+"""
+Read-replica routing for heavy read-only work.
+
+Nothing goes to the replica unless asked: views decorated with
+``read_from_replica`` (dashboards, exports, audit log browsing) and jobs
+inside ``replica_reads()`` have their reads sent to REPLICA['ALIAS'];
+every write, and every read elsewhere, stays on ``default``.
+
+Reads fall back to ``default``
+
+* when no replica database is configured or REPLICA['ENABLED'] is off;
+* when the replica is more than MAX_LAG_SECONDS behind (checked at most
+  every LAG_CHECK_INTERVAL seconds per process) or can't be reached;
+* once the current request (or ``replica_reads`` block) has written
+  anything, so a transaction sees its own writes;
+* for STICKY_SECONDS after a user's request wrote something, so people
+  see their own changes (``ReplicaMiddleware`` pins them in the cache).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .metrics import registry
+
+# Set inside read_from_replica / replica_reads: {'routed': bool}
+_reading = ContextVar('replica_reading', default=None)
+# Set for each request by ReplicaMiddleware: {'wrote': bool}
+_writes = ContextVar('replica_writes', default=None)
+
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _config(key, default):
+    return getattr(settings, 'REPLICA', {}).get(key, default)
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+_lag = {'checked': 0.0, 'seconds': None}
+_lag_lock = threading.Lock()
+
+
+def measure_lag(alias):
+    """Seconds the replica is behind (0 for databases that don't replicate)"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def replica_lag(alias):
+    """The last measured lag, re-measured every LAG_CHECK_INTERVAL; None when unreachable"""
+    now = time.monotonic()
+    if now - _lag['checked'] < _config('LAG_CHECK_INTERVAL', 5):
+        return _lag['seconds']
+    with _lag_lock:
+        if now - _lag['checked'] >= _config('LAG_CHECK_INTERVAL', 5):
+            try:
+                _lag['seconds'] = measure_lag(alias)
+                registry.set_gauge('db.replica_lag_seconds', _lag['seconds'])
+            except DatabaseError:
+                _lag['seconds'] = None
+                registry.incr('db.replica_errors')
+            _lag['checked'] = now
+    return _lag['seconds']
+
+
+def reset_lag():
+    with _lag_lock:
+        _lag.update(checked=0.0, seconds=None)
+
+
+def replica_alias():
+    """The replica alias when it is configured, enabled and caught up enough, else None"""
+    alias = _config('ALIAS', 'replica')
+    if not _config('ENABLED', False) or alias not in settings.DATABASES:
+        return None
+    lag = replica_lag(alias)
+    if lag is None or lag > _config('MAX_LAG_SECONDS', 10):
+        return None
+    return alias
+
+
+def pin_to_primary(user_id):
+    """Send the user's replica-eligible reads to ``default`` for STICKY_SECONDS"""
+    cache.set(_pin_key(user_id), 1, _config('STICKY_SECONDS', 15))
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def replica_reads():
+    """Send the block's reads to the replica (when it is usable); yields the routing state"""
+    state = {'routed': False}
+    token = _reading.set(state)
+    # Jobs have no ReplicaMiddleware; track the block's own writes
+    writes_token = _writes.set({'wrote': False}) if _writes.get() is None else None
+    try:
+        yield state
+    finally:
+        if writes_token is not None:
+            _writes.reset(writes_token)
+        _reading.reset(token)
+
+
+def read_from_replica(method):
+    """
+    Run a view method (``(view, request, ...)``) with its reads on the
+    replica, unless the user has just written something.
+
+    The response is marked ``read_from_replica`` so the response cache can
+    keep it only briefly (it may be up to MAX_LAG_SECONDS old).
+    """
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and is_pinned(user.pk):
+            registry.incr('db.replica_requests', target='primary', reason='sticky')
+            return method(view, request, *args, **kwargs)
+        with replica_reads() as state:
+            response = method(view, request, *args, **kwargs)
+        response.read_from_replica = state['routed']
+        registry.incr('db.replica_requests', target='replica' if state['routed'] else 'primary', reason='routed')
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    """Routes reads inside ``replica_reads`` to the replica; all writes to ``default``"""
+
+    def db_for_read(self, model, **hints):
+        state = _reading.get()
+        if state is None:
+            return None
+        writes = _writes.get()
+        if writes and writes['wrote']:
+            return DEFAULT_DB_ALIAS
+        alias = replica_alias()
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        state['routed'] = True
+        return alias
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        # Never the instance's own database: rows read from the replica are saved to default
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        same_data = {DEFAULT_DB_ALIAS, _config('ALIAS', 'replica')}
+        if obj1._state.db in same_data and obj2._state.db in same_data:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """Pins users whose request wrote to the database to ``default`` for a while"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _config('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pin_writer(self, request):
+        # DRF sets the authenticated user on the underlying request too
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = {'wrote': False}
+        token = _writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes['wrote']:
+            self._pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        writes = {'wrote': False}
+        token = _writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _writes.reset(token)
+        if writes['wrote']:
+            # request.user may be a lazy session lookup; pinning uses the sync cache
+            await sync_to_async(self._pin_writer)(request)
+        return response
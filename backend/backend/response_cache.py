@@ -0,0 +1,177 @@
+"""
+Versioned response cache for read endpoints.
+
+A cached response is keyed by the endpoint, who is asking (admins share
+one entry, coordinators one per province, anyone else one per user), the
+normalized query string and the current version of the scope the response
+reads from: ``province:<name>`` for a coordinator, ``all`` for everyone
+else. A ticket write bumps the version of its province and of ``all``
+(``invalidate_provinces``); that is one INCR per scope however many entries
+exist, and the orphaned entries simply expire.
+
+The version is read before the response is built, and writes bump it both
+when they happen and again once their transaction commits, so a response
+built from rows a write is replacing is never served after the writing
+request has returned.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .instrumentation import cache_lookup
+from .metrics import registry
+
+ALL = 'all'
+
+
+def _config(key, default):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(key, default)
+
+
+def province_scope(province):
+    return f'province:{province}'
+
+
+def _version_key(scope):
+    return f'response-cache:version:{scope}'
+
+
+def _incr(scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Start from the clock so a version lost to eviction never
+            # comes back to a value older entries were stored under
+            cache.add(key, time.time_ns(), None)
+
+
+def bump(*scopes):
+    """Invalidate every cached response built on ``scopes``"""
+    scopes = set(scopes)
+    _incr(scopes)
+    if transaction.get_connection().in_atomic_block:
+        # Responses built while the transaction was open saw the old rows
+        transaction.on_commit(lambda: _incr(scopes))
+
+
+def invalidate_provinces(*provinces):
+    bump(ALL, *(province_scope(province) for province in provinces if province))
+
+
+def invalidate_queryset(queryset, province_field='province'):
+    """For writes that bypass save(), e.g. ``queryset.update()``"""
+    invalidate_provinces(*queryset.order_by().values_list(province_field, flat=True).distinct())
+
+
+def version(scope):
+    """Current version of ``scope`` (None when the cache is unreachable)"""
+    key = _version_key(scope)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, time.time_ns(), None)
+        current = cache.get(key)
+    return current
+
+
+def _principal(user, per_user):
+    """(identity part of the key, scope the response reads)"""
+    role = getattr(user, 'role', None)
+    if role == user.Role.ADMIN:
+        return 'admin', ALL
+    if role == user.Role.COORDINATOR:
+        identity = f'coordinator:{user.province}'
+        return (f'{identity}:{user.pk}' if per_user else identity), province_scope(user.province)
+    return f'user:{user.pk}', ALL
+
+
+def _params(request):
+    """Query string with blank values dropped and keys/values sorted"""
+    items = sorted(
+        (name, sorted(value for value in values if value != ''))
+        for name, values in request.query_params.lists()
+    )
+    return repr([(name, values) for name, values in items if values])
+
+
+def timeout():
+    return _config('TIMEOUT', 300)
+
+
+def _response_timeout(response):
+    # A replica may not have the writes that bumped the version yet, so
+    # don't keep what it returned for longer than it may lag behind
+    if getattr(response, 'read_from_replica', False):
+        return min(timeout(), getattr(settings, 'REPLICA', {}).get('MAX_LAG_SECONDS', 10))
+    return timeout()
+
+
+def scope_key(name, user, per_user=False):
+    """
+    Key prefix for ``name`` as seen by ``user`` at its scope's current
+    version; None when caching is off or can't be used.
+    """
+    if not _config('ENABLED', True) or not user.is_authenticated:
+        return None
+    identity, scope = _principal(user, per_user)
+    current = version(scope)
+    if current is None:
+        return None
+    return f'response-cache:{name}:{identity}:{scope}:{current}'
+
+
+def response_key(name, request, per_user=False, vary=None):
+    """Cache key for ``request`` to endpoint ``name``; None if it can't be cached"""
+    prefix = scope_key(name, request.user, per_user)
+    if prefix is None:
+        return None
+    extra = vary(request) if vary else ''
+    digest = hashlib.sha1(
+        f'{request.get_host()}{request.path}:{_params(request)}:{extra}'.encode()
+    ).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def _record(name, result):
+    cache_lookup(result == 'hit')
+    registry.incr('response_cache.requests', endpoint=name, result=result)
+    hits = registry.get('response_cache.requests', endpoint=name, result='hit') or 0
+    misses = registry.get('response_cache.requests', endpoint=name, result='miss') or 0
+    registry.set_gauge('response_cache.hit_ratio', hits / (hits + misses), endpoint=name)
+
+
+def cached_response(name, per_user=False, vary=None):
+    """
+    Serve a view method's successful responses from the cache.
+
+    ``per_user`` keeps coordinators' entries apart for views that also show
+    the user's own activity; ``vary(request)`` adds anything else the
+    response depends on (e.g. today's date).
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = response_key(name, request, per_user, vary)
+            if key is None:
+                return method(view, request, *args, **kwargs)
+
+            data = cache.get(key)
+            if data is not None:
+                _record(name, 'hit')
+                return Response(data, headers={'X-Cache': 'HIT'})
+
+            _record(name, 'miss')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, _response_timeout(response))
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -10,15 +10,20 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
-import os, dj_database_url
+import os, sys
 from datetime import timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
+from backend import db_pool
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv()
 
+# True while running `manage.py test`
+TESTING = 'test' in sys.argv[1:2]
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
@@ -58,7 +63,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.log_pipeline.RequestIdMiddleware',
+    'backend.instrumentation.InstrumentationMiddleware',
+    'backend.prometheus.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'backend.audit_buffer.AuditBufferMiddleware',
+    'backend.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,9 +85,24 @@ CACHES = {
         'LOCATION': os.getenv('REDIS_URL', default='redis://localhost:6379/0'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # The cache only speeds reads up; an unreachable Redis means a miss, not a 500
+            'IGNORE_EXCEPTIONS': True,
         }
     }
 }
+if TESTING:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Seconds a cached ticket timeline page may outlive a change that fired no signal
+TICKET_TIMELINE_CACHE_TIMEOUT = int(os.getenv('TICKET_TIMELINE_CACHE_TIMEOUT', 300))
+# Seconds a list total asked for with ?count=exact is reused (backend.pagination)
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+# Versioned cache for ticket lists and dashboards (see backend.response_cache);
+# off in tests, whose rolled-back databases would share one cache
+RESPONSE_CACHE = {
+    'ENABLED': not TESTING and os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300)),
+}
 
 
 ROOT_URLCONF = 'backend.urls'
@@ -104,12 +129,23 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Persistent, health-checked connections, or with DB_POOL=True a psycopg 3
+# pool per gunicorn worker sized from GUNICORN_WORKERS/GUNICORN_THREADS
+# (see backend.db_pool; pooling needs `pip install "psycopg[binary,pool]"`)
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_POOL = None
+if os.getenv('DB_POOL', 'False') == 'True':
+    DB_POOL = db_pool.pool_options(
+        *db_pool.gunicorn_concurrency(),
+        max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 100)),
+        reserved=int(os.getenv('DB_RESERVED_CONNECTIONS', 10)),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    )
+
 DATABASE_URL=os.getenv("DATABASE_URL")
 if(DATABASE_URL):
     DATABASES = {
-        'default': dj_database_url.config(
-            default=DATABASE_URL
-        )
+        'default': db_pool.database_config(DATABASE_URL, DB_CONN_MAX_AGE, DB_POOL)
     }
 else:
     DATABASES = {
@@ -119,6 +155,30 @@ else:
         }
     }
 
+# Read replica for dashboards, exports and audit log browsing (see
+# backend.replicas). Tests get a second SQLite database to route to.
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = db_pool.database_config(DATABASE_REPLICA_URL, DB_CONN_MAX_AGE, DB_POOL)
+elif TESTING:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+    }
+
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+
+# Replica reads fall back to default when the replica is more than
+# MAX_LAG_SECONDS behind; users who just wrote read from default for
+# STICKY_SECONDS.
+REPLICA = {
+    'ENABLED': not TESTING and os.getenv('REPLICA_ENABLED', 'True') == 'True',
+    'ALIAS': 'replica',
+    'MAX_LAG_SECONDS': float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10)),
+    'LAG_CHECK_INTERVAL': float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 5)),
+    'STICKY_SECONDS': int(os.getenv('REPLICA_STICKY_SECONDS', 15)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -178,7 +238,7 @@ class UUIDEncoder(json.JSONEncoder):
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -209,6 +269,7 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
+    # Blacklisted in the cache by users.token_store, not the token_blacklist app
     'BLACKLIST_AFTER_ROTATION': True,
     'UPDATE_LAST_LOGIN': True,
     'ALGORITHM': 'HS256',
@@ -217,6 +278,53 @@ SIMPLE_JWT = {
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
 }
+# Seconds a user row loaded for token authentication is reused
+# (users.authentication); saving or deleting the user drops it sooner
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 60))
+
+# Per-request timings (see backend.instrumentation): a JSON log line per
+# request, Server-Timing headers when HEADER is on, and a sampled log of
+# requests slower than SLOW_REQUEST_MS with their TOP_QUERIES slowest queries
+INSTRUMENTATION = {
+    'ENABLED': not TESTING and os.getenv('INSTRUMENTATION_ENABLED', 'True') == 'True',
+    'HEADER': os.getenv('INSTRUMENTATION_HEADER', str(DEBUG)) == 'True',
+    'SLOW_REQUEST_MS': float(os.getenv('INSTRUMENTATION_SLOW_REQUEST_MS', 500)),
+    'SLOW_SAMPLE_RATE': float(os.getenv('INSTRUMENTATION_SLOW_SAMPLE_RATE', 1.0)),
+    'TOP_QUERIES': int(os.getenv('INSTRUMENTATION_TOP_QUERIES', 5)),
+}
+
+# Prometheus metrics (backend.prometheus): request latency histograms per
+# view, shared between workers through Redis every PUBLISH_INTERVAL seconds.
+# /metrics requires ``Authorization: Bearer <TOKEN>`` when TOKEN is set, and
+# otherwise answers only in DEBUG or to ALLOWED_IPS.
+METRICS = {
+    'ENABLED': not TESTING and os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'PUBLISH_INTERVAL': float(os.getenv('METRICS_PUBLISH_INTERVAL', 5)),
+    'WORKER_TTL': float(os.getenv('METRICS_WORKER_TTL', 300)),
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+    # Without a TOKEN, the only addresses allowed to scrape (outside DEBUG)
+    'ALLOWED_IPS': [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()],
+}
+
+# Bulk user provisioning (users.provisioning): processes that hash the
+# generated passwords, and the Fernet key the API encrypts credentials with
+PROVISIONING_HASH_WORKERS = int(os.getenv('PROVISIONING_HASH_WORKERS', os.cpu_count() or 1))
+PROVISIONING_CREDENTIALS_KEY = os.getenv('PROVISIONING_CREDENTIALS_KEY', '')
+
+# Login attempts allowed per client IP and per username (see
+# backend.token_bucket): a burst of CAPACITY, then PER_MINUTE. Off in tests,
+# which would otherwise share buckets across test cases. The IP bucket is
+# keyed on REMOTE_ADDR, or with TRUSTED_PROXIES > 0 on the X-Forwarded-For
+# entry the outermost of that many proxies appended (client-sent entries to
+# its left are ignored); gate check-ins record the same address.
+LOGIN_RATE_LIMIT = {
+    'ENABLED': not TESTING and os.getenv('LOGIN_RATE_LIMIT_ENABLED', 'True') == 'True',
+    'IP_CAPACITY': int(os.getenv('LOGIN_RATE_LIMIT_IP_CAPACITY', 20)),
+    'IP_PER_MINUTE': float(os.getenv('LOGIN_RATE_LIMIT_IP_PER_MINUTE', 10)),
+    'USERNAME_CAPACITY': int(os.getenv('LOGIN_RATE_LIMIT_USERNAME_CAPACITY', 5)),
+    'USERNAME_PER_MINUTE': float(os.getenv('LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE', 2)),
+    'TRUSTED_PROXIES': int(os.getenv('LOGIN_RATE_LIMIT_TRUSTED_PROXIES', 0)),
+}
 
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
@@ -235,22 +343,93 @@ FRONTEND_URL = os.getenv("FRONTEND_URL")
 PAYSTACK_SECRET_KEY=os.getenv("PAYSTACK_SECRET_KEY")
 PAYSTACK_PUBLIC_KEY=os.getenv("PAYSTACK_PUBLIC_KEY")
 FRONTEND_URL=os.getenv("FRONTEND_URL")
+# Point at the local stand-in (`manage.py run_fake_paystack`) for development and benchmarks
+PAYSTACK_BASE_URL = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co')
+PAYSTACK_TIMEOUT = float(os.getenv('PAYSTACK_TIMEOUT', 30))
+PAYSTACK_STUB = {
+    'HOST': os.getenv('PAYSTACK_STUB_HOST', '127.0.0.1'),
+    'PORT': int(os.getenv('PAYSTACK_STUB_PORT', 8765)),
+    'LATENCY_MS': float(os.getenv('PAYSTACK_STUB_LATENCY_MS', 0)),
+    'JITTER_MS': float(os.getenv('PAYSTACK_STUB_JITTER_MS', 0)),
+    'FAILURE_RATE': float(os.getenv('PAYSTACK_STUB_FAILURE_RATE', 0)),
+    'WEBHOOK_URL': os.getenv('PAYSTACK_STUB_WEBHOOK_URL'),
+}
+
+# Ticket pricing (see payments.pricing) - used when no payment plan applies
+DEFAULT_TICKET_PRICE = os.getenv('DEFAULT_TICKET_PRICE', '3000.00')
+PAYMENT_PLAN_CACHE_TTL = int(os.getenv('PAYMENT_PLAN_CACHE_TTL', 60))
+
+# Stale pending payment sweeper (see payments.services.PendingPaymentSweeper)
+PAYMENT_SWEEPER = {
+    'STALE_AFTER_MINUTES': int(os.getenv('PAYMENT_SWEEPER_STALE_AFTER_MINUTES', 30)),
+    'ABANDON_AFTER_HOURS': int(os.getenv('PAYMENT_SWEEPER_ABANDON_AFTER_HOURS', 24)),
+    'BATCH_SIZE': int(os.getenv('PAYMENT_SWEEPER_BATCH_SIZE', 100)),
+    'CONCURRENCY': int(os.getenv('PAYMENT_SWEEPER_CONCURRENCY', 8)),
+}
+
+# Gateway transaction logs (see payments.transaction_logs) - written in
+# batches off the request path; tests write them inline
+TRANSACTION_LOG_WRITER = {
+    'ASYNC': not TESTING and os.getenv('TRANSACTION_LOG_ASYNC', 'True') == 'True',
+    'BATCH_SIZE': int(os.getenv('TRANSACTION_LOG_BATCH_SIZE', 200)),
+    'FLUSH_INTERVAL': float(os.getenv('TRANSACTION_LOG_FLUSH_INTERVAL', 1.0)),
+    'MAX_QUEUE': int(os.getenv('TRANSACTION_LOG_MAX_QUEUE', 10000)),
+}
+TRANSACTION_LOG_RETENTION_DAYS = int(os.getenv('TRANSACTION_LOG_RETENTION_DAYS', 90))
+TRANSACTION_LOG_ARCHIVE_DIR = os.getenv('TRANSACTION_LOG_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'transaction_logs'))
+
+# Audit rows (see backend.audit_buffer) - bulk-inserted per request/job or on
+# commit; non-critical rows such as login history go to a background writer
+AUDIT_BUFFER = {
+    'BATCH_SIZE': int(os.getenv('AUDIT_BUFFER_BATCH_SIZE', 500)),
+    'FLUSH_INTERVAL': float(os.getenv('AUDIT_BUFFER_FLUSH_INTERVAL', 1.0)),
+    'BACKGROUND': not TESTING and os.getenv('AUDIT_BUFFER_BACKGROUND', 'True') == 'True',
+}
+
+# Cold storage for audit/login/transaction logs (see backend.archive) - rows
+# older than RETENTION_DAYS move to <DIR>/<table>/YYYY-MM-DD.jsonl.gz
+AUDIT_ARCHIVE = {
+    'DIR': os.getenv('AUDIT_ARCHIVE_DIR', str(BASE_DIR / 'archive')),
+    'RETENTION_DAYS': int(os.getenv('AUDIT_ARCHIVE_RETENTION_DAYS', 365)),
+}
 
 # Logging
+# Logging goes through a bounded queue to a listener thread (see
+# backend.log_pipeline), so requests never wait on the disk: JSON lines on
+# stderr and in LOG_FILE, rotated at LOG_MAX_BYTES or every
+# LOG_ROTATE_SECONDS. LOG_FILE needs its {pid}: each worker rotates its own
+# file, and workers sharing one would rename it from under each other and
+# lose lines. LOG_SAMPLING keeps that fraction of a logger's INFO/DEBUG records.
+LOG_FILE = os.getenv('LOG_FILE', '' if TESTING else str(BASE_DIR / 'logs' / 'app-{pid}.log'))
+LOG_SAMPLING = {
+    'backend.instrumentation': float(os.getenv('LOG_SAMPLE_REQUESTS', 0.1)),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
+    'filters': {
+        'request_id': {
+            '()': 'backend.log_pipeline.RequestIdFilter',
         },
-        'file': {
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
+        'sampling': {
+            '()': 'backend.log_pipeline.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'backend.log_pipeline.QueuedHandler',
+            'filters': ['request_id', 'sampling'],
+            'filename': LOG_FILE,
+            'max_bytes': int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024)),
+            'backup_count': int(os.getenv('LOG_BACKUP_COUNT', 5)),
+            'interval': int(os.getenv('LOG_ROTATE_SECONDS', 24 * 60 * 60)),
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['queue'],
         'level': 'INFO',
     },
 }
@@ -19,6 +19,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include
 from django.http import JsonResponse
+from backend.prometheus import metrics_view
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
 def health(request):
@@ -32,6 +33,7 @@ urlpatterns = [
     # Health check - put this FIRST to avoid conflicts
     path('health/', health, name='health'),
     path('health', health, name='health-root'),  # Add this for root-level access
+    path('metrics', metrics_view, name='metrics'),
     
     # Admin
     path('admin/', admin.site.urls),
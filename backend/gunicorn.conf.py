@@ -0,0 +1,59 @@
+"""
+Gunicorn settings, read automatically when started from this directory:
+    gunicorn backend.wsgi
+
+To serve the async scan endpoints (tickets.scan) without tying up a thread
+per waiting request, run the ASGI application under uvicorn workers:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn backend.asgi
+The rest of the API works unchanged under either; its sync views run in
+a thread per request. GUNICORN_THREADS only applies to gthread workers.
+Django runs each ASGI request's database work on a thread of its own, so
+persistent connections are not reused there: use DB_POOL on PostgreSQL
+(or DB_CONN_MAX_AGE=0).
+
+Set the worker and thread counts with GUNICORN_WORKERS (or WEB_CONCURRENCY)
+and GUNICORN_THREADS, not with --workers/--threads: the Django settings
+size each worker's database pool from the same variables
+(backend.db_pool.gunicorn_concurrency).
+"""
+
+import os
+
+from backend.db_pool import gunicorn_concurrency
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers, threads = gunicorn_concurrency()
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+accesslog = '-'
+
+
+def _close_connections():
+    from django.apps import apps
+    if not apps.ready:
+        return
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+
+
+def pre_fork(server, worker):
+    # With --preload the master may have connected while loading the app;
+    # a worker must not share its socket or pool threads
+    _close_connections()
+
+
+def worker_exit(server, worker):
+    from django.apps import apps
+    if apps.ready:
+        # Hand over the last counts before the worker's metrics go away
+        from backend import prometheus
+        prometheus.retire()
+    _close_connections()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment, PaymentPlan, TransactionLog
+from .models import Payment, PaymentPlan, PaymentRollup, TransactionLog
 
 
 @admin.register(Payment)
@@ -28,7 +28,7 @@ class PaymentAdmin(admin.ModelAdmin):
 
 @admin.register(PaymentPlan)
 class PaymentPlanAdmin(admin.ModelAdmin):
-    list_display = ('name', 'plan_type', 'amount', 'is_active', 'valid_from', 'valid_to', 'usage_count')
+    list_display = ('name', 'plan_type', 'amount', 'min_quantity', 'is_active', 'valid_from', 'valid_to', 'usage_count')
     list_filter = ('plan_type', 'is_active', 'ticket_category')
     search_fields = ('name', 'description')
     readonly_fields = ('usage_count', 'created_at', 'updated_at')
@@ -40,4 +40,11 @@ class TransactionLogAdmin(admin.ModelAdmin):
     list_filter = ('transaction_type', 'is_successful', 'timestamp')
     search_fields = ('payment__reference', 'error_message')
     readonly_fields = ('timestamp',)
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    date_hierarchy = 'timestamp'
+
+
+@admin.register(PaymentRollup)
+class PaymentRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'granularity', 'province', 'payment_method', 'successful_payments', 'failed_payments', 'revenue')
+    list_filter = ('granularity', 'province', 'payment_method')
+    date_hierarchy = 'bucket'
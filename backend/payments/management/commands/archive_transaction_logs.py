@@ -0,0 +1,34 @@
+"""
+Django management command to move old transaction logs into compressed files
+Usage: python manage.py archive_transaction_logs [--older-than-days 90] [--output-dir PATH]
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.transaction_logs import archive_logs
+
+
+class Command(BaseCommand):
+    help = 'Archives transaction logs older than the retention period into per-day gzipped JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.TRANSACTION_LOG_RETENTION_DAYS,
+            help='Archive logs older than this many days'
+        )
+        parser.add_argument(
+            '--output-dir', default=settings.TRANSACTION_LOG_ARCHIVE_DIR,
+            help='Directory for the YYYY-MM-DD.jsonl.gz files'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['older_than_days'])
+        count = archive_logs(before, options['output_dir'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {count} transaction logs older than {before:%Y-%m-%d %H:%M} to {options['output_dir']}"
+        ))
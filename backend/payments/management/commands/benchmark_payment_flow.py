@@ -0,0 +1,164 @@
+"""
+Django management command to benchmark the payment flow end-to-end
+Usage: python manage.py benchmark_payment_flow [--iterations 50] [--bulk-size 10] [--latency-ms 150]
+
+Starts the fake Paystack in-process, then drives single and bulk payments
+through PaymentViewSet: initialize -> checkout -> callback -> verify ->
+webhook. Every row it creates is rolled back unless --keep-data is given.
+"""
+
+import json
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from backend.benchmarking import StepRecorder, format_table
+from payments import transaction_logs
+from payments.paystack_stub import FakePaystack, start_in_thread
+from tickets.models import Ticket
+from users.models import User
+
+
+class StepFailed(Exception):
+    pass
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks single and bulk payments through the API against a local fake Paystack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Payments of each kind')
+        parser.add_argument('--bulk-size', type=int, default=10, help='Tickets per bulk payment')
+        parser.add_argument('--latency-ms', type=float, default=0)
+        parser.add_argument('--jitter-ms', type=float, default=0)
+        parser.add_argument('--failure-rate', type=float, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--keep-data', action='store_true', help='Commit the generated rows')
+
+    def handle(self, *args, **options):
+        secret_key = 'sk_test_benchmark'
+        stub = FakePaystack(
+            secret_key,
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            failure_rate=options['failure_rate'],
+            seed=1,
+        )
+        server = start_in_thread(stub)
+        recorder = StepRecorder()
+        # Logs must be written on this connection so they roll back with the run
+        async_writes = transaction_logs.writer.async_writes
+        transaction_logs.writer.async_writes = False
+
+        try:
+            with override_settings(
+                PAYSTACK_BASE_URL=stub.base_url,
+                PAYSTACK_SECRET_KEY=secret_key,
+                PAYSTACK_PUBLIC_KEY='pk_test_benchmark',
+                FRONTEND_URL=getattr(settings, 'FRONTEND_URL', None) or 'http://localhost:5173',
+            ):
+                try:
+                    with transaction.atomic():
+                        self._run(stub, recorder, options)
+                        if not options['keep_data']:
+                            raise _Rollback
+                except _Rollback:
+                    pass
+        finally:
+            transaction_logs.writer.async_writes = async_writes
+            server.shutdown()
+            server.server_close()
+
+        rows = recorder.summary()
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        else:
+            self.stdout.write(format_table(rows))
+            self.stdout.write(f"\nGateway calls: {stub.request_counts}")
+
+    def _run(self, stub, recorder, options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            username=f'bench_{run_id}',
+            email=f'bench_{run_id}@example.com',
+            password=uuid.uuid4().hex,
+            first_name='Bench',
+            last_name='Coordinator',
+            role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_9,
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        for i in range(options['iterations']):
+            tickets = self._tickets(user, f'{run_id}-{i}', 1 + options['bulk_size'])
+            for kind, payload in (
+                ('single', {'ticket_id': str(tickets[0].id)}),
+                ('bulk', {'ticket_ids': [str(ticket.id) for ticket in tickets[1:]]}),
+            ):
+                try:
+                    self._flow(client, stub, recorder, kind, payload)
+                except StepFailed:
+                    continue
+
+    def _tickets(self, user, label, count):
+        return Ticket.objects.bulk_create([
+            Ticket(
+                ticket_id=f'TKT-B{label}-{n}'[:20],
+                full_name=f'Bench Teen {n}',
+                age=15,
+                category=Ticket.Category.TEENS,
+                gender=Ticket.Gender.MALE,
+                phone='+2348012345679',
+                province=user.province,
+                zone='Zone A',
+                area='Area 1',
+                parish='Parish',
+                emergency_contact='Parent',
+                emergency_phone='+2348023456789',
+                emergency_relationship='Father',
+                parent_name='Parent',
+                parent_email='parent@example.com',
+                parent_phone='+2348023456789',
+                parent_relationship='Father',
+                registered_by=user,
+            )
+            for n in range(count)
+        ])
+
+    def _call(self, recorder, step, request, expected=200):
+        with recorder.step(step):
+            response = request()
+            if response.status_code != expected:
+                raise StepFailed(f'{step}: HTTP {response.status_code}')
+        return response
+
+    def _flow(self, client, stub, recorder, kind, payload):
+        response = self._call(recorder, f'{kind}.initialize', lambda: client.post(
+            '/api/payments/payments/initialize/', payload, format='json'
+        ))
+        reference = response.data['reference']
+        authorization_url = response.data['authorization_url']
+
+        self._call(recorder, f'{kind}.checkout', lambda: requests.get(authorization_url, timeout=30))
+        self._call(recorder, f'{kind}.callback', lambda: client.get(
+            '/api/payments/callback/', {'reference': reference}
+        ))
+        self._call(recorder, f'{kind}.verify', lambda: client.post(
+            '/api/payments/payments/verify/', {'reference': reference}, format='json'
+        ))
+
+        body, signature = stub.webhook(reference)
+        self._call(recorder, f'{kind}.webhook', lambda: client.post(
+            '/api/payments/webhook', body, content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature,
+        ))
@@ -0,0 +1,18 @@
+"""
+Django management command to recompute payment dashboard rollups
+Usage: python manage.py rebuild_payment_rollups
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from payments.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the hourly/daily payment revenue rollups from completed payments'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {count} completed payments'))
@@ -0,0 +1,54 @@
+"""
+Django management command to serve the local Paystack stand-in
+Usage: python manage.py run_fake_paystack [--port 8765] [--latency-ms 150] [--failure-rate 0.05]
+
+Then set PAYSTACK_BASE_URL=http://127.0.0.1:8765 for the backend.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.paystack_stub import FakePaystack, serve
+
+
+class Command(BaseCommand):
+    help = 'Runs a local fake Paystack API with configurable latency and failure injection'
+
+    def add_arguments(self, parser):
+        stub = settings.PAYSTACK_STUB
+        parser.add_argument('--host', default=stub['HOST'])
+        parser.add_argument('--port', type=int, default=stub['PORT'])
+        parser.add_argument('--latency-ms', type=float, default=stub['LATENCY_MS'],
+                            help='Fixed delay added to every response')
+        parser.add_argument('--jitter-ms', type=float, default=stub['JITTER_MS'],
+                            help='Random extra delay (0..jitter) per response')
+        parser.add_argument('--failure-rate', type=float, default=stub['FAILURE_RATE'],
+                            help='Fraction of API calls answered with HTTP 500')
+        parser.add_argument('--fail-endpoint', action='append', dest='fail_endpoints',
+                            choices=['initialize', 'verify', 'list', 'refund'],
+                            help='Limit failure injection to these endpoints (repeatable)')
+        parser.add_argument('--webhook-url', default=stub['WEBHOOK_URL'],
+                            help='Where to POST signed charge.success webhooks after checkout')
+
+    def handle(self, *args, **options):
+        secret_key = settings.PAYSTACK_SECRET_KEY or 'sk_test_fake'
+        app = FakePaystack(
+            secret_key,
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            failure_rate=options['failure_rate'],
+            fail_endpoints=options['fail_endpoints'],
+            webhook_url=options['webhook_url'],
+        )
+        server = serve(app, options['host'], options['port'], quiet=False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake Paystack listening on {app.base_url} '
+            f"(latency {options['latency_ms']}ms +{options['jitter_ms']}ms, "
+            f"failure rate {options['failure_rate']:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,45 @@
+"""
+Django management command to re-verify or expire stale pending payments
+Usage: python manage.py sweep_pending_payments [--loop --interval 300]
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from backend import prometheus
+from payments.services import PendingPaymentSweeper
+
+
+class Command(BaseCommand):
+    help = 'Re-verifies stale pending payments with Paystack and expires abandoned ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int, help='Only sweep payments pending for at least this long')
+        parser.add_argument('--abandon-hours', type=int, help='Fail unfinished payments older than this')
+        parser.add_argument('--batch-size', type=int, help='Payments verified per page')
+        parser.add_argument('--concurrency', type=int, help='Parallel Paystack verifications')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        sweeper = PendingPaymentSweeper(
+            stale_after=timedelta(minutes=options['stale_minutes']) if options['stale_minutes'] else None,
+            abandon_after=timedelta(hours=options['abandon_hours']) if options['abandon_hours'] else None,
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+        )
+
+        while True:
+            result = sweeper.sweep()
+            # Make this process's counters visible to /metrics
+            prometheus.publish(force=True)
+            self.stdout.write(self.style.SUCCESS(
+                f"Checked {result['checked']} payments: {result['approved']} approved, "
+                f"{result['failed']} failed, {result['still_pending']} still pending, "
+                f"{result['errors']} errors ({result['duration']:.2f}s, backlog {result['backlog']})"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
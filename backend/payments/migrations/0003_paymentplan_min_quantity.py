@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_alter_paymentplan_ticket_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentplan',
+            name='min_quantity',
+            field=models.PositiveIntegerField(default=1, help_text='Minimum number of tickets in a payment for this plan to apply (e.g. group discounts)'),
+        ),
+    ]
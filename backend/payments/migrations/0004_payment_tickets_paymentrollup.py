@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+def link_payment_tickets(apps, schema_editor):
+    """Populate Payment.tickets from the ticket FK and bulk payment metadata"""
+    Payment = apps.get_model('payments', 'Payment')
+    Ticket = apps.get_model('tickets', 'Ticket')
+    Link = Payment.tickets.through
+
+    links = []
+    for payment in Payment.objects.all().iterator():
+        ticket_ids = []
+        if payment.ticket_id:
+            ticket_ids.append(payment.ticket_id)
+        elif payment.metadata and payment.metadata.get('is_bulk'):
+            ticket_ids.extend(payment.metadata.get('ticket_ids', []))
+        existing = Ticket.objects.filter(id__in=ticket_ids).values_list('id', flat=True)
+        links.extend(Link(payment_id=payment.id, ticket_id=ticket_id) for ticket_id in existing)
+    Link.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_paymentplan_min_quantity'),
+        ('tickets', '0006_alter_ticket_proof_of_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='tickets',
+            field=models.ManyToManyField(blank=True, related_name='covering_payments', to='tickets.ticket'),
+        ),
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('province', models.CharField(blank=True, max_length=255)),
+                ('successful_payments', models.IntegerField(default=0)),
+                ('failed_payments', models.IntegerField(default=0)),
+                ('tickets_paid', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'province'), name='unique_payment_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(link_payment_tickets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payment_tickets_paymentrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionlog',
+            index=models.Index(fields=['payment', 'timestamp'], name='txlog_payment_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionlog',
+            index=models.Index(fields=['transaction_type', 'timestamp'], name='txlog_type_time_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_transactionlog_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='paymentrollup',
+            name='unique_payment_rollup_bucket',
+        ),
+        migrations.AddField(
+            model_name='paymentrollup',
+            name='payment_method',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'bucket', 'province', 'payment_method'), name='unique_payment_rollup_bucket'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 from django.utils import timezone
 import uuid
 from users.models import User
@@ -44,6 +46,12 @@ class Payment(models.Model):
         blank=True,
         related_name='payments'
     )
+    # Every ticket covered by the payment (single and bulk)
+    tickets = models.ManyToManyField(
+        Ticket,
+        blank=True,
+        related_name='covering_payments'
+    )
     description = models.TextField()
     
     # Payer information
@@ -92,6 +100,7 @@ class Payment(models.Model):
     
     def mark_as_successful(self, paystack_data):
         """Mark payment as successful with Paystack data"""
+        previous_status, previous_completed_at = self.status, self.completed_at
         self.status = self.Status.SUCCESS
         self.completed_at = timezone.now()
         self.paystack_response = paystack_data
@@ -100,14 +109,27 @@ class Payment(models.Model):
         self.channel = paystack_data.get('channel', '')
         self.payment_method = paystack_data.get('authorization', {}).get('channel', '')
         self.save()
+        self._record_outcome(previous_status, previous_completed_at)
     
     def mark_as_failed(self, paystack_data=None):
-        """Mark payment as failed"""
+        """Mark payment as failed, giving back the plan usage it reserved"""
+        from .pricing import release_reserved
+
+        previous_status, previous_completed_at = self.status, self.completed_at
         self.status = self.Status.FAILED
         self.completed_at = timezone.now()
         if paystack_data:
             self.paystack_response = paystack_data
-        self.save()
+        with transaction.atomic():
+            self.save()
+            if previous_status == self.Status.PENDING:
+                release_reserved([self])
+            self._record_outcome(previous_status, previous_completed_at)
+    
+    def _record_outcome(self, previous_status, previous_completed_at):
+        """Keep revenue rollups in step with terminal state changes"""
+        from .rollups import record_transition
+        record_transition(self, previous_status, previous_completed_at)
 
 
 class PaymentPlan(models.Model):
@@ -142,6 +164,10 @@ class PaymentPlan(models.Model):
     )
     
     # Limits
+    min_quantity = models.PositiveIntegerField(
+        default=1,
+        help_text="Minimum number of tickets in a payment for this plan to apply (e.g. group discounts)"
+    )
     max_usage = models.IntegerField(default=0, help_text="0 = unlimited")
     usage_count = models.IntegerField(default=0, editable=False)
     
@@ -165,13 +191,38 @@ class PaymentPlan(models.Model):
         now = timezone.now()
         return self.is_active and self.valid_from <= now <= self.valid_to
     
-    def increment_usage(self):
-        """Increment usage count"""
-        if self.max_usage == 0 or self.usage_count < self.max_usage:
-            self.usage_count += 1
-            self.save()
-            return True
-        return False
+    @property
+    def is_exhausted(self):
+        return self.max_usage > 0 and self.usage_count >= self.max_usage
+    
+    def applies_to(self, category, quantity=1, now=None):
+        """Check if plan can price a ticket of this category in a cart of this size"""
+        now = now or timezone.now()
+        return (
+            self.is_active
+            and self.valid_from <= now <= self.valid_to
+            and self.ticket_category in ('', category)
+            and quantity >= self.min_quantity
+            and not self.is_exhausted
+        )
+    
+    def increment_usage(self, quantity=1):
+        """
+        Atomically consume usage. Returns False if it would exceed max_usage.
+        """
+        updated = PaymentPlan.objects.filter(pk=self.pk).filter(
+            Q(max_usage=0) | Q(usage_count__lte=F('max_usage') - quantity)
+        ).update(usage_count=F('usage_count') + quantity)
+        if updated:
+            self.refresh_from_db(fields=['usage_count'])
+        return bool(updated)
+    
+    def release_usage(self, quantity=1):
+        """Give back usage consumed by a payment that never went through"""
+        PaymentPlan.objects.filter(pk=self.pk).update(
+            usage_count=Greatest(F('usage_count') - quantity, 0)
+        )
+        self.refresh_from_db(fields=['usage_count'])
 
 
 class TransactionLog(models.Model):
@@ -208,6 +259,41 @@ class TransactionLog(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['payment', 'timestamp'], name='txlog_payment_time_idx'),
+            models.Index(fields=['transaction_type', 'timestamp'], name='txlog_type_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_transaction_type_display()} - {self.timestamp}"
+
+
+class PaymentRollup(models.Model):
+    """Pre-aggregated payment outcomes per time bucket and province"""
+    
+    class Granularity(models.TextChoices):
+        HOUR = 'hour', 'Hourly'
+        DAY = 'day', 'Daily'
+    
+    granularity = models.CharField(max_length=10, choices=Granularity.choices)
+    bucket = models.DateTimeField()
+    province = models.CharField(max_length=255, blank=True)
+    # Set on successful payments only
+    payment_method = models.CharField(max_length=20, blank=True)
+    
+    successful_payments = models.IntegerField(default=0)
+    failed_payments = models.IntegerField(default=0)
+    tickets_paid = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'province', 'payment_method'],
+                name='unique_payment_rollup_bucket'
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.get_transaction_type_display()} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.province or 'unassigned'}"
@@ -0,0 +1,263 @@
+"""
+Local stand-in for the Paystack API.
+
+FakePaystack is a small WSGI app implementing the endpoints PaystackService
+uses (initialize, verify, list, refund) plus a checkout page that completes
+a transaction and delivers a signed ``charge.success`` webhook. Latency and
+failures can be injected so the payment flow can be benchmarked and
+load-tested without touching api.paystack.co.
+
+Point the backend at it with ``PAYSTACK_BASE_URL`` (see the
+run_fake_paystack command).
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+from django.utils import timezone
+
+
+def sign_payload(body, secret_key):
+    """Paystack webhook signature: HMAC-SHA512 of the raw body"""
+    return hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+
+
+class FakePaystack:
+    """In-memory Paystack API with latency and failure injection"""
+
+    ROUTES = [
+        ('POST', re.compile(r'^/transaction/initialize/?$'), 'initialize'),
+        ('GET', re.compile(r'^/transaction/verify/(?P<reference>[^/]+)/?$'), 'verify'),
+        ('GET', re.compile(r'^/transaction/?$'), 'list'),
+        ('POST', re.compile(r'^/refund/?$'), 'refund'),
+        ('GET', re.compile(r'^/checkout/(?P<access_code>[^/]+)/?$'), 'checkout'),
+    ]
+
+    def __init__(self, secret_key, base_url='http://127.0.0.1:8765', latency_ms=0, jitter_ms=0,
+                 failure_rate=0.0, fail_endpoints=None, webhook_url=None, seed=None):
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip('/')
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        # Endpoint names failure injection applies to (None = all)
+        self.fail_endpoints = set(fail_endpoints) if fail_endpoints else None
+        self.webhook_url = webhook_url
+        self.transactions = {}
+        self.access_codes = {}
+        self.request_counts = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._next_id = 1
+
+    # -- WSGI ---------------------------------------------------------------
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '')
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return self._respond(start_response, 404, {'status': False, 'message': 'Not found'})
+
+        with self._lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+        self._sleep()
+
+        # Checkout is the customer's browser, not an API call: no auth, no injected failures
+        if name != 'checkout' and not self._authorized(environ):
+            return self._respond(start_response, 401, {'status': False, 'message': 'Invalid key'})
+        if name != 'checkout' and self._should_fail(name):
+            return self._respond(start_response, 500, {'status': False, 'message': 'Injected failure'})
+
+        try:
+            body = self._read_json(environ) if method == 'POST' else {}
+        except ValueError:
+            return self._respond(start_response, 400, {'status': False, 'message': 'Invalid JSON'})
+        query = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+        status_code, payload = getattr(self, f'handle_{name}')(body, query, **match.groupdict())
+        return self._respond(start_response, status_code, payload)
+
+    def _sleep(self):
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += self._random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+    def _authorized(self, environ):
+        return environ.get('HTTP_AUTHORIZATION') == f'Bearer {self.secret_key}'
+
+    def _should_fail(self, name):
+        if not self.failure_rate:
+            return False
+        if self.fail_endpoints is not None and name not in self.fail_endpoints:
+            return False
+        return self._random.random() < self.failure_rate
+
+    def _read_json(self, environ):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        raw = environ['wsgi.input'].read(length) if length else b''
+        return json.loads(raw or b'{}')
+
+    def _respond(self, start_response, status_code, payload):
+        body = json.dumps(payload).encode()
+        reason = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 500: 'Internal Server Error'}
+        start_response(f'{status_code} {reason.get(status_code, "")}', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+    # -- Endpoints ----------------------------------------------------------
+
+    def handle_initialize(self, body, query):
+        if not body.get('email') or not body.get('amount'):
+            return 400, {'status': False, 'message': 'email and amount are required'}
+
+        reference = body.get('reference') or uuid.uuid4().hex[:12]
+        with self._lock:
+            if reference in self.transactions:
+                return 400, {'status': False, 'message': 'Duplicate Transaction Reference'}
+            access_code = uuid.uuid4().hex[:15]
+            self.transactions[reference] = {
+                'id': self._next_id,
+                'reference': reference,
+                'amount': int(body['amount']),
+                'currency': body.get('currency', 'NGN'),
+                'email': body['email'],
+                'metadata': body.get('metadata') or {},
+                'callback_url': body.get('callback_url', ''),
+                'status': 'abandoned',
+                'gateway_response': 'The transaction was not completed',
+                'paid_at': None,
+                'created_at': timezone.now().isoformat(),
+            }
+            self.access_codes[access_code] = reference
+            self._next_id += 1
+
+        return 200, {
+            'status': True,
+            'message': 'Authorization URL created',
+            'data': {
+                'authorization_url': f'{self.base_url}/checkout/{access_code}',
+                'access_code': access_code,
+                'reference': reference,
+            }
+        }
+
+    def handle_verify(self, body, query, reference):
+        transaction = self.transactions.get(reference)
+        if transaction is None:
+            return 400, {'status': False, 'message': 'Transaction reference not found'}
+        return 200, {'status': True, 'message': 'Verification successful', 'data': self._data(transaction)}
+
+    def handle_list(self, body, query):
+        per_page = int(query.get('perPage', 50))
+        page = int(query.get('page', 1))
+        transactions = sorted(self.transactions.values(), key=lambda t: t['id'], reverse=True)
+        chunk = transactions[(page - 1) * per_page:page * per_page]
+        return 200, {
+            'status': True,
+            'message': 'Transactions retrieved',
+            'data': [self._data(transaction) for transaction in chunk],
+            'meta': {'total': len(transactions), 'perPage': per_page, 'page': page},
+        }
+
+    def handle_refund(self, body, query):
+        transaction = self.transactions.get(str(body.get('transaction')))
+        if transaction is None or transaction['status'] != 'success':
+            return 400, {'status': False, 'message': 'Transaction has not been completed'}
+        amount = int(body.get('amount') or transaction['amount'])
+        transaction['status'] = 'reversed'
+        return 200, {
+            'status': True,
+            'message': 'Refund has been queued for processing',
+            'data': {'transaction': self._data(transaction), 'amount': amount, 'status': 'pending'},
+        }
+
+    def handle_checkout(self, body, query, access_code):
+        """Simulate the customer paying (``?outcome=failed`` to decline)"""
+        reference = self.access_codes.get(access_code)
+        if reference is None:
+            return 404, {'status': False, 'message': 'Unknown access code'}
+        transaction = self.complete(reference, query.get('outcome', 'success'))
+        if self.webhook_url and transaction['status'] == 'success':
+            threading.Thread(target=self.deliver_webhook, args=(reference,), daemon=True).start()
+        return 200, {
+            'status': True,
+            'message': 'Checkout complete',
+            'data': {
+                'reference': reference,
+                'status': transaction['status'],
+                'callback_url': f"{transaction['callback_url']}?reference={reference}&trxref={reference}",
+            }
+        }
+
+    # -- Helpers ------------------------------------------------------------
+
+    def _data(self, transaction):
+        data = {key: value for key, value in transaction.items() if key != 'callback_url'}
+        data['customer'] = {'email': transaction['email']}
+        data['channel'] = 'card'
+        data['authorization'] = {'authorization_code': f"AUTH_{transaction['id']}", 'channel': 'card'}
+        return data
+
+    def complete(self, reference, outcome='success'):
+        """Mark a transaction paid (or failed) as if checkout finished"""
+        transaction = self.transactions[reference]
+        transaction['status'] = 'success' if outcome == 'success' else 'failed'
+        transaction['gateway_response'] = 'Successful' if outcome == 'success' else 'Declined'
+        transaction['paid_at'] = timezone.now().isoformat() if outcome == 'success' else None
+        return transaction
+
+    def webhook(self, reference, event='charge.success'):
+        """Return the raw body and signature Paystack would POST"""
+        body = json.dumps({'event': event, 'data': self._data(self.transactions[reference])}).encode()
+        return body, sign_payload(body, self.secret_key)
+
+    def deliver_webhook(self, reference, event='charge.success'):
+        body, signature = self.webhook(reference, event)
+        try:
+            requests.post(self.webhook_url, data=body, timeout=10, headers={
+                'Content-Type': 'application/json',
+                'X-Paystack-Signature': signature,
+            })
+        except requests.RequestException:
+            pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def serve(app, host='127.0.0.1', port=8765, quiet=True):
+    """Create a threaded WSGI server for ``app`` (port 0 picks a free port)"""
+    handler = _QuietHandler if quiet else WSGIRequestHandler
+    server = make_server(host, port, app, server_class=_ThreadingWSGIServer, handler_class=handler)
+    app.base_url = f'http://{host}:{server.server_port}'
+    return server
+
+
+def start_in_thread(app, host='127.0.0.1', port=0):
+    """Serve ``app`` from a daemon thread; returns the server (call shutdown())"""
+    server = serve(app, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-paystack', daemon=True).start()
+    return server
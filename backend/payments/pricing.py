@@ -0,0 +1,214 @@
+"""
+Ticket pricing built on PaymentPlan.
+
+Active plans are kept in an in-process cache that is dropped whenever a
+plan is saved or deleted (see payments.signals) and otherwise refreshed
+every PAYMENT_PLAN_CACHE_TTL seconds, so other workers pick up changes too.
+"""
+
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import PaymentPlan
+
+
+class PricingError(Exception):
+    """Raised when a cart cannot be priced"""
+
+
+class PlanCache:
+    """In-process cache of active payment plans"""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._plans = None
+        self._loaded_at = 0.0
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'PAYMENT_PLAN_CACHE_TTL', 60)
+
+    def get_plans(self):
+        """Return active plans ordered by amount, loading them if needed"""
+        plans = self._plans
+        if plans is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return plans
+
+        with self._lock:
+            if self._plans is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._plans = list(PaymentPlan.objects.filter(is_active=True).order_by('amount'))
+                self._loaded_at = time.monotonic()
+            return self._plans
+
+    def invalidate(self):
+        with self._lock:
+            self._plans = None
+
+
+plan_cache = PlanCache()
+
+
+class PriceLine:
+    """Price of a single ticket in a cart"""
+
+    def __init__(self, ticket, plan, amount):
+        self.ticket = ticket
+        self.plan = plan
+        self.amount = amount
+
+    def as_metadata(self):
+        return {
+            'ticket_id': str(self.ticket.id),
+            'category': self.ticket.category,
+            'plan_id': str(self.plan.id) if self.plan else None,
+            'plan_name': self.plan.name if self.plan else None,
+            'amount': str(self.amount),
+        }
+
+
+class Quote:
+    """Priced cart of tickets"""
+
+    def __init__(self, lines, currency='NGN'):
+        self.lines = lines
+        self.currency = currency
+
+    @property
+    def total(self):
+        return sum((line.amount for line in self.lines), Decimal('0.00'))
+
+    @property
+    def plan_usage(self):
+        """Number of tickets priced by each plan"""
+        return Counter(line.plan for line in self.lines if line.plan is not None)
+
+    def as_metadata(self):
+        return {
+            'total': str(self.total),
+            'currency': self.currency,
+            'lines': [line.as_metadata() for line in self.lines],
+        }
+
+
+class PricingEngine:
+    """Resolve PaymentPlans for tickets and price whole carts"""
+
+    # Plans that are only used when explicitly requested
+    OPT_IN_PLAN_TYPES = {PaymentPlan.PlanType.VIP}
+
+    def __init__(self, cache=None):
+        self.cache = cache or plan_cache
+
+    @property
+    def default_price(self):
+        return Decimal(str(getattr(settings, 'DEFAULT_TICKET_PRICE', '3000.00')))
+
+    def resolve_plan(self, category, quantity=1, plan_id=None, now=None, exclude=()):
+        """
+        Return the plan to charge for one ticket of ``category`` in a cart
+        of ``quantity`` tickets, or None to charge the default price.
+        """
+        now = now or timezone.now()
+        candidates = [
+            plan for plan in self.cache.get_plans()
+            if plan.id not in exclude and plan.applies_to(category, quantity, now)
+        ]
+
+        if plan_id:
+            for plan in candidates:
+                if str(plan.id) == str(plan_id):
+                    return plan
+            raise PricingError(f"Payment plan {plan_id} is not available for {category} tickets")
+
+        candidates = [plan for plan in candidates if plan.plan_type not in self.OPT_IN_PLAN_TYPES]
+        # Plans are cached in amount order: the first match is the best price,
+        # preferring a category-specific plan over a catch-all one on ties.
+        best = None
+        for plan in candidates:
+            if best is None:
+                best = plan
+            elif plan.amount == best.amount and plan.ticket_category and not best.ticket_category:
+                best = plan
+            elif plan.amount > best.amount:
+                break
+        return best
+
+    def price_cart(self, tickets, plan_id=None, exclude=()):
+        """Price every ticket in one pass over the cached plans"""
+        tickets = list(tickets)
+        if not tickets:
+            raise PricingError("Cannot price an empty cart")
+
+        now = timezone.now()
+        quantity = len(tickets)
+        resolved = {}
+        lines = []
+        for ticket in tickets:
+            if ticket.category not in resolved:
+                resolved[ticket.category] = self.resolve_plan(
+                    ticket.category, quantity, plan_id=plan_id, now=now, exclude=exclude
+                )
+            plan = resolved[ticket.category]
+            lines.append(PriceLine(ticket, plan, plan.amount if plan else self.default_price))
+        return Quote(lines)
+
+    def reserve(self, tickets, plan_id=None):
+        """
+        Price the cart and consume plan usage atomically.
+
+        If a capped plan runs out between pricing and reserving it is
+        excluded and the cart is re-priced.
+        """
+        exclude = set()
+        while True:
+            quote = self.price_cart(tickets, plan_id=plan_id, exclude=exclude)
+            consumed = []
+            exhausted = None
+            for plan, count in quote.plan_usage.items():
+                if plan.increment_usage(count):
+                    consumed.append((plan, count))
+                else:
+                    exhausted = plan
+                    break
+
+            if exhausted is None:
+                return quote
+
+            for plan, count in consumed:
+                plan.release_usage(count)
+            self.cache.invalidate()
+            if plan_id:
+                raise PricingError(f"Payment plan {exhausted.name} has reached its usage limit")
+            exclude.add(exhausted.id)
+
+    def release(self, quote):
+        """Return the usage consumed by ``reserve``"""
+        for plan, count in quote.plan_usage.items():
+            plan.release_usage(count)
+
+
+def release_reserved(payments):
+    """
+    Give back the plan usage reserved for pending payments that will never
+    be paid, from the quote stored in ``metadata['pricing']``.
+    """
+    usage = Counter()
+    for payment in payments:
+        for line in ((payment.metadata or {}).get('pricing') or {}).get('lines', []):
+            if line.get('plan_id'):
+                usage[line['plan_id']] += 1
+    for plan_id, count in usage.items():
+        PaymentPlan.objects.filter(pk=plan_id).update(usage_count=Greatest(F('usage_count') - count, 0))
+    if usage:
+        # Cached copies may think a capped plan is exhausted
+        plan_cache.invalidate()
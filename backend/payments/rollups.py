@@ -0,0 +1,217 @@
+"""
+Revenue rollups for the payment dashboard.
+
+PaymentRollup rows are adjusted whenever a payment enters or leaves a
+terminal state, so totals, trend, payment method and per-province figures
+are read from a handful of pre-aggregated rows instead of scanning every
+payment. Buckets follow local (settings.TIME_ZONE) hours and days.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Payment, PaymentRollup
+from tickets.models import Ticket
+
+COUNTED_STATUSES = {Payment.Status.SUCCESS, Payment.Status.FAILED}
+CENT = Decimal('0.01')
+
+
+def bucket_start(at, granularity):
+    """Truncate a timestamp to the start of its local hour/day bucket"""
+    at = timezone.localtime(at)
+    if granularity == PaymentRollup.Granularity.HOUR:
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def province_shares(payments):
+    """
+    Map payment id -> [(province, ticket_count), ...] using the
+    payment -> ticket linkage, falling back to the ticket FK / bulk
+    metadata for payments created before the link existed.
+    """
+    shares = defaultdict(list)
+    ids = [payment.id for payment in payments]
+    links = Payment.tickets.through.objects.filter(payment_id__in=ids).values(
+        'payment_id', 'ticket__province'
+    ).annotate(count=Count('ticket_id'))
+    for row in links:
+        shares[row['payment_id']].append((row['ticket__province'], row['count']))
+
+    unlinked = {}
+    for payment in payments:
+        if payment.id in shares:
+            continue
+        if payment.ticket_id:
+            unlinked[payment.id] = [payment.ticket_id]
+        elif payment.metadata and payment.metadata.get('is_bulk'):
+            unlinked[payment.id] = payment.metadata.get('ticket_ids', [])
+
+    ticket_ids = {ticket_id for values in unlinked.values() for ticket_id in values}
+    if ticket_ids:
+        provinces = dict(Ticket.objects.filter(id__in=ticket_ids).values_list('id', 'province'))
+        provinces = {str(key): value for key, value in provinces.items()}
+        for payment_id, values in unlinked.items():
+            counts = defaultdict(int)
+            for ticket_id in values:
+                if str(ticket_id) in provinces:
+                    counts[provinces[str(ticket_id)]] += 1
+            shares[payment_id] = list(counts.items())
+
+    return {payment.id: shares.get(payment.id) or [('', 0)] for payment in payments}
+
+
+def _contributions(payment, status, shares):
+    """Per-province deltas for one payment in one terminal status"""
+    total_tickets = sum(count for _, count in shares)
+    primary = max(shares, key=lambda share: share[1])[0]
+    allocated = Decimal('0.00')
+    rows = []
+
+    for index, (province, count) in enumerate(shares):
+        if index == len(shares) - 1:
+            revenue = payment.amount - allocated
+        elif total_tickets:
+            revenue = (payment.amount * count / total_tickets).quantize(CENT)
+        else:
+            revenue = payment.amount
+        allocated += revenue
+
+        deltas = {}
+        if province == primary:
+            if status == Payment.Status.SUCCESS:
+                deltas['successful_payments'] = 1
+            else:
+                deltas['failed_payments'] = 1
+        if status == Payment.Status.SUCCESS:
+            deltas['tickets_paid'] = count
+            deltas['revenue'] = revenue
+        if deltas:
+            rows.append((province, deltas))
+    return rows
+
+
+def _apply(payment, status, at, sign, shares):
+    method = (payment.payment_method or '') if status == Payment.Status.SUCCESS else ''
+    for province, deltas in _contributions(payment, status, shares):
+        for granularity in PaymentRollup.Granularity.values:
+            row, _ = PaymentRollup.objects.get_or_create(
+                granularity=granularity,
+                bucket=bucket_start(at, granularity),
+                province=province or '',
+                payment_method=method,
+            )
+            PaymentRollup.objects.filter(pk=row.pk).update(**{
+                field: F(field) + sign * value for field, value in deltas.items()
+            })
+
+
+def record_transition(payment, previous_status, previous_completed_at):
+    """Move a payment's contribution when its status changes"""
+    if previous_status == payment.status:
+        return
+    counted_before = previous_status in COUNTED_STATUSES and previous_completed_at
+    counted_after = payment.status in COUNTED_STATUSES and payment.completed_at
+    if not counted_before and not counted_after:
+        return
+
+    shares = province_shares([payment])[payment.id]
+    if counted_before:
+        _apply(payment, previous_status, previous_completed_at, -1, shares)
+    if counted_after:
+        _apply(payment, payment.status, payment.completed_at, 1, shares)
+
+
+def record_failures(payments, at):
+    """Record payments that were failed in bulk (they were PENDING before)"""
+    shares = province_shares(payments)
+    for payment in payments:
+        _apply(payment, Payment.Status.FAILED, at, 1, shares[payment.id])
+
+
+def rebuild(chunk_size=500):
+    """Recompute every rollup row from terminal payments"""
+    PaymentRollup.objects.all().delete()
+    queryset = Payment.objects.filter(
+        status__in=COUNTED_STATUSES, completed_at__isnull=False
+    ).order_by('completed_at')
+
+    chunk = []
+    count = 0
+    for payment in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(payment)
+        if len(chunk) >= chunk_size:
+            count += _rebuild_chunk(chunk)
+            chunk = []
+    if chunk:
+        count += _rebuild_chunk(chunk)
+    return count
+
+
+def _rebuild_chunk(payments):
+    shares = province_shares(payments)
+    for payment in payments:
+        _apply(payment, payment.status, payment.completed_at, 1, shares[payment.id])
+    return len(payments)
+
+
+def payment_methods():
+    """Successful payments and revenue per payment method, largest first"""
+    rows = PaymentRollup.objects.filter(
+        granularity=PaymentRollup.Granularity.DAY, successful_payments__gt=0
+    ).values('payment_method').annotate(
+        count=Sum('successful_payments'),
+        total=Sum('revenue'),
+    ).order_by('-total')
+    return [dict(row, payment_method=row['payment_method'] or None) for row in rows]
+
+
+def revenue_series(granularity, since):
+    """Revenue, outcomes and success rate per bucket since ``since``"""
+    rows = PaymentRollup.objects.filter(
+        granularity=granularity, bucket__gte=bucket_start(since, granularity)
+    ).values('bucket').annotate(
+        successful=Sum('successful_payments'),
+        failed=Sum('failed_payments'),
+        tickets=Sum('tickets_paid'),
+        total_revenue=Sum('revenue'),
+    ).order_by('bucket')
+
+    series = []
+    for row in rows:
+        completed = row['successful'] + row['failed']
+        series.append({
+            'bucket': row['bucket'],
+            'successful_payments': row['successful'],
+            'failed_payments': row['failed'],
+            'tickets_paid': row['tickets'],
+            'revenue': float(row['total_revenue'] or 0),
+            'success_rate': (row['successful'] / completed * 100) if completed else 0,
+        })
+    return series
+
+
+def province_revenue():
+    """All-time revenue split by the province of the tickets paid for"""
+    rows = PaymentRollup.objects.filter(
+        granularity=PaymentRollup.Granularity.DAY
+    ).values('province').annotate(
+        successful=Sum('successful_payments'),
+        tickets=Sum('tickets_paid'),
+        total_revenue=Sum('revenue'),
+    ).order_by('-total_revenue')
+
+    return [
+        {
+            'province': row['province'] or None,
+            'successful_payments': row['successful'],
+            'tickets_paid': row['tickets'],
+            'revenue': float(row['total_revenue'] or 0),
+        }
+        for row in rows
+        if row['total_revenue']
+    ]
@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from .models import Payment, PaymentPlan
+from backend.instrumentation import TimedSerializerMixin
 from tickets.serializers import TicketSerializer
 from users.serializers import UserSerializer
 
 
-class PaymentPlanSerializer(serializers.ModelSerializer):
+class PaymentPlanSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for PaymentPlan"""
     formatted_amount = serializers.CharField(read_only=True)
     is_valid = serializers.BooleanField(read_only=True)
@@ -15,13 +16,13 @@ class PaymentPlanSerializer(serializers.ModelSerializer):
             'id', 'name', 'plan_type', 'description',
             'amount', 'formatted_amount', 'currency',
             'is_active', 'valid_from', 'valid_to',
-            'ticket_category', 'max_usage', 'usage_count',
+            'ticket_category', 'min_quantity', 'max_usage', 'usage_count',
             'is_valid', 'created_at', 'updated_at'
         ]
         read_only_fields = ['usage_count', 'created_at', 'updated_at']
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Payment"""
     formatted_amount = serializers.CharField(read_only=True)
     is_successful = serializers.BooleanField(read_only=True)
@@ -1,11 +1,31 @@
+import hashlib
+import hmac
 import requests
 import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
 from django.utils import timezone
 from decimal import Decimal
 import uuid
 from .models import Payment, TransactionLog
+from .pricing import PricingEngine, release_reserved
+from .rollups import record_failures
+from .transaction_logs import log_transaction
 from tickets.models import Ticket
+from backend import response_cache
+from backend.instrumentation import span
+from backend.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionNotFound(Exception):
+    """Paystack has no transaction with the reference (a definite answer, not an outage)"""
 
 
 class PaystackService:
@@ -14,11 +34,19 @@ class PaystackService:
     def __init__(self):
         self.secret_key = getattr(settings, 'PAYSTACK_SECRET_KEY', '')
         self.public_key = getattr(settings, 'PAYSTACK_PUBLIC_KEY', '')
-        self.base_url = 'https://api.paystack.co'
+        self.base_url = getattr(settings, 'PAYSTACK_BASE_URL', 'https://api.paystack.co').rstrip('/')
+        self.timeout = getattr(settings, 'PAYSTACK_TIMEOUT', 30)
         
         if not self.secret_key or not self.public_key:
             raise ValueError("Paystack keys not configured in settings")
     
+    def verify_webhook_signature(self, body, signature):
+        """Check the X-Paystack-Signature header (HMAC-SHA512 of the raw body)"""
+        if not signature:
+            return False
+        expected = hmac.new(self.secret_key.encode(), body, hashlib.sha512).hexdigest()
+        return hmac.compare_digest(expected, signature)
+    
     def get_headers(self):
         """Get request headers with authorization"""
         return {
@@ -26,7 +54,23 @@ class PaystackService:
             'Content-Type': 'application/json',
         }
     
-    def initialize_payment(self, payment_data):
+    def _log_response(self, transaction_type, request_data, response, payment=None):
+        """Parse a gateway response once and queue its transaction log"""
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            body = None
+        log_transaction(
+            transaction_type,
+            payment=payment,
+            request_data=request_data,
+            response_data=body,
+            is_successful=response.status_code == 200,
+            error_message=response.text if response.status_code != 200 else '',
+        )
+        return body
+
+    def initialize_payment(self, payment_data, payment=None):
         """
         Initialize a payment with Paystack
         """
@@ -36,47 +80,45 @@ class PaystackService:
         if 'amount' in payment_data and isinstance(payment_data['amount'], Decimal):
             payment_data['amount'] = int(payment_data['amount'] * 100)
         
-        response = requests.post(
-            url,
-            headers=self.get_headers(),
-            json=payment_data
-        )
+        with span('paystack'):
+            response = requests.post(
+                url,
+                headers=self.get_headers(),
+                json=payment_data,
+                timeout=self.timeout
+            )
         
-        # Log transaction
-        TransactionLog.objects.create(
-            transaction_type=TransactionLog.TransactionType.INITIATE,
-            request_data=payment_data,
-            response_data=response.json() if response.content else None,
-            is_successful=response.status_code == 200,
-            error_message=response.text if response.status_code != 200 else ''
+        body = self._log_response(
+            TransactionLog.TransactionType.INITIATE, payment_data, response, payment=payment
         )
         
         if response.status_code == 200:
-            return response.json()
+            return body
         else:
             raise Exception(f"Paystack API error: {response.status_code} - {response.text}")
     
-    def verify_payment(self, reference):
+    def verify_payment(self, reference, payment=None):
         """
         Verify a payment with Paystack
         """
         url = f"{self.base_url}/transaction/verify/{reference}"
         
-        response = requests.get(url, headers=self.get_headers())
+        with span('paystack'):
+            response = requests.get(url, headers=self.get_headers(), timeout=self.timeout)
         
-        # Log transaction
-        TransactionLog.objects.create(
-            transaction_type=TransactionLog.TransactionType.VERIFY,
-            request_data={'reference': reference},
-            response_data=response.json() if response.content else None,
-            is_successful=response.status_code == 200,
-            error_message=response.text if response.status_code != 200 else ''
+        body = self._log_response(
+            TransactionLog.TransactionType.VERIFY, {'reference': reference}, response, payment=payment
         )
         
         if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Paystack API error: {response.status_code} - {response.text}")
+            return body
+        error = body if isinstance(body, dict) else {}
+        message = str(error.get('message', ''))
+        if response.status_code == 400 and (
+            error.get('code') == 'transaction_not_found' or 'reference not found' in message.lower()
+        ):
+            raise TransactionNotFound(message)
+        raise Exception(f"Paystack API error: {response.status_code} - {response.text}")
     
     def create_payment_link(self, payment_data):
         """
@@ -84,11 +126,13 @@ class PaystackService:
         """
         url = f"{self.base_url}/transaction/initialize"
         
-        response = requests.post(
-            url,
-            headers=self.get_headers(),
-            json=payment_data
-        )
+        with span('paystack'):
+            response = requests.post(
+                url,
+                headers=self.get_headers(),
+                json=payment_data,
+                timeout=self.timeout
+            )
         
         if response.status_code == 200:
             data = response.json()
@@ -101,7 +145,7 @@ class PaystackService:
         
         raise Exception(f"Failed to create payment link: {response.text}")
     
-    def refund_payment(self, transaction_reference, amount=None, currency='NGN'):
+    def refund_payment(self, transaction_reference, amount=None, currency='NGN', payment=None):
         """
         Refund a payment
         
@@ -120,23 +164,20 @@ class PaystackService:
         if amount:
             refund_data['amount'] = amount
         
-        response = requests.post(
-            url,
-            headers=self.get_headers(),
-            json=refund_data
-        )
+        with span('paystack'):
+            response = requests.post(
+                url,
+                headers=self.get_headers(),
+                json=refund_data,
+                timeout=self.timeout
+            )
         
-        # Log transaction
-        TransactionLog.objects.create(
-            transaction_type=TransactionLog.TransactionType.REFUND,
-            request_data=refund_data,
-            response_data=response.json() if response.content else None,
-            is_successful=response.status_code == 200,
-            error_message=response.text if response.status_code != 200 else ''
+        body = self._log_response(
+            TransactionLog.TransactionType.REFUND, refund_data, response, payment=payment
         )
         
         if response.status_code == 200:
-            return response.json()
+            return body
         else:
             raise Exception(f"Paystack refund error: {response.status_code} - {response.text}")
     
@@ -148,7 +189,8 @@ class PaystackService:
             'page': page
         }
         
-        response = requests.get(url, headers=self.get_headers(), params=params)
+        with span('paystack'):
+            response = requests.get(url, headers=self.get_headers(), params=params, timeout=self.timeout)
         
         if response.status_code == 200:
             return response.json()
@@ -167,16 +209,18 @@ class PaymentService:
     
     def __init__(self):
         self.paystack = PaystackService()
+        self.pricing = PricingEngine()
     
-    def create_payment(self, ticket, user, request=None):
+    def create_payment(self, ticket, user, request=None, payment_plan_id=None):
         """
         Create a payment record and initialize Paystack payment for a SINGLE ticket
         """
         # Generate reference
         reference = self.paystack.generate_reference()
         
-        # Calculate amount (₦3,000)
-        amount = Decimal('3000.00')
+        # Price the ticket from the applicable payment plan
+        quote = self.pricing.reserve([ticket], plan_id=payment_plan_id)
+        amount = quote.total
         
         # Create payment record
         payment = Payment.objects.create(
@@ -193,10 +237,12 @@ class PaymentService:
                 'ticket_reference': ticket.ticket_id,
                 'user_id': str(user.id),
                 'full_name': ticket.full_name,
+                'pricing': quote.as_metadata(),
             },
             ip_address=self._get_client_ip(request) if request else None,
             user_agent=self._get_user_agent(request) if request else None
         )
+        payment.tickets.add(ticket)
         
         # Initialize Paystack payment
         callback_url = f"{settings.FRONTEND_URL}/payment/callback" if hasattr(settings, 'FRONTEND_URL') else ''
@@ -225,7 +271,7 @@ class PaymentService:
         }
         
         try:
-            paystack_response = self.paystack.initialize_payment(paystack_data)
+            paystack_response = self.paystack.initialize_payment(paystack_data, payment=payment)
             
             if paystack_response.get('status'):
                 # Update payment with Paystack reference
@@ -238,18 +284,20 @@ class PaymentService:
                 
         except Exception as e:
             # Mark payment as failed
+            # Gives back the plan usage reserved above
             payment.mark_as_failed({'error': str(e)})
             raise
 
-    def create_bulk_payment(self, tickets, user, request=None):
+    def create_bulk_payment(self, tickets, user, request=None, payment_plan_id=None):
         """
         Create a single payment for MULTIPLE tickets (Bulk Registration)
         """
         reference = self.paystack.generate_reference()
         
-        # Calculate total amount (₦3,000 per ticket)
-        unit_price = Decimal('3000.00')
-        total_amount = unit_price * len(tickets)
+        # Price the whole cart in one pass (group plans apply by cart size)
+        tickets = list(tickets)
+        quote = self.pricing.reserve(tickets, plan_id=payment_plan_id)
+        total_amount = quote.total
         
         # Create descriptions and metadata
         ticket_refs = [t.ticket_id for t in tickets]
@@ -271,11 +319,13 @@ class PaymentService:
                 'ticket_ids': ticket_ids,
                 'ticket_refs': ticket_refs,
                 'user_id': str(user.id),
-                'count': len(tickets)
+                'count': len(tickets),
+                'pricing': quote.as_metadata(),
             },
             ip_address=self._get_client_ip(request) if request else None,
             user_agent=self._get_user_agent(request) if request else None
         )
+        payment.tickets.set(tickets)
         
         # Initialize Paystack
         callback_url = f"{settings.FRONTEND_URL}/payment/callback" if hasattr(settings, 'FRONTEND_URL') else ''
@@ -305,7 +355,7 @@ class PaymentService:
         }
         
         try:
-            paystack_response = self.paystack.initialize_payment(paystack_data)
+            paystack_response = self.paystack.initialize_payment(paystack_data, payment=payment)
             if paystack_response.get('status'):
                 payment.paystack_reference = paystack_response['data']['reference']
                 payment.save()
@@ -313,6 +363,7 @@ class PaymentService:
             else:
                 raise Exception(f"Paystack error: {paystack_response.get('message', 'Unknown error')}")
         except Exception as e:
+            # Gives back the plan usage reserved above
             payment.mark_as_failed({'error': str(e)})
             raise
 
@@ -325,7 +376,7 @@ class PaymentService:
             payment = Payment.objects.get(reference=reference)
             
             # Verify with Paystack
-            verification = self.paystack.verify_payment(reference)
+            verification = self.paystack.verify_payment(reference, payment=payment)
             
             if verification.get('status'):
                 data = verification['data']
@@ -345,11 +396,13 @@ class PaymentService:
                             # Bulk approve all linked tickets
                             # We use system auto-approval (None) or the payment user
                             # Using update() for efficiency
-                            Ticket.objects.filter(id__in=ticket_ids).update(
+                            approved = Ticket.objects.filter(id__in=ticket_ids).update(
                                 status=Ticket.Status.APPROVED,
                                 approved_at=timezone.now(),
                                 approved_by=None 
                             )
+                            metrics.incr('tickets.approved', approved)
+                            response_cache.invalidate_queryset(Ticket.objects.filter(id__in=ticket_ids))
                     
                     return payment
                 else:
@@ -371,12 +424,11 @@ class PaymentService:
         event = payload.get('event')
         data = payload.get('data', {})
         
-        # Log webhook
-        TransactionLog.objects.create(
-            transaction_type=TransactionLog.TransactionType.WEBHOOK,
+        # Log webhook (ip_address is an inet column, so no placeholder text there)
+        log_transaction(
+            TransactionLog.TransactionType.WEBHOOK,
             request_data=payload,
             is_successful=True,
-            ip_address='webhook',
             user_agent='paystack_webhook'
         )
         
@@ -393,10 +445,12 @@ class PaymentService:
                     elif payment.metadata and payment.metadata.get('is_bulk'):
                         ticket_ids = payment.metadata.get('ticket_ids', [])
                         if ticket_ids:
-                            Ticket.objects.filter(id__in=ticket_ids).update(
+                            approved = Ticket.objects.filter(id__in=ticket_ids).update(
                                 status=Ticket.Status.APPROVED,
                                 approved_at=timezone.now()
                             )
+                            metrics.incr('tickets.approved', approved)
+                            response_cache.invalidate_queryset(Ticket.objects.filter(id__in=ticket_ids))
                     return True
                 except Payment.DoesNotExist:
                     pass
@@ -414,4 +468,174 @@ class PaymentService:
     
     def _get_user_agent(self, request):
         """Extract user agent from request"""
-        return request.META.get('HTTP_USER_AGENT', '')
\ No newline at end of file
+        return request.META.get('HTTP_USER_AGENT', '')
+
+class PendingPaymentSweeper:
+    """
+    Periodically re-verify payments stuck in PENDING.
+
+    Stale payments are read in keyset pages, verified against Paystack in
+    parallel (bounded by ``concurrency``), and each page is applied in a
+    single transaction: paid ones are completed and their tickets approved,
+    failed/abandoned ones are marked failed with one UPDATE.
+    """
+
+    # Paystack transaction statuses that will never turn into a success
+    FAILED_STATUSES = {'failed', 'reversed'}
+    ABANDONED_STATUSES = {'abandoned'}
+
+    def __init__(self, paystack=None, stale_after=None, abandon_after=None,
+                 batch_size=None, concurrency=None):
+        config = getattr(settings, 'PAYMENT_SWEEPER', {})
+        self.paystack = paystack or PaystackService()
+        self.stale_after = stale_after or timedelta(minutes=config.get('STALE_AFTER_MINUTES', 30))
+        self.abandon_after = abandon_after or timedelta(hours=config.get('ABANDON_AFTER_HOURS', 24))
+        self.batch_size = batch_size or config.get('BATCH_SIZE', 100)
+        self.concurrency = concurrency or config.get('CONCURRENCY', 8)
+
+    def stale_queryset(self, now=None):
+        now = now or timezone.now()
+        return Payment.objects.filter(
+            status=Payment.Status.PENDING,
+            initiated_at__lte=now - self.stale_after
+        )
+
+    def iter_batches(self, now=None):
+        """Yield pages of stale payments ordered by (initiated_at, id)"""
+        queryset = self.stale_queryset(now).order_by('initiated_at', 'id').only(
+            # amount and completed_at feed the rollups when a payment changes state
+            'id', 'reference', 'amount', 'initiated_at', 'completed_at', 'ticket_id', 'metadata',
+            'status', 'updated_at'
+        )
+        last = None
+        while True:
+            page = queryset
+            if last is not None:
+                page = page.filter(
+                    Q(initiated_at__gt=last.initiated_at) |
+                    Q(initiated_at=last.initiated_at, id__gt=last.id)
+                )
+            batch = list(page[:self.batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+
+    def sweep(self):
+        """Run one full sweep and return a summary of what changed"""
+        started = time.perf_counter()
+        now = timezone.now()
+        result = {'checked': 0, 'approved': 0, 'failed': 0, 'still_pending': 0, 'errors': 0}
+
+        metrics.set_gauge('payment_sweep_backlog', self.stale_queryset(now).count())
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch in self.iter_batches(now):
+                outcomes = list(executor.map(self._verify, batch))
+                batch_result = self.apply_batch(outcomes, now)
+                for key, value in batch_result.items():
+                    result[key] += value
+
+        duration = time.perf_counter() - started
+        remaining = self.stale_queryset(now).count()
+        metrics.observe('payment_sweep_duration_seconds', duration)
+        metrics.set_gauge('payment_sweep_backlog', remaining)
+        for key in ('approved', 'failed', 'errors'):
+            metrics.incr(f'payment_sweep_{key}_total', result[key])
+
+        result['duration'] = duration
+        result['backlog'] = remaining
+        logger.info("Pending payment sweep finished: %s", result)
+        return result
+
+    def _verify(self, payment):
+        """Verify one payment; runs in a worker thread"""
+        try:
+            verification = self.paystack.verify_payment(payment.reference, payment=payment)
+            if not verification.get('status'):
+                return payment, None, verification.get('message') or 'Verification not confirmed'
+            return payment, verification.get('data'), None
+        except TransactionNotFound:
+            # No data and no error: Paystack never saw the payment
+            return payment, None, None
+        except Exception as e:
+            return payment, None, str(e)
+        finally:
+            # Worker threads get their own DB connections (transaction logs)
+            connections.close_all()
+
+    def apply_batch(self, outcomes, now=None):
+        """Apply verification outcomes for one page in a single transaction"""
+        now = now or timezone.now()
+        result = {'checked': len(outcomes), 'approved': 0, 'failed': 0, 'still_pending': 0, 'errors': 0}
+        paid = []
+        failed_ids = []
+
+        for payment, data, error in outcomes:
+            is_old = payment.initiated_at <= now - self.abandon_after
+            gateway_status = (data or {}).get('status')
+
+            if error:
+                # No answer from the gateway (timeout, outage): retried next sweep
+                result['errors'] += 1
+                result['still_pending'] += 1
+            elif gateway_status == 'success':
+                paid.append((payment, data))
+            elif gateway_status in self.FAILED_STATUSES:
+                failed_ids.append(payment.id)
+            elif is_old and (gateway_status in self.ABANDONED_STATUSES or data is None):
+                # Never completed on Paystack (or unknown to it) past the horizon
+                failed_ids.append(payment.id)
+            else:
+                result['still_pending'] += 1
+
+        with transaction.atomic():
+            if paid:
+                # Lock first so payments completed concurrently (webhook, callback) are not completed twice
+                pending_ids = set(Payment.objects.select_for_update().filter(
+                    id__in=[payment.id for payment, _ in paid], status=Payment.Status.PENDING
+                ).values_list('id', flat=True))
+                paid = [(payment, data) for payment, data in paid if payment.id in pending_ids]
+
+            single_ticket_ids = []
+            bulk_ticket_ids = []
+            for payment, data in paid:
+                payment.mark_as_successful(data)
+                if payment.ticket_id:
+                    single_ticket_ids.append(payment.ticket_id)
+                elif payment.metadata and payment.metadata.get('is_bulk'):
+                    bulk_ticket_ids.extend(payment.metadata.get('ticket_ids', []))
+
+            approved = 0
+            if single_ticket_ids:
+                approved += Ticket.objects.filter(id__in=single_ticket_ids).update(
+                    status=Ticket.Status.APPROVED,
+                    approved_at=now,
+                    approved_by=F('registered_by')
+                )
+            if bulk_ticket_ids:
+                approved += Ticket.objects.filter(id__in=bulk_ticket_ids).update(
+                    status=Ticket.Status.APPROVED,
+                    approved_at=now,
+                    approved_by=None
+                )
+            if approved:
+                transaction.on_commit(lambda: metrics.incr('tickets.approved', approved))
+            if single_ticket_ids or bulk_ticket_ids:
+                response_cache.invalidate_queryset(
+                    Ticket.objects.filter(id__in=single_ticket_ids + bulk_ticket_ids)
+                )
+
+            if failed_ids:
+                # Lock first so payments completed concurrently are not counted as failed
+                failed = list(Payment.objects.select_for_update().filter(
+                    id__in=failed_ids, status=Payment.Status.PENDING
+                ).only('id', 'amount', 'ticket_id', 'metadata'))
+                result['failed'] = Payment.objects.filter(
+                    id__in=[payment.id for payment in failed]
+                ).update(status=Payment.Status.FAILED, completed_at=now, updated_at=now)
+                release_reserved(failed)
+                record_failures(failed, now)
+
+        result['approved'] = len(paid)
+        return result
@@ -0,0 +1,29 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from tickets import timeline
+from .models import Payment, PaymentPlan
+from .pricing import plan_cache
+
+
+@receiver(post_save, sender=PaymentPlan)
+@receiver(post_delete, sender=PaymentPlan)
+def invalidate_plan_cache(sender, **kwargs):
+    """Drop cached plans whenever a plan changes"""
+    plan_cache.invalidate()
+
+
+@receiver(post_save, sender=Payment)
+def invalidate_payment_timelines(sender, instance, created, **kwargs):
+    """A payment's status shows on the timeline of every ticket it covers"""
+    ticket_ids = [instance.ticket_id]
+    if not created:
+        ticket_ids += Payment.tickets.through.objects.filter(payment=instance).values_list('ticket_id', flat=True)
+    timeline.invalidate(*ticket_ids)
+
+
+@receiver(m2m_changed, sender=Payment.tickets.through)
+def invalidate_linked_timelines(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove'):
+        return
+    timeline.invalidate(*([instance.pk] if reverse else pk_set))
@@ -1,18 +1,33 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
 from unittest.mock import patch, Mock, MagicMock
 from decimal import Decimal
+import gzip
 import json
+import requests
+import tempfile
+from datetime import timedelta
+from pathlib import Path
 
 # Import your actual models and services
-from .models import Payment, PaymentPlan, TransactionLog
+from .models import Payment, PaymentPlan, PaymentRollup, TransactionLog
 from users.models import User
 from tickets.models import Ticket
-from .services import PaystackService, PaymentService
+from .services import PaystackService, PaymentService, PendingPaymentSweeper, TransactionNotFound
 from .serializers import PaymentSerializer, PaymentPlanSerializer
+from .pricing import PricingEngine, PricingError, plan_cache
+from . import rollups
+from .transaction_logs import compact_payload, log_transaction, archive_logs, truncate_error
+from backend.bulk_writer import BackgroundBulkWriter
+from backend.benchmarking import StepRecorder, percentile
+from backend.metrics import registry
+from .paystack_stub import FakePaystack, sign_payload, start_in_thread
+from django.test import override_settings
+from django.db import IntegrityError
+from django.db.models import Sum
 
 
 class PaymentModelTests(TestCase):
@@ -884,4 +899,676 @@ class TransactionLogTests(TestCase):
         self.assertTrue(log.is_successful)
         self.assertEqual(log.ip_address, '127.0.0.1')
         
-        print("✓ Transaction log test passed")
\ No newline at end of file
+        print("✓ Transaction log test passed")
+
+
+class PendingPaymentSweeperTests(TestCase):
+    """Tests for the stale pending payment sweeper"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='sweepuser',
+            email='sweep@rccg.com',
+            password='testpass123',
+            first_name='Sweep',
+            last_name='User',
+            role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_9
+        )
+        self.paystack = Mock()
+        self.sweeper = PendingPaymentSweeper(paystack=self.paystack, batch_size=2, concurrency=2)
+
+    def _ticket(self, name):
+        return Ticket.objects.create(
+            full_name=name,
+            age=15,
+            category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.MALE,
+            phone='+2348012345679',
+            province=User.Province.LAGOS_PROVINCE_9,
+            zone='Zone A',
+            area='Area 1',
+            parish='Parish XYZ',
+            emergency_contact='Parent',
+            emergency_phone='+2348023456789',
+            emergency_relationship='Father',
+            parent_name='Parent Name',
+            parent_email='parent@example.com',
+            parent_phone='+2348023456789',
+            parent_relationship='Father',
+            registered_by=self.user
+        )
+
+    def _payment(self, reference, age, **kwargs):
+        payment = Payment.objects.create(
+            reference=reference,
+            amount=Decimal('3000.00'),
+            description='Sweeper test',
+            payer_email=self.user.email,
+            **kwargs
+        )
+        Payment.objects.filter(pk=payment.pk).update(initiated_at=timezone.now() - age)
+        return payment
+
+    def test_sweep_approves_paid_and_fails_abandoned(self):
+        """Paid payments approve their tickets, old abandoned ones fail in bulk"""
+        ticket = self._ticket('Paid Teen')
+        bulk_tickets = [self._ticket('Bulk One'), self._ticket('Bulk Two')]
+
+        paid = self._payment('SWEEP_PAID', timezone.timedelta(hours=1), ticket=ticket)
+        bulk = self._payment('SWEEP_BULK', timezone.timedelta(hours=1), metadata={
+            'is_bulk': True, 'ticket_ids': [str(t.id) for t in bulk_tickets]
+        })
+        abandoned = self._payment('SWEEP_ABANDONED', timezone.timedelta(days=2))
+        ongoing = self._payment('SWEEP_ONGOING', timezone.timedelta(hours=1))
+        fresh = self._payment('SWEEP_FRESH', timezone.timedelta(minutes=1))
+
+        statuses = {
+            'SWEEP_PAID': 'success',
+            'SWEEP_BULK': 'success',
+            'SWEEP_ABANDONED': 'abandoned',
+            'SWEEP_ONGOING': 'abandoned',
+        }
+        self.paystack.verify_payment.side_effect = lambda ref, **kwargs: {
+            'status': True,
+            'data': {'reference': ref, 'status': statuses[ref], 'channel': 'card', 'authorization': {}}
+        }
+
+        result = self.sweeper.sweep()
+
+        self.assertEqual(result['checked'], 4)
+        self.assertEqual(result['approved'], 2)
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(result['still_pending'], 1)
+
+        paid.refresh_from_db()
+        bulk.refresh_from_db()
+        abandoned.refresh_from_db()
+        ongoing.refresh_from_db()
+        fresh.refresh_from_db()
+        ticket.refresh_from_db()
+
+        self.assertEqual(paid.status, Payment.Status.SUCCESS)
+        self.assertEqual(bulk.status, Payment.Status.SUCCESS)
+        self.assertEqual(abandoned.status, Payment.Status.FAILED)
+        self.assertEqual(ongoing.status, Payment.Status.PENDING)
+        self.assertEqual(fresh.status, Payment.Status.PENDING)
+        self.assertEqual(ticket.status, Ticket.Status.APPROVED)
+        self.assertEqual(ticket.approved_by, self.user)
+        for bulk_ticket in bulk_tickets:
+            bulk_ticket.refresh_from_db()
+            self.assertEqual(bulk_ticket.status, Ticket.Status.APPROVED)
+
+        # The fresh payment is never sent to Paystack
+        verified = {call.args[0] for call in self.paystack.verify_payment.call_args_list}
+        self.assertNotIn('SWEEP_FRESH', verified)
+        self.assertEqual(result['backlog'], 1)
+
+    def test_verification_errors_keep_payments_pending(self):
+        """A gateway outage fails nothing, however old the payment"""
+        recent = self._payment('SWEEP_ERR_RECENT', timezone.timedelta(hours=1))
+        old = self._payment('SWEEP_ERR_OLD', timezone.timedelta(days=3))
+        self.paystack.verify_payment.side_effect = Exception('Paystack API error: 503')
+
+        result = self.sweeper.sweep()
+
+        recent.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual((result['errors'], result['still_pending'], result['failed']), (2, 2, 0))
+        self.assertEqual(recent.status, Payment.Status.PENDING)
+        self.assertEqual(old.status, Payment.Status.PENDING)
+
+    def test_unknown_references_fail_past_the_horizon(self):
+        recent = self._payment('SWEEP_MISSING_RECENT', timezone.timedelta(hours=1))
+        old = self._payment('SWEEP_MISSING_OLD', timezone.timedelta(days=3))
+        self.paystack.verify_payment.side_effect = TransactionNotFound('Transaction reference not found')
+
+        result = self.sweeper.sweep()
+
+        recent.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual((result['errors'], result['failed']), (0, 1))
+        self.assertEqual(recent.status, Payment.Status.PENDING)
+        self.assertEqual(old.status, Payment.Status.FAILED)
+
+    def test_payments_completed_meanwhile_are_not_completed_again(self):
+        payment = self._payment('SWEEP_RACE', timezone.timedelta(hours=1))
+        data = {'reference': 'SWEEP_RACE', 'status': 'success', 'channel': 'card', 'authorization': {}}
+        [batch] = list(self.sweeper.iter_batches())
+        # The webhook gets there while Paystack is being asked
+        Payment.objects.get(pk=payment.pk).mark_as_successful(data)
+
+        result = self.sweeper.apply_batch([(batch[0], data, None)])
+
+        self.assertEqual(result['approved'], 0)
+        daily = PaymentRollup.objects.filter(granularity=PaymentRollup.Granularity.DAY)
+        self.assertEqual(daily.aggregate(Sum('successful_payments'))['successful_payments__sum'], 1)
+
+
+class PricingEngineTests(TestCase):
+    """Tests for PaymentPlan-based ticket pricing"""
+
+    def setUp(self):
+        plan_cache.invalidate()
+        self.user = User.objects.create_user(
+            username='priceuser',
+            email='price@rccg.com',
+            password='testpass123',
+            first_name='Price',
+            last_name='User',
+            role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_9
+        )
+        now = timezone.now()
+        self.window = {'valid_from': now - timezone.timedelta(days=1), 'valid_to': now + timezone.timedelta(days=30)}
+        self.engine = PricingEngine()
+
+    def _ticket(self, category=Ticket.Category.TEENS, age=15):
+        return Ticket.objects.create(
+            full_name='Priced Teen',
+            age=age,
+            category=category,
+            gender=Ticket.Gender.FEMALE,
+            phone='+2348012345679',
+            province=User.Province.LAGOS_PROVINCE_9,
+            zone='Zone A',
+            area='Area 1',
+            parish='Parish XYZ',
+            emergency_contact='Parent',
+            emergency_phone='+2348023456789',
+            emergency_relationship='Mother',
+            parent_name='Parent Name',
+            parent_email='parent@example.com',
+            parent_phone='+2348023456789',
+            parent_relationship='Mother',
+            registered_by=self.user
+        )
+
+    def _plan(self, name, amount, **kwargs):
+        return PaymentPlan.objects.create(name=name, amount=Decimal(amount), **self.window, **kwargs)
+
+    def test_default_price_without_plans(self):
+        """Carts fall back to DEFAULT_TICKET_PRICE"""
+        quote = self.engine.price_cart([self._ticket(), self._ticket()])
+        self.assertEqual(quote.total, Decimal('6000.00'))
+
+    def test_resolves_cheapest_applicable_plan_per_category(self):
+        """Category, group size and VIP opt-in are honoured"""
+        self._plan('Regular', '3000.00')
+        self._plan('Teens Early Bird', '2500.00', plan_type=PaymentPlan.PlanType.EARLY_BIRD,
+                   ticket_category=Ticket.Category.TEENS)
+        self._plan('Group of 3', '2000.00', plan_type=PaymentPlan.PlanType.GROUP, min_quantity=3)
+        self._plan('VIP', '1000.00', plan_type=PaymentPlan.PlanType.VIP)
+
+        teen = self._ticket()
+        child = self._ticket(category=Ticket.Category.CHILDREN, age=7)
+
+        quote = self.engine.price_cart([teen, child])
+        self.assertEqual([line.plan.name for line in quote.lines], ['Teens Early Bird', 'Regular'])
+        self.assertEqual(quote.total, Decimal('5500.00'))
+
+        quote = self.engine.price_cart([teen, child, self._ticket()])
+        self.assertEqual(quote.total, Decimal('6000.00'))
+
+    def test_cart_pricing_uses_cache(self):
+        """Pricing a cart after the first load runs no queries"""
+        self._plan('Regular', '3000.00')
+        tickets = [self._ticket() for _ in range(5)]
+        plan_cache.get_plans()
+
+        with self.assertNumQueries(0):
+            quote = self.engine.price_cart(tickets)
+        self.assertEqual(quote.total, Decimal('15000.00'))
+
+    def test_plan_save_invalidates_cache(self):
+        plan = self._plan('Regular', '3000.00')
+        self.assertEqual(self.engine.price_cart([self._ticket()]).total, Decimal('3000.00'))
+
+        plan.amount = Decimal('3500.00')
+        plan.save()
+
+        self.assertEqual(self.engine.price_cart([self._ticket()]).total, Decimal('3500.00'))
+
+    def test_reserve_consumes_usage_atomically(self):
+        """Capped plans are consumed with F() updates and skipped once exhausted"""
+        early = self._plan('Early Bird', '2500.00', plan_type=PaymentPlan.PlanType.EARLY_BIRD, max_usage=2)
+        self._plan('Regular', '3000.00')
+
+        quote = self.engine.reserve([self._ticket(), self._ticket()])
+        self.assertEqual(quote.total, Decimal('5000.00'))
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 2)
+
+        # A stale cached copy still thinks the plan has room: reserve re-prices
+        quote = self.engine.reserve([self._ticket()])
+        self.assertEqual(quote.total, Decimal('3000.00'))
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 2)
+
+        self.assertFalse(early.increment_usage())
+
+    def test_explicit_plan_must_apply(self):
+        vip = self._plan('VIP', '10000.00', plan_type=PaymentPlan.PlanType.VIP)
+        kids_only = self._plan('Kids', '1500.00', ticket_category=Ticket.Category.TODDLER)
+
+        quote = self.engine.price_cart([self._ticket()], plan_id=vip.id)
+        self.assertEqual(quote.total, Decimal('10000.00'))
+
+        with self.assertRaises(PricingError):
+            self.engine.price_cart([self._ticket()], plan_id=kids_only.id)
+
+    @override_settings(PAYSTACK_SECRET_KEY='sk_test', PAYSTACK_PUBLIC_KEY='pk_test')
+    @patch.object(PaystackService, 'initialize_payment')
+    def test_failed_payments_release_usage(self, mock_initialize):
+        """Usage reserved at initialize comes back when the payment fails or is swept"""
+        early = self._plan('Early Bird', '2500.00', plan_type=PaymentPlan.PlanType.EARLY_BIRD, max_usage=5)
+        service = PaymentService()
+        request = RequestFactory().post('/api/payments/initialize/')
+
+        mock_initialize.return_value = {'status': False, 'message': 'Declined'}
+        with self.assertRaises(Exception):
+            service.create_payment(self._ticket(), self.user, request)
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 0)
+
+        mock_initialize.side_effect = lambda data, **kwargs: {'status': True, 'data': {'reference': data['reference']}}
+        verified, _ = service.create_payment(self._ticket(), self.user, request)
+        abandoned, _ = service.create_bulk_payment([self._ticket(), self._ticket()], self.user, request)
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 3)
+
+        verified.mark_as_failed({'status': 'failed'})
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 2)
+
+        Payment.objects.filter(pk=abandoned.pk).update(initiated_at=timezone.now() - timedelta(days=2))
+        sweeper = PendingPaymentSweeper(paystack=Mock())
+        sweeper.apply_batch([(Payment.objects.get(pk=abandoned.pk), {'status': 'abandoned'}, None)])
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 0)
+
+        # Failing again gives nothing back twice
+        verified.mark_as_failed()
+        early.refresh_from_db()
+        self.assertEqual(early.usage_count, 0)
+
+
+class PaymentRollupTests(APITestCase):
+    """Tests for revenue rollups and the aggregated dashboard"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='rollupadmin',
+            email='rollupadmin@rccg.com',
+            password='adminpass',
+            first_name='Rollup',
+            last_name='Admin'
+        )
+
+    def _ticket(self, province):
+        return Ticket.objects.create(
+            full_name='Rollup Teen',
+            age=15,
+            category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.MALE,
+            phone='+2348012345679',
+            province=province,
+            zone='Zone A',
+            area='Area 1',
+            parish='Parish XYZ',
+            emergency_contact='Parent',
+            emergency_phone='+2348023456789',
+            emergency_relationship='Father',
+            parent_name='Parent Name',
+            parent_email='parent@example.com',
+            parent_phone='+2348023456789',
+            parent_relationship='Father',
+            registered_by=self.admin
+        )
+
+    def _payment(self, reference, tickets, amount):
+        payment = Payment.objects.create(
+            reference=reference,
+            amount=Decimal(amount),
+            ticket=tickets[0] if len(tickets) == 1 else None,
+            description='Rollup test',
+            payer_email=self.admin.email,
+        )
+        payment.tickets.set(tickets)
+        return payment
+
+    def _paystack_data(self, reference):
+        return {'reference': reference, 'status': 'success', 'channel': 'card',
+                'authorization': {'authorization_code': 'AUTH', 'channel': 'card'}}
+
+    def test_terminal_transitions_update_rollups(self):
+        """Success adds revenue once; a later status change moves it"""
+        ticket = self._ticket(User.Province.LAGOS_PROVINCE_9)
+        payment = self._payment('ROLLUP_SINGLE', [ticket], '3000.00')
+
+        payment.mark_as_successful(self._paystack_data('ROLLUP_SINGLE'))
+        payment.mark_as_successful(self._paystack_data('ROLLUP_SINGLE'))  # webhook after verify
+
+        daily = self._daily(User.Province.LAGOS_PROVINCE_9)
+        self.assertEqual(daily['successful'], 1)
+        self.assertEqual(daily['total_revenue'], Decimal('3000.00'))
+        self.assertTrue(PaymentRollup.objects.filter(granularity='hour').exists())
+
+        payment.mark_as_failed()
+        daily = self._daily(User.Province.LAGOS_PROVINCE_9)
+        self.assertEqual(daily['successful'], 0)
+        self.assertEqual(daily['failed'], 1)
+        self.assertEqual(daily['total_revenue'], Decimal('0.00'))
+
+    def _daily(self, province):
+        # One row per payment method
+        return PaymentRollup.objects.filter(granularity='day', province=province).aggregate(
+            successful=Sum('successful_payments'), failed=Sum('failed_payments'), total_revenue=Sum('revenue')
+        )
+
+    @override_settings(TIME_ZONE='Africa/Lagos')
+    def test_buckets_follow_local_time(self):
+        """23:30 UTC is already the next day in Lagos"""
+        at = timezone.datetime(2026, 3, 1, 23, 30, tzinfo=timezone.get_fixed_timezone(0))
+        self.assertEqual(
+            rollups.bucket_start(at, 'day').isoformat(), '2026-03-02T00:00:00+01:00'
+        )
+        self.assertEqual(rollups.bucket_start(at, 'hour').isoformat(), '2026-03-02T00:00:00+01:00')
+
+    def test_bulk_payment_revenue_split_by_province(self):
+        tickets = [
+            self._ticket(User.Province.LAGOS_PROVINCE_9),
+            self._ticket(User.Province.LAGOS_PROVINCE_9),
+            self._ticket(User.Province.LAGOS_PROVINCE_28),
+        ]
+        payment = self._payment('ROLLUP_BULK', tickets, '9000.00')
+        payment.mark_as_successful(self._paystack_data('ROLLUP_BULK'))
+
+        split = {row['province']: row for row in rollups.province_revenue()}
+        self.assertEqual(split[User.Province.LAGOS_PROVINCE_9]['revenue'], 6000.0)
+        self.assertEqual(split[User.Province.LAGOS_PROVINCE_9]['successful_payments'], 1)
+        self.assertEqual(split[User.Province.LAGOS_PROVINCE_28]['revenue'], 3000.0)
+        self.assertEqual(split[User.Province.LAGOS_PROVINCE_28]['tickets_paid'], 1)
+
+        # Rebuilding from scratch gives the same figures
+        rollups.rebuild()
+        self.assertEqual({row['province']: row for row in rollups.province_revenue()}, split)
+
+    def test_total_counts_every_status(self):
+        """Cancelled and refunded payments count towards total_payments"""
+        self.client.force_authenticate(user=self.admin)
+        ticket = self._ticket(User.Province.LAGOS_PROVINCE_9)
+        self._payment('ROLLUP_TOTAL_0', [ticket], '3000.00').mark_as_successful(
+            self._paystack_data('ROLLUP_TOTAL_0'))
+        for i, payment_status in enumerate((Payment.Status.CANCELLED, Payment.Status.REFUNDED), 1):
+            Payment.objects.filter(pk=self._payment(f'ROLLUP_TOTAL_{i}', [ticket], '3000.00').pk).update(
+                status=payment_status)
+
+        overview = self.client.get('/api/payments/dashboard/').data['overview']
+        self.assertEqual((overview['total_payments'], overview['successful_payments']), (3, 1))
+        self.assertAlmostEqual(overview['success_rate'], 100 / 3)
+
+    def test_dashboard_query_count_is_constant(self):
+        """The dashboard runs the same number of queries at any volume"""
+        self.client.force_authenticate(user=self.admin)
+        ticket = self._ticket(User.Province.LAGOS_PROVINCE_9)
+        self._payment('ROLLUP_DASH_0', [ticket], '3000.00').mark_as_successful(
+            self._paystack_data('ROLLUP_DASH_0'))
+
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/payments/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for i in range(1, 15):
+            payment = self._payment(f'ROLLUP_DASH_{i}', [self._ticket(User.Province.LAGOS_PROVINCE_28)], '3000.00')
+            if i % 2:
+                payment.mark_as_successful(self._paystack_data(payment.reference))
+            elif i % 3:
+                payment.mark_as_failed()
+
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/payments/dashboard/?granularity=hour')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.data
+        self.assertEqual(data['overview']['total_payments'], 15)
+        self.assertEqual(data['overview']['successful_payments'], 8)
+        self.assertEqual(data['overview']['failed_payments'], 5)
+        self.assertEqual(data['overview']['pending_payments'], 2)
+        self.assertEqual(data['revenue']['total'], 24000.0)
+        self.assertEqual(
+            [(method['payment_method'], method['count'], method['total']) for method in data['payment_methods']],
+            [('card', 8, Decimal('24000.00'))]
+        )
+        self.assertEqual(data['series']['granularity'], 'hour')
+        self.assertEqual(len(data['series']['points']), 1)
+        point = data['series']['points'][0]
+        self.assertEqual(point['successful_payments'], 8)
+        self.assertEqual(point['revenue'], 24000.0)
+        self.assertEqual(len(data['provinces']), 2)
+
+
+class TransactionLogWriterTests(TestCase):
+    """Tests for compacted, buffered gateway logging and archival"""
+
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            reference='TXLOG_001',
+            amount=Decimal('3000.00'),
+            currency='NGN',
+            payer_email='txlog@example.com',
+            status=Payment.Status.PENDING
+        )
+
+    def _verify_response(self):
+        return {
+            'status': True,
+            'message': 'Verification successful',
+            'data': {
+                'id': 12345,
+                'status': 'success',
+                'reference': 'TXLOG_001',
+                'amount': 300000,
+                'currency': 'NGN',
+                'channel': 'card',
+                'gateway_response': 'Successful',
+                'paid_at': '2025-01-01T10:00:00.000Z',
+                'log': {'history': [{'type': 'action', 'message': 'x' * 500}] * 20},
+                'fees_split': None,
+                'metadata': {'payment_id': 'abc', 'ticket_count': 2, 'custom_fields': ['noise']},
+                'authorization': {'authorization_code': 'AUTH_x', 'bin': '408408', 'last4': '4081', 'channel': 'card'},
+                'customer': {'email': 'txlog@example.com', 'phone': '080', 'metadata': {}},
+            }
+        }
+
+    def test_compact_payload_keeps_used_fields_only(self):
+        compact = compact_payload(self._verify_response())
+        data = compact['data']
+        self.assertEqual(data['reference'], 'TXLOG_001')
+        self.assertEqual(data['gateway_response'], 'Successful')
+        self.assertNotIn('log', data)
+        self.assertNotIn('fees_split', data)
+        self.assertEqual(data['metadata'], {'payment_id': 'abc', 'ticket_count': 2})
+        self.assertEqual(data['authorization'], {'authorization_code': 'AUTH_x', 'channel': 'card'})
+        self.assertEqual(data['customer'], {'email': 'txlog@example.com'})
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(self._verify_response())) / 5)
+
+    def test_truncate_error(self):
+        self.assertEqual(truncate_error(None), '')
+        self.assertEqual(len(truncate_error('e' * 5000)), 1003)
+
+    @patch('payments.services.requests.get')
+    def test_verify_links_log_to_payment(self, mock_get):
+        mock_get.return_value = Mock(
+            status_code=200, content=b'{}', text='{}', json=Mock(return_value=self._verify_response())
+        )
+        with self.settings(PAYSTACK_SECRET_KEY='sk_test', PAYSTACK_PUBLIC_KEY='pk_test'):
+            result = PaystackService().verify_payment('TXLOG_001', payment=self.payment)
+
+        self.assertEqual(result['data']['reference'], 'TXLOG_001')
+        mock_get.return_value.json.assert_called_once()
+        log = TransactionLog.objects.get(payment=self.payment)
+        self.assertEqual(log.transaction_type, TransactionLog.TransactionType.VERIFY)
+        self.assertTrue(log.is_successful)
+        self.assertNotIn('log', log.response_data['data'])
+
+    def test_background_writer_batches_inserts(self):
+        writer = BackgroundBulkWriter('test', batch_size=50, flush_interval=0.05)
+        with patch.object(TransactionLog.objects, 'bulk_create') as bulk_create:
+            writer.write_many(
+                TransactionLog(transaction_type=TransactionLog.TransactionType.WEBHOOK) for _ in range(120)
+            )
+            writer.flush()
+        self.assertEqual(writer.depth, 0)
+        inserted = sum(len(call.args[0]) for call in bulk_create.call_args_list)
+        self.assertEqual(inserted, 120)
+        self.assertLessEqual(bulk_create.call_count, 120 // 50 + 2)
+
+    def test_background_writer_writes_inline_when_full(self):
+        writer = BackgroundBulkWriter('test', max_queue=1, async_writes=True)
+        with patch.object(writer, '_ensure_thread'), \
+                patch.object(TransactionLog.objects, 'bulk_create') as bulk_create:
+            writer.write(TransactionLog(transaction_type=TransactionLog.TransactionType.WEBHOOK))
+            writer.write(TransactionLog(transaction_type=TransactionLog.TransactionType.WEBHOOK))
+            self.assertEqual(bulk_create.call_count, 1)
+            writer.flush()
+        self.assertEqual(bulk_create.call_count, 2)
+
+    def test_background_writer_retries_rows_of_a_failed_batch(self):
+        """One bad row costs only itself; it is retried, then counted as dropped"""
+        registry.reset()
+        writer = BackgroundBulkWriter('test', max_retries=2)
+        inserted = []
+
+        def bulk_create(instances, **kwargs):
+            if any(log.error_message == 'bad' for log in instances):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            inserted.extend(instances)
+
+        with patch.object(writer, '_ensure_thread'), \
+                patch.object(TransactionLog.objects, 'bulk_create', side_effect=bulk_create) as mocked:
+            writer.write_many(
+                TransactionLog(transaction_type=TransactionLog.TransactionType.WEBHOOK, error_message=message)
+                for message in ('ok', 'bad', 'ok')
+            )
+            writer.flush()
+
+        self.assertEqual([log.error_message for log in inserted], ['ok', 'ok'])
+        # The batch, each row, then two retries of the bad one
+        self.assertEqual(mocked.call_count, 6)
+        self.assertEqual(writer.depth, 0)
+        self.assertEqual(registry.get('bulk_writer.dropped', writer='test', model='TransactionLog'), 1)
+
+    def test_archive_moves_old_logs_to_gzip_jsonl(self):
+        old = log_transaction(TransactionLog.TransactionType.VERIFY, payment=self.payment,
+                              response_data={'status': True})
+        recent = log_transaction(TransactionLog.TransactionType.WEBHOOK, request_data={'event': 'charge.success'})
+        old_time = timezone.now() - timedelta(days=120)
+        TransactionLog.objects.filter(pk=old.pk).update(timestamp=old_time)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            archived = archive_logs(timezone.now() - timedelta(days=90), output_dir, batch_size=1)
+            self.assertEqual(archived, 1)
+            path = Path(output_dir) / f'{old_time.date().isoformat()}.jsonl.gz'
+            with gzip.open(path, 'rt') as handle:
+                rows = [json.loads(line) for line in handle]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], str(old.pk))
+        self.assertEqual(rows[0]['payment_id'], str(self.payment.pk))
+        self.assertEqual(list(TransactionLog.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+class FakePaystackTests(TestCase):
+    """Tests for the local Paystack stand-in and webhook signatures"""
+
+    SECRET = 'sk_test_stub'
+
+    def setUp(self):
+        self.stub = FakePaystack(self.SECRET, seed=1)
+        self.server = start_in_thread(self.stub)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        overrides = override_settings(
+            PAYSTACK_BASE_URL=self.stub.base_url,
+            PAYSTACK_SECRET_KEY=self.SECRET,
+            PAYSTACK_PUBLIC_KEY='pk_test_stub',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.paystack = PaystackService()
+
+    def test_initialize_checkout_verify_refund(self):
+        response = self.paystack.initialize_payment({
+            'email': 'stub@example.com', 'amount': Decimal('3000.00'), 'reference': 'STUB_001'
+        })
+        self.assertEqual(response['data']['reference'], 'STUB_001')
+        self.assertEqual(self.paystack.verify_payment('STUB_001')['data']['status'], 'abandoned')
+
+        requests.get(response['data']['authorization_url'], timeout=10)
+        data = self.paystack.verify_payment('STUB_001')['data']
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['amount'], 300000)
+
+        self.assertEqual(self.paystack.list_transactions()['meta']['total'], 1)
+        self.assertTrue(self.paystack.refund_payment('STUB_001')['status'])
+        self.assertEqual(self.stub.transactions['STUB_001']['status'], 'reversed')
+
+    def test_failure_injection(self):
+        self.stub.failure_rate = 1.0
+        self.stub.fail_endpoints = {'verify'}
+        self.paystack.initialize_payment({'email': 'stub@example.com', 'amount': 100, 'reference': 'STUB_002'})
+        with self.assertRaisesMessage(Exception, 'Paystack API error: 500'):
+            self.paystack.verify_payment('STUB_002')
+
+    def test_unknown_reference_is_a_definite_answer(self):
+        with self.assertRaises(TransactionNotFound):
+            self.paystack.verify_payment('STUB_MISSING')
+
+    def test_rejects_wrong_secret_key(self):
+        with self.settings(PAYSTACK_SECRET_KEY='sk_wrong'):
+            with self.assertRaisesMessage(Exception, '401'):
+                PaystackService().verify_payment('anything')
+
+    def test_webhook_requires_valid_signature(self):
+        ticket = Ticket.objects.create(
+            full_name='Webhook Teen', age=15, category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.MALE, phone='+2348012345679',
+            province=User.Province.LAGOS_PROVINCE_9, zone='Zone A', area='Area 1',
+            parish='Parish', emergency_contact='Parent', emergency_phone='+2348023456789',
+            emergency_relationship='Father', parent_name='Parent',
+            parent_email='parent@example.com', parent_phone='+2348023456789',
+            parent_relationship='Father'
+        )
+        payment = Payment.objects.create(
+            reference='STUB_WEBHOOK', amount=Decimal('3000.00'), ticket=ticket,
+            payer_email='stub@example.com', status=Payment.Status.PENDING
+        )
+        self.paystack.initialize_payment({'email': 'stub@example.com', 'amount': 300000, 'reference': 'STUB_WEBHOOK'})
+        self.stub.complete('STUB_WEBHOOK')
+        body, signature = self.stub.webhook('STUB_WEBHOOK')
+        self.assertEqual(signature, sign_payload(body, self.SECRET))
+
+        response = self.client.post('/api/payments/webhook', body, content_type='application/json',
+                                    HTTP_X_PAYSTACK_SIGNATURE='0' * 128)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.Status.PENDING)
+
+        response = self.client.post('/api/payments/webhook', body, content_type='application/json',
+                                    HTTP_X_PAYSTACK_SIGNATURE=signature)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.Status.SUCCESS)
+
+    def test_step_recorder(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 99), 5)
+        recorder = StepRecorder()
+        with recorder.step('count'):
+            Payment.objects.count()
+        with self.assertRaises(ValueError):
+            with recorder.step('count'):
+                raise ValueError
+        row = recorder.summary()[0]
+        self.assertEqual((row['step'], row['count'], row['errors'], row['queries']), ('count', 1, 1, 1))
@@ -0,0 +1,103 @@
+"""
+Gateway transaction logging.
+
+Paystack calls and webhooks are logged through a BackgroundBulkWriter so the
+insert happens off the request path, and payloads are trimmed to the fields
+we actually read back (reconciliation, support lookups) before being stored.
+Once written, the logs' tickets get a new timeline cache version.
+Old logs are moved out of the table into gzipped JSONL files by
+``archive_logs`` (see backend.archive and the archive_transaction_logs
+command).
+"""
+
+from django.conf import settings
+
+from backend.archive import TABLES, archive
+from backend.bulk_writer import BackgroundBulkWriter
+from tickets import timeline
+from .models import Payment, TransactionLog
+
+# Top-level and ``data`` keys kept from Paystack requests/responses/webhooks
+PAYLOAD_FIELDS = {
+    'status', 'message', 'event', 'reference', 'amount', 'currency', 'channel',
+    'gateway_response', 'paid_at', 'authorization_url', 'access_code', 'email',
+    'id', 'transaction',
+}
+METADATA_FIELDS = {'payment_id', 'ticket_id', 'is_bulk', 'ticket_count'}
+AUTHORIZATION_FIELDS = {'authorization_code', 'channel'}
+MAX_ERROR_LENGTH = 1000
+
+
+def _pick(data, fields):
+    return {key: value for key, value in data.items() if key in fields}
+
+
+def compact_payload(payload):
+    """Strip a gateway payload down to the fields worth keeping"""
+    if not isinstance(payload, dict):
+        return payload
+
+    compact = _pick(payload, PAYLOAD_FIELDS)
+    if isinstance(payload.get('metadata'), dict):
+        compact['metadata'] = _pick(payload['metadata'], METADATA_FIELDS)
+    if isinstance(payload.get('authorization'), dict):
+        compact['authorization'] = _pick(payload['authorization'], AUTHORIZATION_FIELDS)
+    if isinstance(payload.get('customer'), dict) and 'email' in payload['customer']:
+        compact['customer'] = {'email': payload['customer']['email']}
+    if 'data' in payload:
+        compact['data'] = compact_payload(payload['data'])
+    return compact
+
+
+def truncate_error(text):
+    text = text or ''
+    if len(text) > MAX_ERROR_LENGTH:
+        return text[:MAX_ERROR_LENGTH] + '...'
+    return text
+
+
+def invalidate_timelines(logs):
+    """New gateway events show on the timeline of every ticket their payment covers"""
+    payment_ids = {log.payment_id for log in logs if log.payment_id}
+    if payment_ids:
+        ticket_ids = Payment.tickets.through.objects.filter(
+            payment_id__in=payment_ids
+        ).values_list('ticket_id', flat=True).distinct()
+        timeline.invalidate(*ticket_ids)
+
+
+def _build_writer():
+    config = getattr(settings, 'TRANSACTION_LOG_WRITER', {})
+    return BackgroundBulkWriter(
+        'transaction-log',
+        batch_size=config.get('BATCH_SIZE', 200),
+        flush_interval=config.get('FLUSH_INTERVAL', 1.0),
+        max_queue=config.get('MAX_QUEUE', 10000),
+        async_writes=config.get('ASYNC', True),
+        on_insert=invalidate_timelines,
+    )
+
+
+writer = _build_writer()
+
+
+def log_transaction(transaction_type, payment=None, request_data=None, response_data=None,
+                    is_successful=False, error_message='', ip_address=None, user_agent=''):
+    """Queue a TransactionLog row with compacted payloads"""
+    log = TransactionLog(
+        payment=payment,
+        transaction_type=transaction_type,
+        request_data=compact_payload(request_data),
+        response_data=compact_payload(response_data),
+        is_successful=is_successful,
+        error_message=truncate_error(error_message),
+        ip_address=ip_address,
+        user_agent=user_agent,
+    )
+    writer.write(log)
+    return log
+
+
+def archive_logs(before, output_dir, batch_size=1000):
+    """Move logs older than ``before`` into ``<output_dir>/YYYY-MM-DD.jsonl.gz``"""
+    return archive(TABLES['transaction_logs'], before, output_dir, batch_size=batch_size)
@@ -2,18 +2,22 @@ from rest_framework import viewsets, generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
+from django.db.models import Count, Q, Sum
 from django.conf import settings
 
-from .models import Payment, PaymentPlan, TransactionLog
+from .models import Payment, PaymentPlan, PaymentRollup, TransactionLog
 from .serializers import (
     PaymentSerializer, PaymentPlanSerializer,
     InitializePaymentSerializer, PaystackCallbackSerializer
 )
 from .services import PaymentService
+from .pricing import plan_cache
+from .rollups import payment_methods, province_revenue, revenue_series
 from tickets.models import Ticket
 from users.permissions import IsAdmin
+from backend.replicas import read_from_replica
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
@@ -89,7 +93,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     payment, paystack_response = payment_service.create_bulk_payment(
                         tickets=tickets,
                         user=request.user,
-                        request=request
+                        request=request,
+                        payment_plan_id=serializer.validated_data.get('payment_plan_id')
                     )
                 
                 # --- CASE 2: SINGLE PAYMENT ---
@@ -113,7 +118,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     payment, paystack_response = payment_service.create_payment(
                         ticket=ticket,
                         user=request.user,
-                        request=request
+                        request=request,
+                        payment_plan_id=serializer.validated_data.get('payment_plan_id')
                     )
                 
                 return Response({
@@ -196,49 +202,81 @@ class PaymentPlanViewSet(viewsets.ModelViewSet):
         queryset = queryset.filter(valid_from__lte=now, valid_to__gte=now)
         
         return queryset.order_by('amount')
+    
+    def list(self, request, *args, **kwargs):
+        """List currently valid plans from the in-process plan cache"""
+        category = request.query_params.get('category')
+        now = timezone.now()
+        plans = [
+            plan for plan in plan_cache.get_plans()
+            if plan.valid_from <= now <= plan.valid_to
+            and (not category or plan.ticket_category in ('', category))
+        ]
+        
+        page = self.paginate_queryset(plans)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(plans, many=True)
+        return Response(serializer.data)
 
 
 class PaymentDashboardView(APIView):
     """Payment dashboard statistics"""
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
     
+    SERIES_WINDOWS = {
+        PaymentRollup.Granularity.DAY: timedelta(days=30),
+        PaymentRollup.Granularity.HOUR: timedelta(hours=48),
+    }
+    
+    @read_from_replica
     def get(self, request):
-        # Calculate statistics
-        total_payments = Payment.objects.count()
-        successful_payments = Payment.objects.filter(status=Payment.Status.SUCCESS).count()
-        pending_payments = Payment.objects.filter(status=Payment.Status.PENDING).count()
-        failed_payments = Payment.objects.filter(status=Payment.Status.FAILED).count()
-        
-        # Revenue calculations
-        total_revenue = Payment.objects.filter(status=Payment.Status.SUCCESS).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
+        # Overview in a single conditional-aggregation query; total_payments
+        # counts every status, cancelled and refunded included
+        overview = Payment.objects.aggregate(
+            total_payments=Count('id'),
+            successful_payments=Count('id', filter=Q(status=Payment.Status.SUCCESS)),
+            pending_payments=Count('id', filter=Q(status=Payment.Status.PENDING)),
+            failed_payments=Count('id', filter=Q(status=Payment.Status.FAILED)),
+            total_revenue=Sum('amount', filter=Q(status=Payment.Status.SUCCESS)),
+        )
+        total_payments = overview['total_payments']
+        successful_payments = overview['successful_payments']
+        total_revenue = overview['total_revenue'] or 0
         
         # Recent payments
-        recent_payments = Payment.objects.filter(status=Payment.Status.SUCCESS).order_by('-completed_at')[:10]
+        recent_payments = Payment.objects.filter(status=Payment.Status.SUCCESS).select_related(
+            'ticket__registered_by', 'ticket__approved_by'
+        ).order_by('-completed_at')[:10]
         
-        # Payment method breakdown
-        payment_methods = Payment.objects.filter(status=Payment.Status.SUCCESS).values(
-            'payment_method'
-        ).annotate(
-            count=Count('id'),
-            total=Sum('amount')
-        ).order_by('-total')
+        # Trends and province split come from the pre-aggregated rollups
+        granularity = request.query_params.get('granularity', PaymentRollup.Granularity.DAY)
+        if granularity not in self.SERIES_WINDOWS:
+            granularity = PaymentRollup.Granularity.DAY
+        since = timezone.now() - self.SERIES_WINDOWS[granularity]
         
         data = {
             'overview': {
                 'total_payments': total_payments,
                 'successful_payments': successful_payments,
-                'pending_payments': pending_payments,
-                'failed_payments': failed_payments,
+                'pending_payments': overview['pending_payments'],
+                'failed_payments': overview['failed_payments'],
                 'success_rate': (successful_payments / total_payments * 100) if total_payments > 0 else 0,
             },
             'revenue': {
                 'total': float(total_revenue),
                 'formatted_total': f"₦{total_revenue:,.2f}",
             },
-            'payment_methods': list(payment_methods),
+            # The method split comes from the rollups
+            'payment_methods': payment_methods(),
             'recent_payments': PaymentSerializer(recent_payments, many=True).data,
+            'series': {
+                'granularity': granularity,
+                'points': revenue_series(granularity, since),
+            },
+            'provinces': province_revenue(),
         }
         
         return Response(data)
@@ -258,8 +296,14 @@ class PaystackWebhookView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verify signature (implement proper verification)
+        # Verify signature against the raw body (read it before request.data)
         payment_service = PaymentService()
+        if not payment_service.paystack.verify_webhook_signature(request.body, signature):
+            return Response(
+                {'error': 'Invalid signature'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         success = payment_service.handle_webhook(request.data, signature)
         
         if success:
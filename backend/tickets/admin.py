@@ -3,6 +3,9 @@ from django.http import HttpResponse
 from django.utils import timezone
 import openpyxl
 from openpyxl.styles import Font, PatternFill
+from backend import response_cache
+from backend.metrics import registry as metrics
+from backend.replicas import read_from_replica
 from .models import Ticket, BulkUpload, TicketAuditLog, CheckInRecord
 
 
@@ -69,6 +72,7 @@ class TicketAdmin(admin.ModelAdmin):
         return "-"
     proof_link.short_description = "Proof of Payment"
     
+    @read_from_replica
     def export_to_excel(self, request, queryset):
         """Export selected tickets to Excel"""
         # Create workbook
@@ -153,6 +157,8 @@ class TicketAdmin(admin.ModelAdmin):
             approved_at=timezone.now(),
             approved_by=request.user
         )
+        metrics.incr('tickets.approved', updated)
+        response_cache.invalidate_queryset(queryset)
         self.message_user(request, f'{updated} ticket(s) approved successfully.')
     
     approve_tickets.short_description = "Approve selected tickets"
@@ -162,6 +168,7 @@ class TicketAdmin(admin.ModelAdmin):
         updated = queryset.filter(status=Ticket.Status.PENDING).update(
             status=Ticket.Status.REJECTED
         )
+        response_cache.invalidate_queryset(queryset)
         self.message_user(request, f'{updated} ticket(s) rejected.')
     
     reject_tickets.short_description = "Reject selected tickets"
@@ -0,0 +1,171 @@
+"""
+Field-level ticket audit records.
+
+Tickets remember the column values they were loaded with (see
+``Ticket.from_db``), so an update is audited by comparing the in-memory
+instance against that state: no re-fetch, no serializer, and only the
+fields that changed are stored. Loading only keeps a reference to the raw
+row; the baseline is built the first time it is needed, so list pages and
+exports that never save pay nothing for it. A ticket's create/bulk-upload record holds
+every field that differs from its model default, so any historical version
+can be rebuilt by replaying the records in order (``reconstruct``).
+"""
+
+import datetime
+import decimal
+import functools
+import uuid
+
+from django.db.models import DEFERRED, FileField
+
+# Bookkeeping columns the audit timestamp already covers (generated columns
+# are derived from the others and skipped too)
+IGNORED_FIELDS = {'created_at', 'updated_at'}
+
+_MISSING = object()
+
+
+@functools.cache
+def _audited_fields(model):
+    return tuple(
+        field for field in model._meta.concrete_fields
+        if field.name not in IGNORED_FIELDS and not field.primary_key and not field.generated
+    )
+
+
+@functools.cache
+def _audited_by_attname(model):
+    return {field.attname: field for field in _audited_fields(model)}
+
+
+def to_json(value):
+    """Convert a model value to what the audit JSON column stores"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return str(value)
+
+
+def _field_value(field, value):
+    # Empty files are '' in the database but FieldFile(None) in memory
+    if isinstance(field, FileField):
+        return getattr(value, 'name', value) or None
+    return to_json(value)
+
+
+def _static_default(field):
+    """Field default when it is a constant, otherwise _MISSING"""
+    if field.has_default() and callable(field.default):
+        return _MISSING
+    return _field_value(field, field.get_default())
+
+
+def capture(instance):
+    """Remember the instance's current values as its audit baseline"""
+    instance.__dict__.pop('_audit_row', None)
+    instance._audit_state = {
+        field.attname: _field_value(field, instance.__dict__[field.attname])
+        for field in _audited_fields(type(instance))
+        if field.attname in instance.__dict__
+    }
+
+
+def load_state(instance, field_names, values):
+    """Keep the raw row passed to ``Model.from_db``; ``state`` builds the baseline from it"""
+    instance._audit_row = (field_names, values)
+
+
+def state(instance):
+    """The instance's audit baseline ({attname: value}), or None without one"""
+    row = instance.__dict__.pop('_audit_row', None)
+    if row is not None:
+        audited = _audited_by_attname(type(instance))
+        instance._audit_state = {
+            name: _field_value(audited[name], value) for name, value in zip(*row)
+            if name in audited and value is not DEFERRED
+        }
+    return instance.__dict__.get('_audit_state')
+
+
+def creation_values(instance):
+    """Values worth storing for a new row: everything that isn't the default"""
+    values = {}
+    for field in _audited_fields(type(instance)):
+        value = _field_value(field, getattr(instance, field.attname))
+        if value != _static_default(field):
+            values[field.name] = value
+    capture(instance)
+    return values
+
+
+def changes(instance):
+    """
+    Return ``(old_values, new_values)`` for fields changed since the
+    instance was loaded (or last audited), and reset the baseline.
+
+    Deferred fields that were never loaded are not compared.
+    """
+    baseline = state(instance)
+    if baseline is None:
+        capture(instance)
+        return {}, {}
+
+    old_values, new_values = {}, {}
+    for field in _audited_fields(type(instance)):
+        if field.attname not in baseline or field.attname not in instance.__dict__:
+            continue
+        current = _field_value(field, instance.__dict__[field.attname])
+        if current != baseline[field.attname]:
+            old_values[field.name] = baseline[field.attname]
+            new_values[field.name] = current
+    capture(instance)
+    return old_values, new_values
+
+
+def _initial_state(model):
+    return {
+        field.name: None if _static_default(field) is _MISSING else _static_default(field)
+        for field in _audited_fields(model)
+    }
+
+
+def _replay(state, new_values):
+    # Older records stored full serializer output; ignore non-field keys
+    for key, value in (new_values or {}).items():
+        if key in state:
+            state[key] = value
+    return state
+
+
+def reconstruct(ticket, at=None):
+    """
+    Rebuild the ticket's field values as of ``at`` (default: latest) by
+    replaying its audit records from the first one onwards.
+
+    Fields absent from every replayed record keep their model default.
+    Returns None if the ticket had no audit records by then.
+    """
+    from .models import TicketAuditLog
+
+    logs = TicketAuditLog.objects.filter(ticket=ticket)
+    if at is not None:
+        logs = logs.filter(timestamp__lte=at)
+
+    state = None
+    for new_values in logs.order_by('timestamp', 'id').values_list('new_values', flat=True):
+        state = _replay(state or _initial_state(type(ticket)), new_values)
+    return state
+
+
+def history(ticket):
+    """Every audit record for the ticket paired with the version it produced"""
+    from .models import TicketAuditLog
+
+    records = TicketAuditLog.objects.filter(ticket=ticket).select_related('user').order_by('timestamp', 'id')
+    state = _initial_state(type(ticket))
+    return [(record, dict(_replay(state, record.new_values))) for record in records]
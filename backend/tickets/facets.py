@@ -0,0 +1,90 @@
+"""
+Facet counts for the ticket list filter sidebar.
+
+One grouped query counts the tickets in every (status, category, gender,
+province, payment_status) combination the user can see; each facet's
+counts are then summed from those rows in Python, applying the filters
+selected on the *other* facets, so every option shows how many tickets
+picking it would give. Without a free-text search the combination counts
+are cached under the user's response-cache scope version (see
+backend.response_cache), so they are recomputed only after a ticket write
+in that scope.
+"""
+
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from backend import response_cache
+from backend.instrumentation import cache_lookup
+from users.models import User
+from .models import Ticket
+
+# Query parameter / column name -> its choices
+FACETS = {
+    'status': Ticket.Status,
+    'category': Ticket.Category,
+    'gender': Ticket.Gender,
+    'province': User.Province,
+    'payment_status': Ticket.PaymentStatus,
+}
+
+
+def selected(params):
+    """Facet filters chosen in the query string"""
+    return {facet: params[facet] for facet in FACETS if params.get(facet)}
+
+
+def combinations(queryset):
+    """``[(values tuple in FACETS order, ticket count), ...]`` in one grouped query"""
+    rows = queryset.order_by().values_list(*FACETS).annotate(count=Count('pk'))
+    return [(tuple(row[:-1]), row[-1]) for row in rows]
+
+
+def cached_combinations(queryset, request):
+    """``combinations`` through the cache, keyed by the user's scope version"""
+    prefix = response_cache.scope_key('ticket-facets', request.user)
+    if prefix is None:
+        return combinations(queryset)
+    key = f'{prefix}:{request.path}'
+    rows = cache.get(key)
+    cache_lookup(rows is not None)
+    if rows is None:
+        rows = combinations(queryset)
+        cache.set(key, rows, response_cache.timeout())
+    return rows
+
+
+def counts(rows, chosen):
+    """Per-facet option counts, each under the filters chosen on the other facets"""
+    names = list(FACETS)
+    totals = {facet: defaultdict(int) for facet in names}
+    for values, count in rows:
+        misses = [facet for facet, value in zip(names, values) if facet in chosen and chosen[facet] != value]
+        for position, facet in enumerate(names):
+            # A row counts for a facet if every other chosen filter matches it
+            if not misses or misses == [facet]:
+                totals[facet][values[position]] += count
+
+    result = {}
+    for facet in names:
+        labels = dict(FACETS[facet].choices)
+        options = totals[facet]
+        if facet in chosen:
+            options.setdefault(chosen[facet], 0)
+        order = list(labels) + sorted(value for value in options if value not in labels)
+        result[facet] = [
+            {'value': value, 'label': labels.get(value, value), 'count': options[value]}
+            for value in order if value in options
+        ]
+    return result
+
+
+def facet_counts(queryset, request, search_active=False):
+    """
+    Facet counts for ``queryset`` (the user's tickets, searched but not
+    yet narrowed by any facet filter).
+    """
+    rows = combinations(queryset) if search_active else cached_combinations(queryset, request)
+    return counts(rows, selected(request.query_params))
@@ -0,0 +1,100 @@
+"""
+Django management command to compare offset and keyset audit-log pagination
+Usage: python manage.py benchmark_audit_pagination [--rows 1000000] [--pages 1,500]
+
+Seeds TicketAuditLog rows (reused between runs, removed with --cleanup) and
+times TicketAuditLogView at each page with PageNumberPagination and with
+KeysetPagination.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.benchmarking import StepRecorder, format_table
+from backend.pagination import KeysetPagination
+from tickets.models import TicketAuditLog
+from tickets.views import TicketAuditLogView
+from users.models import User
+
+SEED_MARKER = 'benchmark-audit-seed'
+
+
+class OffsetAuditLogView(TicketAuditLogView):
+    """The view as it was before keyset pagination"""
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('-timestamp', '-id')
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks offset vs keyset pagination of ticket audit logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--pages', default='1,500', help='Comma-separated page numbers')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        admin, _ = User.objects.get_or_create(
+            username='bench_audit_admin',
+            defaults={'email': 'bench_audit_admin@example.com', 'role': User.Role.ADMIN},
+        )
+        self._seed(admin, options['rows'])
+        # Seeding can fill the debug query log, which would zero the query counts
+        reset_queries()
+
+        factory = APIRequestFactory()
+        recorder = StepRecorder()
+        size = options['page_size']
+        ordered = TicketAuditLog.objects.order_by('-timestamp', '-id')
+
+        for page in [int(value) for value in options['pages'].split(',')]:
+            cursor = None
+            if page > 1:
+                # Position of the last row on the previous page (setup, not timed)
+                position = ordered.values_list('timestamp', 'id')[(page - 1) * size - 1]
+                cursor = KeysetPagination().encode_cursor(position)
+
+            for _ in range(options['repeat']):
+                for label, view, params in (
+                    ('offset', OffsetAuditLogView.as_view(), {'page': page, 'page_size': size}),
+                    ('keyset', TicketAuditLogView.as_view(), {'cursor': cursor, 'page_size': size} if cursor else {'page_size': size}),
+                ):
+                    request = factory.get('/api/audit-logs/', params)
+                    force_authenticate(request, user=admin)
+                    with recorder.step(f'{label} page {page}'):
+                        response = view(request)
+                        response.render()
+                    assert response.status_code == 200, response.data
+
+        self.stdout.write(format_table(recorder.summary()))
+
+        if options['cleanup']:
+            deleted, _ = TicketAuditLog.objects.filter(user_agent=SEED_MARKER).delete()
+            admin.delete()
+            self.stdout.write(f'Removed {deleted} seeded rows')
+
+    def _seed(self, admin, rows):
+        existing = TicketAuditLog.objects.filter(user_agent=SEED_MARKER).count()
+        missing = rows - existing
+        if missing <= 0:
+            return
+        self.stdout.write(f'Seeding {missing} audit log rows...')
+        actions = TicketAuditLog.ActionType.values
+        chunk = 10_000
+        for start in range(0, missing, chunk):
+            with transaction.atomic():
+                TicketAuditLog.objects.bulk_create([
+                    TicketAuditLog(
+                        user=admin,
+                        action=actions[n % len(actions)],
+                        new_values={'status': 'pending'},
+                        user_agent=SEED_MARKER,
+                    )
+                    for n in range(start, min(start + chunk, missing))
+                ])
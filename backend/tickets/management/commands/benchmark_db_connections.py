@@ -0,0 +1,112 @@
+"""
+Django management command to compare request latency by connection handling
+Usage: python manage.py benchmark_db_connections [--requests 300] [--concurrency 4] [--path /api/tickets/?page_size=20]
+
+Sends authenticated GETs through Django's WSGI handler (request_finished
+closes or keeps connections exactly as under gunicorn) from --concurrency
+threads, with a new connection per request (CONN_MAX_AGE=0), persistent
+health-checked connections and, on PostgreSQL with psycopg 3, a pool sized
+like one gunicorn worker's. The response cache is off so every request
+reaches the database.
+"""
+
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend import db_pool
+from backend.benchmarking import percentile
+from users.authentication import stamp_claims
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks request latency with new, persistent and pooled database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--path', default='/api/tickets/?page_size=20')
+
+    def handle(self, *args, **options):
+        admin, _ = User.objects.get_or_create(
+            username='bench_conn_admin',
+            defaults={'email': 'bench_conn_admin@example.com', 'role': User.Role.ADMIN,
+                      'first_name': 'Bench', 'last_name': 'Admin'},
+        )
+        token = str(stamp_claims(AccessToken.for_user(admin), admin))
+        path, _, query = options['path'].partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Bearer {token}', 'wsgi.url_scheme': 'http',
+        }
+        database = connections.settings['default']
+        connections.close_all()
+
+        modes = [('new per request', {'CONN_MAX_AGE': 0}),
+                 ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True})]
+        if connections['default'].vendor == 'postgresql' and db_pool.pooling_available():
+            pool = db_pool.pool_options(1, options['concurrency'])
+            modes.append(('pooled', {'CONN_MAX_AGE': 0, 'OPTIONS': {**database.get('OPTIONS', {}), 'pool': pool}}))
+        else:
+            self.stdout.write('Pooling skipped: needs PostgreSQL and psycopg 3 with psycopg_pool')
+
+        self.stdout.write(
+            f"{'mode':<18}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'connects':>10}"
+        )
+        original = {key: database.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+        try:
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                handler = WSGIHandler()
+                for label, changes in modes:
+                    database.update(changes)
+                    self._run(label, handler, environ, options)
+                    if hasattr(connections['default'], 'close_pool'):
+                        connections['default'].close_pool()
+        finally:
+            database.update(original)
+
+    def _run(self, label, handler, environ, options):
+        connects = []
+        lock = threading.Lock()
+
+        def count(sender, connection, **kwargs):
+            with lock:
+                connects.append(connection.alias)
+
+        def worker(n):
+            latencies = []
+            for _ in range(n):
+                started = time.perf_counter()
+                response = handler(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda *args: None)
+                # Fires request_finished, which closes or keeps the connection
+                response.close()
+                latencies.append(time.perf_counter() - started)
+            connections.close_all()
+            return latencies
+
+        concurrency = options['concurrency']
+        per_thread = max(options['requests'] // concurrency, 1)
+        connection_created.connect(count)
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                latencies = [value for chunk in executor.map(worker, [per_thread] * concurrency) for value in chunk]
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count)
+
+        self.stdout.write(
+            f'{label:<18}{len(latencies):>9}{len(latencies) / elapsed:>9.1f}'
+            f'{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 95) * 1000:>9.2f}'
+            f'{percentile(latencies, 99) * 1000:>9.2f}{len(connects):>10}'
+        )
@@ -0,0 +1,153 @@
+"""
+Django management command to compare how ticket verification scales with concurrency in one process
+Usage: python manage.py benchmark_scan_concurrency [--requests 400] [--concurrency 1 8 32] [--threads 4] [--db-latency-ms 5]
+
+Sends the same verification through the sync TicketViewSet action under
+Django's WSGI handler, from --threads threads (one gthread worker), and
+through the async view (tickets.scan) under the ASGI handler, with the
+given number of requests in flight on one event loop. --db-latency-ms
+adds a sleep to every query, standing in for a database across a
+network; at 0 SQLite answers in microseconds and both paths are bound by
+this process's CPU.
+"""
+
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from backend.benchmarking import percentile
+from tickets.models import Ticket
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks sync (WSGI) against async (ASGI) ticket verification at several concurrencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--threads', type=int, default=4, help='Threads of the sync (gthread) worker')
+        parser.add_argument('--db-latency-ms', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        admin, _ = User.objects.get_or_create(
+            username='bench_scan_admin',
+            defaults={'email': 'bench_scan_admin@example.com', 'role': User.Role.ADMIN,
+                      'first_name': 'Bench', 'last_name': 'Admin'},
+        )
+        ticket = Ticket.objects.filter(ticket_id='BENCH-SCAN-1').first() or Ticket.objects.create(
+            ticket_id='BENCH-SCAN-1', full_name='Bench Scan', age=15, category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.MALE, phone='+2348012345679', province=User.Province.LAGOS_PROVINCE_9,
+            zone='Zone A', area='Area 1', parish='Parish', emergency_contact='Parent',
+            emergency_phone='+2348023456789', emergency_relationship='Father', parent_name='Parent',
+            parent_email='parent@example.com', parent_phone='+2348023456789', parent_relationship='Father',
+            status=Ticket.Status.APPROVED, approved_by=admin,
+        )
+        query = f'code=RCCG-{ticket.ticket_id}'.encode()
+        latency = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # At the bottom: the request's execute_wrapper() blocks pop from the top
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, slow_query)
+
+        connections.close_all()
+        self.stdout.write(
+            f"{'mode':<28}{'in flight':>10}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        )
+        if latency:
+            connection_created.connect(add_latency)
+        try:
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                wsgi, asgi = WSGIHandler(), ASGIHandler()
+                for concurrency in options['concurrency']:
+                    self._report(f"sync, {options['threads']} threads", concurrency,
+                                 *self._run_wsgi(wsgi, query, concurrency, options))
+                    self._report('async (ASGI)', concurrency, *asyncio.run(
+                        self._run_asgi(asgi, query, concurrency, options['requests'])
+                    ))
+        finally:
+            connection_created.disconnect(add_latency)
+            connections.close_all()
+
+    def _run_wsgi(self, handler, query, concurrency, options):
+        """``concurrency`` clients sharing one worker's ``--threads`` threads"""
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/tickets/verify/', 'QUERY_STRING': query.decode(),
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http',
+        }
+
+        def request(submitted):
+            response = handler(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda *args: None)
+            response.close()
+            return time.perf_counter() - submitted
+
+        def client(executor, n):
+            # Latency as the client sees it: queueing for a thread included
+            return [executor.submit(request, time.perf_counter()).result() for _ in range(n)]
+
+        per_client = max(options['requests'] // concurrency, 1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                chunks = clients.map(lambda _: client(executor, per_client), range(concurrency))
+                latencies = [value for chunk in chunks for value in chunk]
+            executor.submit(connections.close_all).result()
+        return latencies, time.perf_counter() - started
+
+    async def _run_asgi(self, handler, query, concurrency, requests):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/scan/verify/', 'raw_path': b'/api/scan/verify/',
+            'query_string': query, 'root_path': '', 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+
+        async def request():
+            sent = []
+            received = False
+            disconnect = asyncio.Event()
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            started = time.perf_counter()
+            await handler(dict(scope), receive, send)
+            disconnect.set()
+            if sent[0]['status'] != 200:
+                raise RuntimeError(f"/api/scan/verify/ answered {sent[0]['status']}")
+            return time.perf_counter() - started
+
+        async def client(n):
+            return [await request() for _ in range(n)]
+
+        per_client = max(requests // concurrency, 1)
+        started = time.perf_counter()
+        chunks = await asyncio.gather(*(client(per_client) for _ in range(concurrency)))
+        return [value for chunk in chunks for value in chunk], time.perf_counter() - started
+
+    def _report(self, label, concurrency, latencies, elapsed):
+        self.stdout.write(
+            f'{label:<28}{concurrency:>10}{len(latencies):>9}{len(latencies) / elapsed:>9.1f}'
+            f'{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 95) * 1000:>9.2f}'
+        )
@@ -0,0 +1,132 @@
+"""
+Django management command to measure the ticket list payload
+Usage: python manage.py benchmark_ticket_list [--tickets 1000] [--page-size 100] [--repeat 20] [--cleanup]
+
+Seeds tickets registered and approved by a handful of users (reused between
+runs, removed with --cleanup) and renders one page of the ticket list as it
+was before projection (full serializer, no joins), in full, compact and
+with a sparse ?fields= set, reporting response size, queries and time.
+"""
+
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.benchmarking import StepRecorder, format_table
+from tickets.models import Ticket
+from tickets.serializers import TicketSerializer
+from tickets.views import TicketViewSet
+from users.models import User
+
+SEED_PREFIX = 'TKT-LIST-'
+VARIANTS = [
+    ('legacy', {}),
+    ('full', {}),
+    ('compact', {'compact': 'true'}),
+    ('fields', {'fields': 'id,ticket_id,full_name,status,registered_by_name'}),
+]
+
+
+class LegacyListViewSet(TicketViewSet):
+    """TicketViewSet as it listed tickets before projection"""
+
+    def get_serializer(self, *args, **kwargs):
+        return TicketSerializer(*args, context=self.get_serializer_context(), **kwargs)
+
+    def project(self, queryset):
+        return queryset
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks ticket list payload size, queries and render time per representation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded tickets afterwards')
+
+    def handle(self, *args, **options):
+        admin, _ = User.objects.get_or_create(
+            username='bench_list_admin',
+            defaults={'email': 'bench_list_admin@example.com', 'role': User.Role.ADMIN,
+                      'first_name': 'Bench', 'last_name': 'Admin'},
+        )
+        registrars = [
+            User.objects.get_or_create(
+                username=f'bench_list_coord{n}',
+                defaults={'email': f'bench_list_coord{n}@example.com', 'role': User.Role.COORDINATOR,
+                          'first_name': 'Coordinator', 'last_name': str(n)},
+            )[0]
+            for n in range(10)
+        ]
+        self._seed(admin, registrars, options['tickets'])
+        # Seeding can fill the debug query log, which would zero the query counts
+        reset_queries()
+
+        factory = APIRequestFactory()
+        recorder = StepRecorder()
+        sizes = {}
+        for _ in range(options['repeat']):
+            for label, params in VARIANTS:
+                viewset = LegacyListViewSet if label == 'legacy' else TicketViewSet
+                request = factory.get('/api/tickets/', {'page_size': options['page_size'], **params})
+                force_authenticate(request, user=admin)
+                with recorder.step(label):
+                    response = viewset.as_view({'get': 'list'}, pagination_class=self._pagination(options))(request)
+                    response.render()
+                assert response.status_code == 200, response.data
+                sizes[label] = len(response.content)
+
+        self.stdout.write(format_table(recorder.summary()))
+        for label, _ in VARIANTS:
+            self.stdout.write(f'{label:<24}{sizes[label]:>10} bytes')
+
+        if options['cleanup']:
+            deleted, _ = Ticket.objects.filter(ticket_id__startswith=SEED_PREFIX).delete()
+            User.objects.filter(pk__in=[admin.pk, *(user.pk for user in registrars)]).delete()
+            self.stdout.write(f'Removed {deleted} seeded tickets')
+
+    def _pagination(self, options):
+        base = TicketViewSet.pagination_class
+        return type('BenchmarkPagination', (base,), {'page_size': options['page_size']})
+
+    def _seed(self, admin, registrars, count):
+        existing = Ticket.objects.filter(ticket_id__startswith=SEED_PREFIX).count()
+        if existing >= count:
+            return
+        self.stdout.write(f'Seeding {count - existing} tickets...')
+        rng = random.Random(existing)
+        with transaction.atomic():
+            Ticket.objects.bulk_create([
+                Ticket(
+                    ticket_id=f'{SEED_PREFIX}{n:07d}',
+                    full_name=f'Teen {n}',
+                    age=rng.randint(13, 19),
+                    category=Ticket.Category.TEENS,
+                    gender=rng.choice(Ticket.Gender.values),
+                    phone=f'+23480{rng.randint(10_000_000, 99_999_999)}',
+                    email=f'teen{n}@example.com',
+                    province=rng.choice(User.Province.values),
+                    zone=f'Zone {rng.randint(1, 12)}',
+                    area=f'Area {rng.randint(1, 40)}',
+                    parish=f'Parish {rng.randint(1, 200)}',
+                    medical_conditions='Mild asthma; carries an inhaler. Allergic to peanuts.',
+                    medications='Salbutamol inhaler as needed',
+                    dietary_restrictions='No peanuts',
+                    emergency_contact='Parent Guardian',
+                    emergency_phone='+2348023456789',
+                    emergency_relationship='Mother',
+                    parent_name='Parent Guardian',
+                    parent_email='parent@example.com',
+                    parent_phone='+2348023456789',
+                    parent_relationship='Mother',
+                    notes='Arriving with the parish bus',
+                    status=Ticket.Status.APPROVED,
+                    registered_by=rng.choice(registrars),
+                    approved_by=admin,
+                )
+                for n in range(existing, count)
+            ], batch_size=1000)
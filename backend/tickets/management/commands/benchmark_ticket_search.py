@@ -0,0 +1,105 @@
+"""
+Django management command to compare legacy and indexed ticket search
+Usage: python manage.py benchmark_ticket_search [--tickets 100000] [--repeat 5] [--cleanup]
+
+Seeds tickets (reused between runs, removed with --cleanup) and times a
+paginated TicketViewSet search with the old SearchFilter (icontains over
+eight columns) and with TicketSearchFilter.
+"""
+
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+from rest_framework import filters
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.benchmarking import StepRecorder, format_table
+from tickets.models import Ticket
+from tickets.views import TicketViewSet
+from users.models import User
+
+SEED_PREFIX = 'TKT-SRCH-'
+FIRST_NAMES = ['Adewale', 'Ada', 'Chinedu', 'Funmi', 'Tunde', 'Kemi', 'Emeka', 'Ngozi', 'Segun', 'Bisi',
+               'Ifeanyi', 'Yemi', 'Tola', 'Uche', 'Damilola', 'Femi', 'Amaka', 'Bola', 'Dayo', 'Zainab']
+LAST_NAMES = ['Johnson', 'Obi', 'Bakare', 'Okafor', 'Adeyemi', 'Balogun', 'Eze', 'Ogunleye', 'Nwosu',
+              'Adebayo', 'Olawale', 'Ibrahim', 'Okonkwo', 'Akinola', 'Chukwu', 'Fashola', 'Oyelaran']
+QUERIES = ['ade', 'amaka obi', 'TKT-SRCH-0004242', 'grace', 'zone 3', '+23480123', 'nobodyhere']
+
+
+class LegacySearchViewSet(TicketViewSet):
+    """TicketViewSet as it searched before the indexed backend"""
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ['full_name', 'ticket_id', 'email', 'phone', 'province', 'zone', 'area', 'parish']
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks legacy icontains search against the indexed ticket search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded tickets afterwards')
+
+    def handle(self, *args, **options):
+        admin, _ = User.objects.get_or_create(
+            username='bench_search_admin',
+            defaults={'email': 'bench_search_admin@example.com', 'role': User.Role.ADMIN},
+        )
+        self._seed(admin, options['tickets'])
+        # Seeding can fill the debug query log, which would zero the query counts
+        reset_queries()
+
+        factory = APIRequestFactory()
+        recorder = StepRecorder()
+        for query in QUERIES:
+            for _ in range(options['repeat']):
+                for label, viewset in (('legacy', LegacySearchViewSet), ('indexed', TicketViewSet)):
+                    request = factory.get('/api/tickets/', {'search': query})
+                    force_authenticate(request, user=admin)
+                    with recorder.step(f'{label} {query!r}'):
+                        response = viewset.as_view({'get': 'list'})(request)
+                        response.render()
+                    assert response.status_code == 200, response.data
+
+        self.stdout.write(format_table(recorder.summary()))
+
+        if options['cleanup']:
+            deleted, _ = Ticket.objects.filter(ticket_id__startswith=SEED_PREFIX).delete()
+            admin.delete()
+            self.stdout.write(f'Removed {deleted} seeded tickets')
+
+    def _seed(self, admin, count):
+        existing = Ticket.objects.filter(ticket_id__startswith=SEED_PREFIX).count()
+        if existing >= count:
+            return
+        self.stdout.write(f'Seeding {count - existing} tickets...')
+        rng = random.Random(existing)
+        provinces = User.Province.values
+        chunk = 5_000
+        for start in range(existing, count, chunk):
+            with transaction.atomic():
+                Ticket.objects.bulk_create([
+                    Ticket(
+                        ticket_id=f'{SEED_PREFIX}{n:07d}',
+                        full_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                        age=rng.randint(13, 19),
+                        category=Ticket.Category.TEENS,
+                        gender=rng.choice(Ticket.Gender.values),
+                        phone=f'+23480{rng.randint(10_000_000, 99_999_999)}',
+                        email=f'teen{n}@example.com' if n % 3 else None,
+                        province=rng.choice(provinces),
+                        zone=f'Zone {rng.randint(1, 12)}',
+                        area=f'Area {rng.randint(1, 40)}',
+                        parish=f'{rng.choice(["Grace", "Glory", "Faith", "Mercy", "Victory"])} Parish {rng.randint(1, 200)}',
+                        emergency_contact='Parent',
+                        emergency_phone='+2348023456789',
+                        emergency_relationship='Parent',
+                        parent_name='Parent',
+                        parent_email='parent@example.com',
+                        parent_phone='+2348023456789',
+                        parent_relationship='Parent',
+                        registered_by=admin,
+                    )
+                    for n in range(start, min(start + chunk, count))
+                ])
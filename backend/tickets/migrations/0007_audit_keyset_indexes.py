@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_alter_ticket_proof_of_payment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticketauditlog',
+            name='tickets_tic_ticket__56257e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ticketauditlog',
+            name='tickets_tic_user_id_cffc8e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ticketauditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='ticketaudit_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketauditlog',
+            index=models.Index(fields=['ticket', 'timestamp', 'id'], name='ticketaudit_ticket_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketauditlog',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='ticketaudit_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketauditlog',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='ticketaudit_action_time_idx'),
+        ),
+    ]
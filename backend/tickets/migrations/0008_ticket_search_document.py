@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:43
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# PostgreSQL: word-prefix search over a tsvector, substring search over trigrams.
+# SQLite gets an FTS5 table from tickets.search.install_sqlite_fts (post_migrate).
+POSTGRES_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ticket_search_tsv_idx ON tickets_ticket "
+    "USING gin (to_tsvector('simple', search_document))",
+    "CREATE INDEX IF NOT EXISTS ticket_search_trgm_idx ON tickets_ticket "
+    "USING gin (search_document gin_trgm_ops)",
+]
+POSTGRES_REVERSE_SQL = [
+    "DROP INDEX IF EXISTS ticket_search_trgm_idx",
+    "DROP INDEX IF EXISTS ticket_search_tsv_idx",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_REVERSE_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_audit_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='search_document',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Concat('ticket_id', models.Value(' '), 'full_name', models.Value(' '), 'email', models.Value(' '), 'phone', models.Value(' '), 'province', models.Value(' '), 'zone', models.Value(' '), 'area', models.Value(' '), 'parish')), output_field=models.TextField()),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_ticket_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticketauditlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 from django.utils import timezone
 import uuid
 from users.models import User
+from . import audit
 
 
 class Ticket(models.Model):
@@ -124,16 +127,30 @@ class Ticket(models.Model):
         choices=PaymentStatus.choices,
         default=PaymentStatus.UNPAID
     )
+
+    # Lower-cased text the ticket search matches against (see tickets.search);
+    # computed by the database so save(), bulk_create() and update() keep it current
+    search_document = models.GeneratedField(
+        expression=Lower(Concat(
+            'ticket_id', Value(' '), 'full_name', Value(' '), 'email', Value(' '), 'phone', Value(' '),
+            'province', Value(' '), 'zone', Value(' '), 'area', Value(' '), 'parish',
+        )),
+        output_field=models.TextField(),
+        db_persist=True,
+    )
     
     class Meta:
         ordering = ['-registered_at']
         indexes = [
             models.Index(fields=['ticket_id']),
-            models.Index(fields=['status']),
             models.Index(fields=['province']),
             models.Index(fields=['category']),
             models.Index(fields=['registered_by']),
-            models.Index(fields=['registered_at']),
+            # Keyset pages for each list ordering (id breaks ties)
+            models.Index(fields=['registered_at', 'id'], name='ticket_registered_id_idx'),
+            models.Index(fields=['full_name', 'id'], name='ticket_name_id_idx'),
+            models.Index(fields=['age', 'id'], name='ticket_age_id_idx'),
+            models.Index(fields=['status', 'id'], name='ticket_status_id_idx'),
         ]
         verbose_name = 'Ticket'
         verbose_name_plural = 'Tickets'
@@ -141,6 +158,13 @@ class Ticket(models.Model):
     def __str__(self):
         return f"{self.ticket_id} - {self.full_name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Keep the loaded values so audit records can store only what changed"""
+        instance = super().from_db(db, field_names, values)
+        audit.load_state(instance, field_names, values)
+        return instance
+    
     def save(self, *args, **kwargs):
         """Generate ticket ID on first save"""
         if not self.ticket_id:
@@ -254,13 +278,19 @@ class TicketAuditLog(models.Model):
     new_values = models.JSONField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by audit_buffer.record() when the change happens, not when the
+    # buffered row is finally inserted
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
+        # Every filter the audit log view supports, followed by the
+        # (timestamp, id) keyset it pages on
         indexes = [
-            models.Index(fields=['ticket', 'timestamp']),
-            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['timestamp', 'id'], name='ticketaudit_time_idx'),
+            models.Index(fields=['ticket', 'timestamp', 'id'], name='ticketaudit_ticket_time_idx'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='ticketaudit_user_time_idx'),
+            models.Index(fields=['action', 'timestamp', 'id'], name='ticketaudit_action_time_idx'),
         ]
     
     def __str__(self):
@@ -0,0 +1,227 @@
+"""
+Async fast path for the gate scanners: ticket verification and check-in.
+
+``verify`` and ``check_in`` answer exactly like the TicketViewSet actions
+of the same names, but are plain async Django views. The ticket comes from
+the async ORM in one query (users joined), authentication checks the JWT
+claims and the revocation keys through backend.async_cache, and nothing
+waits on a thread while the database or Redis answers. Under an ASGI
+worker (see gunicorn.conf.py) a process keeps serving other scans while
+one waits; under WSGI they still work, one request per thread.
+
+The lookup rules and response bodies are shared with the sync actions.
+"""
+
+import json
+import uuid
+
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+from users.authentication import ClaimsJWTAuthentication, acached_user_row
+from users.models import User
+from users.views import trusted_client_ip
+from .models import CheckInRecord, Ticket
+
+NO_METHOD = 'No verification method provided. Use code, ticket_id, or qr_data parameter.'
+
+
+def verification_lookups(code=None, ticket_id=None, qr_data=None):
+    """
+    ``(lookups, error, status)``: the ``(field, value)`` lookups to try in
+    order, and the error and status to answer with when none matches (or,
+    with no lookups, straight away).
+    """
+    if qr_data:
+        # Format: RCCG_TICKET:{ticket_id}:{full_name}:{status}
+        if qr_data.startswith('RCCG_TICKET:'):
+            parts = qr_data.split(':')
+            if len(parts) < 2:
+                return [], 'Invalid QR code format', 400
+            return [('ticket_id', parts[1]), ('id', parts[1])], 'Ticket not found', 404
+        return [('ticket_id', qr_data), ('id', qr_data)], 'Invalid QR code', 404
+    if code:
+        # Format: RCCG-{ticket_id}, or the ticket ID itself
+        identifier = code[5:] if code.startswith('RCCG-') else code
+        return [('ticket_id', identifier)], 'Invalid verification code', 404
+    if ticket_id:
+        return [('ticket_id', ticket_id), ('id', ticket_id)], 'Ticket not found', 404
+    return [], NO_METHOD, 400
+
+
+def _valid_lookups(lookups):
+    """Drop ``id`` lookups that aren't UUIDs (they can't match)"""
+    valid = []
+    for field, value in lookups:
+        if field == 'id':
+            try:
+                uuid.UUID(str(value))
+            except ValueError:
+                continue
+        valid.append((field, value))
+    return valid
+
+
+def find_ticket(lookups):
+    queryset = Ticket.objects.select_related('registered_by', 'approved_by')
+    for field, value in _valid_lookups(lookups):
+        ticket = queryset.filter(**{field: value}).first()
+        if ticket is not None:
+            return ticket
+    return None
+
+
+async def afind_ticket(lookups):
+    queryset = Ticket.objects.select_related('registered_by', 'approved_by')
+    for field, value in _valid_lookups(lookups):
+        ticket = await queryset.filter(**{field: value}).afirst()
+        if ticket is not None:
+            return ticket
+    return None
+
+
+def verification_data(ticket):
+    """Body of a verify response for ``ticket`` (registered_by/approved_by loaded)"""
+    if ticket.status != Ticket.Status.APPROVED:
+        return {
+            'valid': False,
+            'error': 'Ticket not approved',
+            'ticket_id': ticket.ticket_id,
+            'full_name': ticket.full_name,
+            'status': ticket.status,
+            'status_display': ticket.get_status_display(),
+            'suggestion': 'This ticket needs to be approved before it can be used.'
+        }
+    return {
+        'valid': True,
+        'ticket': {
+            'ticket_id': ticket.ticket_id,
+            'full_name': ticket.full_name,
+            'age': ticket.age,
+            'category': ticket.category,
+            'category_display': ticket.get_category_display(),
+            'gender': ticket.gender,
+            'gender_display': ticket.get_gender_display(),
+            'province': ticket.province,
+            'zone': ticket.zone,
+            'area': ticket.area,
+            'parish': ticket.parish,
+            'registered_at': ticket.registered_at,
+            'registered_by': ticket.registered_by.get_display_name() if ticket.registered_by else '',
+            'approved_at': ticket.approved_at,
+            'approved_by': ticket.approved_by.get_display_name() if ticket.approved_by else '',
+            'medical_conditions': ticket.medical_conditions,
+            'dietary_restrictions': ticket.dietary_restrictions,
+            'parent_name': ticket.parent_name,
+            'parent_phone': ticket.parent_phone,
+            'emergency_contact': ticket.emergency_contact,
+            'emergency_phone': ticket.emergency_phone
+        },
+        'verification_time': timezone.now().isoformat(),
+        'message': 'Ticket is valid and approved'
+    }
+
+
+def _body(request):
+    """Request data from a JSON or form body"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+def _json(data, status=200):
+    # DRF's encoder, so dates and times come out as the sync API writes them
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+async def _display_name(user):
+    if 'first_name' not in user.__dict__:
+        # A user built from token claims; read the name without a sync load
+        row = await acached_user_row(user.pk)
+        user = User.from_db(user._state.db, list(row), list(row.values())) if row else user
+    return user.get_display_name() if 'first_name' in user.__dict__ else user.username
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def verify(request):
+    """Verify a ticket by QR code, ticket ID or verification code (public)"""
+    params = request.GET if request.method == 'GET' else _body(request)
+    lookups, error, status = verification_lookups(
+        params.get('code'), params.get('ticket_id'), params.get('qr_data')
+    )
+    ticket = await afind_ticket(lookups) if lookups else None
+    if ticket is None:
+        return _json({'valid': False, 'error': error}, status=status)
+    return _json(verification_data(ticket))
+
+
+@csrf_exempt
+@require_POST
+async def check_in(request, pk):
+    """Check a ticket in; admins, and coordinators for their own province"""
+    try:
+        authenticated = await ClaimsJWTAuthentication().aauthenticate(request)
+    except AuthenticationFailed as e:
+        # InvalidToken too; the same body DRF would send
+        return _json(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, status=401)
+    if authenticated is None:
+        return _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+    user, _ = authenticated
+    # As DRF does, so ReplicaMiddleware can pin the user after the write
+    request.user = user
+
+    # Permissions before the lookup, as DRF checks them before get_object()
+    if user.role not in (User.Role.ADMIN, User.Role.COORDINATOR):
+        return _json({'detail': 'You do not have permission to perform this action.'}, status=403)
+    queryset = Ticket.objects.all()
+    if user.role == User.Role.COORDINATOR:
+        queryset = queryset.filter(province=user.province)
+    ticket = await queryset.filter(pk=pk).afirst()
+    if ticket is None:
+        return _json({'detail': 'No Ticket matches the given query.'}, status=404)
+
+    if ticket.status != Ticket.Status.APPROVED:
+        return _json({'error': 'Cannot check in unapproved ticket'}, status=400)
+
+    already_checked_in = await CheckInRecord.objects.filter(
+        ticket=ticket, checked_in_at__date=timezone.now().date()
+    ).aexists()
+    if already_checked_in:
+        return _json({
+            'success': False,
+            'message': 'Ticket already checked in today',
+            'ticket_id': ticket.ticket_id,
+            'full_name': ticket.full_name
+        })
+
+    data = _body(request)
+    check_in_record = await CheckInRecord.objects.acreate(
+        ticket=ticket,
+        checked_in_by_id=user.pk,
+        check_in_method=data.get('method', 'manual'),
+        notes=data.get('notes', ''),
+        ip_address=trusted_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')
+    )
+    return _json({
+        'success': True,
+        'message': 'Ticket checked in successfully',
+        'check_in_id': str(check_in_record.id),
+        'check_in_time': check_in_record.checked_in_at.isoformat(),
+        'checked_in_by': await _display_name(user),
+        'ticket': {
+            'ticket_id': ticket.ticket_id,
+            'full_name': ticket.full_name,
+            'category': ticket.get_category_display(),
+            'age': ticket.age
+        }
+    })
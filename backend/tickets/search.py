@@ -0,0 +1,156 @@
+"""
+Ticket search.
+
+``Ticket.search_document`` is a generated column holding the lower-cased
+ticket ID, name, email, phone and church hierarchy, so it never drifts from
+the row however the row was written. Searching it is indexed per database:
+
+* PostgreSQL - word-prefix match on ``to_tsvector('simple', ...)`` ranked by
+  ``ts_rank``, or a substring match served by the trigram index (see
+  migration 0008);
+* SQLite - an FTS5 table over the column, kept in sync by triggers,
+  prefix-matched and ranked by bm25;
+* anything else - ``LIKE`` on the column, unranked.
+
+Every search term must match (as a word prefix). Results are annotated with
+``search_rank``, higher is better.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.settings import api_settings
+
+TERM_RE = re.compile(r'[^\W_]+')
+# Longer queries are almost always pasted text; the first words are enough
+MAX_TERMS = 8
+
+FTS_TABLE = 'tickets_ticket_fts'
+FTS_TRIGGERS = {
+    'tickets_ticket_fts_insert': """
+        CREATE TRIGGER IF NOT EXISTS tickets_ticket_fts_insert AFTER INSERT ON tickets_ticket BEGIN
+            INSERT INTO tickets_ticket_fts(rowid, search_document) VALUES (new.rowid, new.search_document);
+        END""",
+    'tickets_ticket_fts_delete': """
+        CREATE TRIGGER IF NOT EXISTS tickets_ticket_fts_delete AFTER DELETE ON tickets_ticket BEGIN
+            INSERT INTO tickets_ticket_fts(tickets_ticket_fts, rowid, search_document)
+            VALUES ('delete', old.rowid, old.search_document);
+        END""",
+    'tickets_ticket_fts_update': """
+        CREATE TRIGGER IF NOT EXISTS tickets_ticket_fts_update AFTER UPDATE ON tickets_ticket
+        WHEN old.search_document IS NOT new.search_document BEGIN
+            INSERT INTO tickets_ticket_fts(tickets_ticket_fts, rowid, search_document)
+            VALUES ('delete', old.rowid, old.search_document);
+            INSERT INTO tickets_ticket_fts(rowid, search_document) VALUES (new.rowid, new.search_document);
+        END""",
+}
+
+
+def install_sqlite_fts(connection):
+    """
+    Create the FTS5 table and its triggers if they are missing, and rebuild
+    the index when they were. SQLite migrations that alter tickets_ticket
+    recreate the table and drop its triggers, so this runs after every
+    migrate (see tickets.signals).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        # Nothing to index until migration 0008 has added the column
+        if 'tickets_ticket' not in connection.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, 'tickets_ticket')}
+        if 'search_document' not in columns:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'tickets_ticket'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if set(FTS_TRIGGERS) <= existing:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "search_document, content='tickets_ticket', content_rowid='rowid', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def terms(query):
+    """Lower-cased words of ``query``, punctuation dropped"""
+    return TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def _postgres(queryset, query, words, column):
+    tsquery = ' & '.join(f'{word}:*' for word in words)
+    vector = f"to_tsvector('simple', {column})"
+    matches = RawSQL(f"{vector} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField())
+    rank = RawSQL(f"ts_rank({vector}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField())
+    return queryset.filter(Q(matches) | Q(search_document__contains=query.lower())).annotate(search_rank=rank)
+
+
+def _sqlite(queryset, words, table):
+    match = ' '.join(f'"{word}"*' for word in words)
+    # Joining the FTS table (rather than a correlated subquery per ticket)
+    # lets bm25 come from the single MATCH scan; extra() is the only way to
+    # put a virtual table in the FROM clause. FTS5 rank is lower-is-better.
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.rowid', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'search_rank': f'-{FTS_TABLE}.rank'},
+    )
+
+
+def search(queryset, query):
+    """Tickets in ``queryset`` matching every word of ``query``, with ``search_rank``"""
+    words = terms(query)
+    if not words:
+        return queryset.filter(search_document__contains=query.strip().lower()).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    if connection.vendor == 'postgresql':
+        return _postgres(queryset, query.strip(), words, f'{table}.{connection.ops.quote_name("search_document")}')
+    if connection.vendor == 'sqlite':
+        return _sqlite(queryset, words, table)
+
+    for word in words:
+        queryset = queryset.filter(search_document__contains=word)
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class TicketSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` over Ticket.search_document. Best matches come first
+    unless the request asks for an explicit ``ordering``, so list this
+    backend after OrderingFilter.
+    """
+    search_param = api_settings.SEARCH_PARAM
+    search_description = 'Ticket ID, name, email, phone, province, zone, area or parish (word prefixes)'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        queryset = search(queryset, query)
+        if not request.query_params.get(OrderingFilter.ordering_param):
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+            queryset = queryset.order_by('-search_rank', *ordering)
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': self.search_description,
+            'schema': {'type': 'string'},
+        }]
@@ -1,15 +1,60 @@
 from rest_framework import serializers
+from django.core.exceptions import FieldDoesNotExist
 from django.core.validators import EmailValidator
 from .models import Ticket, BulkUpload, TicketAuditLog, CheckInRecord
 from users.models import User
+from backend.instrumentation import TimedSerializerMixin
 
 
-class TicketSerializer(serializers.ModelSerializer):
+USER_NAME_COLUMNS = ('first_name', 'last_name', 'username')
+
+
+class SparseFieldsetMixin:
+    """
+    ``fields=[...]`` keeps only the named serializer fields, and
+    ``projection(fields)`` lists the columns those fields read (related ones
+    as ``fk__column``) so the queryset can load just those with ``only()``.
+    """
+    # Serializer field -> columns it reads, where its source isn't a column
+    field_columns = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def unknown_fields(cls, fields):
+        return sorted(set(fields) - set(cls.Meta.fields))
+
+    @classmethod
+    def projection(cls, fields=None):
+        """Columns for ``only()``, or None if a field reads something we can't name"""
+        opts = cls.Meta.model._meta
+        columns = []
+        for name, field in cls(fields=fields).fields.items():
+            if name in cls.field_columns:
+                columns.extend(cls.field_columns[name])
+                continue
+            attr = field.source.split('.')[0]
+            if attr.startswith('get_') and attr.endswith('_display'):
+                attr = attr[len('get_'):-len('_display')]
+            try:
+                if not opts.get_field(attr).concrete:
+                    return None
+            except FieldDoesNotExist:
+                return None
+            columns.append(attr)
+        return list(dict.fromkeys(columns))
+
+
+class TicketSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Ticket model"""
     category_display = serializers.CharField(source='get_category_display', read_only=True)
     gender_display = serializers.CharField(source='get_gender_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
-    registered_by_name = serializers.CharField(source='registered_by.get_display_name', read_only=True)
+    registered_by_name = serializers.SerializerMethodField()
     approved_by_name = serializers.CharField(source='approved_by.get_display_name', read_only=True, allow_null=True)
     age_group = serializers.CharField(source='get_age_group', read_only=True)
     
@@ -46,6 +91,15 @@ class TicketSerializer(serializers.ModelSerializer):
             'qr_code', 'payment_status', 'proof_of_payment'
         ]
     
+    field_columns = {
+        'age_group': ['age'],
+        'registered_by_name': [f'registered_by__{column}' for column in USER_NAME_COLUMNS],
+        'approved_by_name': [f'approved_by__{column}' for column in USER_NAME_COLUMNS],
+    }
+
+    def get_registered_by_name(self, obj):
+        return obj.registered_by.get_display_name() if obj.registered_by else ''
+    
     def validate(self, data):
         """Additional validation logic"""
         age = data.get('age', self.instance.age if self.instance else None)
@@ -65,6 +119,30 @@ class TicketSerializer(serializers.ModelSerializer):
         return data
 
 
+class TicketListSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    """Compact ticket for lists: no medical, parent or emergency details"""
+    category_display = serializers.CharField(source='get_category_display', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    registered_by_name = serializers.SerializerMethodField()
+    id = serializers.UUIDField(format='hex_verbose', read_only=True)
+
+    class Meta:
+        model = Ticket
+        fields = [
+            'id', 'ticket_id', 'full_name', 'age', 'category', 'category_display', 'gender',
+            'province', 'zone', 'area', 'parish', 'status', 'status_display', 'payment_status',
+            'registered_at', 'registered_by_name',
+        ]
+        read_only_fields = fields
+
+    field_columns = {
+        'registered_by_name': [f'registered_by__{column}' for column in USER_NAME_COLUMNS],
+    }
+
+    def get_registered_by_name(self, obj):
+        return obj.registered_by.get_display_name() if obj.registered_by else ''
+
+
 class TicketCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating tickets"""
     
@@ -185,7 +263,7 @@ class BulkUploadCreateSerializer(serializers.Serializer):
         return value
 
 
-class TicketAuditLogSerializer(serializers.ModelSerializer):
+class TicketAuditLogSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for ticket audit logs"""
     user_display = serializers.SerializerMethodField()
     action_display = serializers.CharField(source='get_action_display', read_only=True)
@@ -208,7 +286,7 @@ class TicketAuditLogSerializer(serializers.ModelSerializer):
         return obj.ticket.ticket_id if obj.ticket else None
 
 
-class CheckInRecordSerializer(serializers.ModelSerializer):
+class CheckInRecordSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for check-in records"""
     ticket_id_display = serializers.CharField(source='ticket.ticket_id', read_only=True)
     ticket_full_name = serializers.CharField(source='ticket.full_name', read_only=True)
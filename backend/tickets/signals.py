@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from backend import audit_buffer, prometheus, response_cache
+from backend.metrics import registry as metrics
+from . import audit, search, timeline
+from .models import CheckInRecord, Ticket, TicketAuditLog
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket_timeline(sender, instance, **kwargs):
+    """Drop the cached timeline whenever the ticket changes"""
+    timeline.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=CheckInRecord)
+@receiver(post_delete, sender=CheckInRecord)
+def invalidate_check_in_timeline(sender, instance, **kwargs):
+    timeline.invalidate(instance.ticket_id)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket_responses(sender, instance, **kwargs):
+    """Bump the cached responses of the ticket's province (and its old one)"""
+    # The audit baseline still holds the loaded values here (see tickets.audit)
+    previous = (audit.state(instance) or {}).get('province')
+    response_cache.invalidate_provinces(instance.province, previous)
+
+
+@receiver(post_save, sender=CheckInRecord)
+@receiver(post_delete, sender=CheckInRecord)
+def invalidate_check_in_responses(sender, instance, **kwargs):
+    response_cache.invalidate_provinces(instance.ticket.province)
+
+
+@receiver(audit_buffer.written, sender=TicketAuditLog)
+def invalidate_audited_tickets(sender, instances, **kwargs):
+    """
+    Audit rows are written after the ticket's post_save (at commit or when
+    the request's buffer flushes), so reads in between cached the timeline
+    and the dashboard's recent activity without them.
+    """
+    ticket_ids = {instance.ticket_id for instance in instances if instance.ticket_id}
+    timeline.invalidate(*ticket_ids)
+    response_cache.invalidate_queryset(Ticket.objects.filter(pk__in=ticket_ids))
+
+
+@receiver(post_save, sender=Ticket)
+def count_ticket_events(sender, instance, created, **kwargs):
+    """Business counters; bulk update() approvals are counted where they happen"""
+    if created:
+        transaction.on_commit(lambda: metrics.incr('tickets.created', province=instance.province))
+    previous = (audit.state(instance) or {}).get('status')
+    if instance.status == Ticket.Status.APPROVED and previous != Ticket.Status.APPROVED:
+        transaction.on_commit(lambda: metrics.incr('tickets.approved'))
+
+
+@receiver(post_save, sender=CheckInRecord)
+def count_check_in(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: metrics.incr('check_ins.recorded', method=instance.check_in_method))
+
+
+@prometheus.collector
+def check_ins_last_minute():
+    """Check-ins per minute, counted in the database so every worker's are included"""
+    since = timezone.now() - timedelta(minutes=1)
+    return {('check_ins.last_minute', ()): CheckInRecord.objects.filter(checked_in_at__gte=since).count()}
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    """(Re)create the SQLite full-text index once tickets are migrated"""
+    if sender.label == 'tickets':
+        search.install_sqlite_fts(connections[using])
@@ -1,9 +1,29 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import tempfile
+import uuid
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 from django.utils import timezone
-from .models import Ticket
+from .models import Ticket, TicketAuditLog, CheckInRecord
+from . import audit, search
+from .views import TicketViewSet
+from backend import audit_buffer, db_pool, log_pipeline, prometheus, replicas, response_cache
+from backend.metrics import registry
+from payments.models import Payment, TransactionLog
+from payments.transaction_logs import log_transaction
+from users.authentication import stamp_claims
 from users.models import User
 
 
@@ -257,4 +277,1101 @@ class TicketAPITests(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('total_tickets', response.data)
-        self.assertIn('pending_tickets', response.data)
\ No newline at end of file
+        self.assertIn('pending_tickets', response.data)
+
+class TicketAuditTests(APITestCase):
+    """Field-level audit records and history reconstruction"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='auditadmin',
+            email='auditadmin@example.com',
+            password='adminpass',
+            first_name='Audit',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.payload = {
+            'full_name': 'Audit Teen',
+            'age': 14,
+            'category': Ticket.Category.TEENS,
+            'gender': Ticket.Gender.MALE,
+            'phone': '+2348012345679',
+            'province': User.Province.LAGOS_PROVINCE_9,
+            'zone': 'Zone A',
+            'area': 'Area 1',
+            'parish': 'Parish XYZ',
+            'emergency_contact': 'Parent',
+            'emergency_phone': '+2348023456789',
+            'emergency_relationship': 'Father',
+            'parent_name': 'Parent Name',
+            'parent_email': 'parent@example.com',
+            'parent_phone': '+2348023456789',
+            'parent_relationship': 'Father',
+        }
+
+    def _send(self, method, url, data):
+        # Audit rows are written when the request's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def test_update_stores_only_changed_fields(self):
+        response = self._send('post', '/api/tickets/', self.payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ticket = Ticket.objects.get(id=response.data['id'])
+
+        created = TicketAuditLog.objects.get(ticket=ticket, action=TicketAuditLog.ActionType.CREATE)
+        self.assertEqual(created.new_values['full_name'], 'Audit Teen')
+        self.assertNotIn('department', created.new_values)  # still the default
+        self.assertNotIn('registered_by_name', created.new_values)
+
+        response = self._send('patch', f'/api/tickets/{ticket.id}/', {'zone': 'Zone B', 'age': 15})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        update = TicketAuditLog.objects.get(ticket=ticket, action=TicketAuditLog.ActionType.UPDATE)
+        self.assertEqual(update.old_values, {'zone': 'Zone A', 'age': 14})
+        self.assertEqual(update.new_values, {'zone': 'Zone B', 'age': 15})
+
+        # A no-op update is not audited
+        self._send('patch', f'/api/tickets/{ticket.id}/', {'zone': 'Zone B'})
+        self.assertEqual(TicketAuditLog.objects.filter(ticket=ticket).count(), 2)
+
+    def test_reconstruct_historical_versions(self):
+        ticket_id = self._send('post', '/api/tickets/', self.payload).data['id']
+        ticket = Ticket.objects.get(id=ticket_id)
+        after_create = timezone.now()
+        self._send('patch', f'/api/tickets/{ticket_id}/', {'parish': 'New Parish'})
+        self._send('post', f'/api/tickets/{ticket_id}/update_status/', {'status': 'approved'})
+
+        status_log = TicketAuditLog.objects.get(ticket=ticket, action=TicketAuditLog.ActionType.STATUS_CHANGE)
+        self.assertEqual(status_log.old_values['status'], 'pending')
+        self.assertEqual(status_log.new_values['approved_by'], str(self.admin.id))
+
+        original = audit.reconstruct(ticket, at=after_create)
+        self.assertEqual(original['parish'], 'Parish XYZ')
+        self.assertEqual(original['status'], 'pending')
+        self.assertIsNone(original['approved_by'])
+
+        latest = audit.reconstruct(ticket)
+        ticket.refresh_from_db()
+        self.assertEqual(latest['parish'], 'New Parish')
+        self.assertEqual(latest, {
+            field.name: audit._field_value(field, getattr(ticket, field.attname))
+            for field in audit._audited_fields(Ticket)
+        })
+
+        response = self.client.get(f'/api/tickets/{ticket_id}/history/')
+        self.assertEqual([change['action'] for change in response.data['changes']],
+                         ['create', 'update', 'status_change'])
+        response = self.client.get(f'/api/tickets/{ticket_id}/history/', {'version': 2})
+        self.assertEqual(response.data['values']['parish'], 'New Parish')
+        self.assertEqual(response.data['values']['status'], 'pending')
+
+    def test_diff_needs_no_queries(self):
+        ticket = Ticket.objects.create(registered_by=self.admin, **self.payload)
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        ticket.notes = 'Allergic to nuts'
+        with self.assertNumQueries(0):
+            old_values, new_values = audit.changes(ticket)
+        self.assertEqual((old_values, new_values), ({'notes': ''}, {'notes': 'Allergic to nuts'}))
+
+    def test_loading_defers_the_baseline(self):
+        """Rows that are only read never build an audit baseline"""
+        Ticket.objects.create(registered_by=self.admin, **self.payload)
+        ticket = Ticket.objects.get()
+        self.assertNotIn('_audit_state', ticket.__dict__)
+        ticket.age = 16
+        self.assertEqual(audit.state(ticket)['age'], 14)
+        self.assertNotIn('_audit_row', ticket.__dict__)
+
+
+class AuditBufferTests(APITestCase):
+    """Buffered audit writes for bulk jobs and transactions"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='bufferadmin',
+            email='bufferadmin@example.com',
+            password='adminpass',
+            first_name='Buffer',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+
+    def _csv(self, rows):
+        header = ('full_name,age,category,gender,phone,province,zone,area,parish,emergency_contact,'
+                  'emergency_phone,emergency_relationship,parent_name,parent_email,parent_phone,parent_relationship')
+        lines = [header] + [
+            f'Teen {n},15,teens,male,+2348012345679,lagos_province_9,Zone A,Area 1,Parish,Parent,'
+            f'+2348023456789,Father,Parent,parent@example.com,+2348023456789,Father'
+            for n in range(rows)
+        ]
+        return SimpleUploadedFile('tickets.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+    def test_bulk_upload_batches_audit_inserts(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, AUDIT_BUFFER={'BATCH_SIZE': 10, 'BACKGROUND': False}), \
+                CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bulk-upload/', {'file': self._csv(25)}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['successful_records'], 25)
+        self.assertEqual(TicketAuditLog.objects.filter(action=TicketAuditLog.ActionType.BULK_UPLOAD).count(), 25)
+        audit_inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "tickets_ticketauditlog"')
+        ]
+        self.assertEqual(len(audit_inserts), 3)
+
+    def test_rolled_back_entries_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with audit_buffer.audit_scope():
+                audit_buffer.record(TicketAuditLog(user=self.admin, action=TicketAuditLog.ActionType.UPDATE))
+                try:
+                    with transaction.atomic():
+                        audit_buffer.record(TicketAuditLog(user=self.admin, action=TicketAuditLog.ActionType.CREATE))
+                        raise ValueError
+                except ValueError:
+                    pass
+
+        self.assertEqual(
+            list(TicketAuditLog.objects.values_list('action', flat=True)),
+            [TicketAuditLog.ActionType.UPDATE]
+        )
+
+    def test_rows_keep_the_order_they_were_recorded_in(self):
+        actions = [TicketAuditLog.ActionType.CREATE, TicketAuditLog.ActionType.UPDATE,
+                   TicketAuditLog.ActionType.STATUS_CHANGE]
+        frozen = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=frozen), \
+                self.captureOnCommitCallbacks(execute=True):
+            with audit_buffer.audit_scope():
+                for action in reversed(actions):
+                    audit_buffer.record(TicketAuditLog(user=self.admin, action=action))
+                self.assertFalse(TicketAuditLog.objects.exists())
+
+        self.assertEqual(
+            list(TicketAuditLog.objects.order_by('-timestamp').values_list('action', flat=True)),
+            actions
+        )
+
+
+class AuditLogPaginationTests(APITestCase):
+    """Keyset pagination of the ticket audit log"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='pageadmin',
+            email='pageadmin@example.com',
+            password='adminpass',
+            first_name='Page',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        TicketAuditLog.objects.bulk_create([
+            TicketAuditLog(user=self.admin, action=TicketAuditLog.ActionType.UPDATE) for _ in range(25)
+        ])
+        # Share a timestamp across rows so page boundaries fall inside ties
+        ids = list(TicketAuditLog.objects.order_by('id').values_list('id', flat=True))
+        TicketAuditLog.objects.filter(id__in=ids[5:15]).update(timestamp=timezone.now())
+
+    def _ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_walk_forward_and_back(self):
+        expected = [str(row_id) for row_id in TicketAuditLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True)]
+
+        pages = [self.client.get('/api/audit-logs/', {'page_size': 10})]
+        while pages[-1].data['next']:
+            pages.append(self.client.get(pages[-1].data['next']))
+
+        self.assertNotIn('count', pages[0].data)
+        self.assertIsNone(pages[0].data['previous'])
+        self.assertEqual([len(self._ids(page)) for page in pages], [10, 10, 5])
+        self.assertEqual([row_id for page in pages for row_id in self._ids(page)], expected)
+
+        previous = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(self._ids(previous), self._ids(pages[1]))
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/audit-logs/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/audit-logs/', {'page_size': 25})
+        self.assertEqual(len(small), len(large))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/audit-logs/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TicketTimelineTests(APITestCase):
+    """Merged, cursor-paginated and cached ticket timeline"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='timelineadmin',
+            email='timelineadmin@example.com',
+            password='adminpass',
+            first_name='Timeline',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.ticket = Ticket.objects.create(
+            full_name='Timeline Teen',
+            age=15,
+            category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.FEMALE,
+            phone='+2348012345679',
+            province=User.Province.LAGOS_PROVINCE_9,
+            zone='Zone A',
+            area='Area 1',
+            parish='Parish',
+            emergency_contact='Parent',
+            emergency_phone='+2348023456789',
+            emergency_relationship='Mother',
+            parent_name='Parent',
+            parent_email='parent@example.com',
+            parent_phone='+2348023456789',
+            parent_relationship='Mother',
+            registered_by=self.admin,
+        )
+        self.url = f'/api/tickets/{self.ticket.id}/timeline/'
+
+        TicketAuditLog.objects.create(ticket=self.ticket, user=self.admin, action=TicketAuditLog.ActionType.CREATE)
+        # A bulk payment reaches the ticket only through Payment.tickets
+        payment = Payment.objects.create(
+            reference='TIMELINE_BULK_001',
+            amount='10000.00',
+            description='Bulk registration',
+            payer_email=self.admin.email,
+            metadata={'is_bulk': True},
+        )
+        payment.tickets.set([self.ticket])
+        TransactionLog.objects.create(payment=payment, transaction_type=TransactionLog.TransactionType.INITIATE)
+        CheckInRecord.objects.create(ticket=self.ticket, checked_in_by=self.admin)
+        self.payment = payment
+
+    def test_merges_sources_newest_first(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [event['type'] for event in response.data['results']],
+            ['check_in', 'transaction', 'payment', 'audit']
+        )
+        self.assertTrue(response.data['results'][2]['is_bulk'])
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_walk_with_shared_timestamps(self):
+        # Same instant in every source: the cursor must still be exact
+        for _ in range(2):
+            TicketAuditLog.objects.create(ticket=self.ticket, action=TicketAuditLog.ActionType.UPDATE)
+        moment = timezone.now()
+        TicketAuditLog.objects.update(timestamp=moment)
+        CheckInRecord.objects.update(checked_in_at=moment)
+        Payment.objects.update(initiated_at=moment)
+        TransactionLog.objects.update(timestamp=moment)
+
+        events = []
+        url = self.url + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            events += [(event['type'], event['id']) for event in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(len(events), 6)
+        self.assertEqual(len(set(events)), 6)
+        # Within one source and instant, newest-first by pk, as each query sorts
+        audit_ids = [pk for source, pk in events if source == 'audit']
+        self.assertEqual(audit_ids, sorted(audit_ids, key=uuid.UUID, reverse=True))
+
+    def test_cached_until_the_ticket_changes(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('tickets_checkinrecord' in query['sql'] for query in queries.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CheckInRecord.objects.create(ticket=self.ticket, checked_in_by=self.admin, notes='Day two')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['notes'], 'Day two')
+
+    def test_written_transaction_logs_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            log_transaction(TransactionLog.TransactionType.WEBHOOK, payment=self.payment, is_successful=True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['type'], 'transaction')
+        self.assertEqual(response.data['results'][0]['transaction_type'], TransactionLog.TransactionType.WEBHOOK)
+
+    def test_flushed_audit_rows_invalidate(self):
+        self.client.get(self.url)
+        dashboard_version = response_cache.version(response_cache.ALL)
+        with self.captureOnCommitCallbacks(execute=True), audit_buffer.audit_scope():
+            audit_buffer.record(TicketAuditLog(
+                ticket=self.ticket, user=self.admin, action=TicketAuditLog.ActionType.STATUS_CHANGE
+            ))
+            # Read while the row is still buffered
+            self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['action'], TicketAuditLog.ActionType.STATUS_CHANGE)
+        self.assertNotEqual(response_cache.version(response_cache.ALL), dashboard_version)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def make_ticket(full_name, using=None, **fields):
+    values = dict(
+        full_name=full_name, age=15, category=Ticket.Category.TEENS, gender=Ticket.Gender.MALE,
+        phone='+2348012345679', province=User.Province.LAGOS_PROVINCE_9, zone='Zone A', area='Area 1',
+        parish='Parish', emergency_contact='Parent', emergency_phone='+2348023456789',
+        emergency_relationship='Father', parent_name='Parent', parent_email='parent@example.com',
+        parent_phone='+2348023456789', parent_relationship='Father',
+    )
+    values.update(fields)
+    return Ticket.objects.db_manager(using).create(**values)
+
+
+class TicketSearchTests(APITestCase):
+    """Indexed ticket search"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='searchadmin',
+            email='searchadmin@example.com',
+            password='adminpass',
+            first_name='Search',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.adewale = make_ticket('Adewale Johnson', parish='Grace Chapel')
+        self.ada = make_ticket('Ada Obi', email='ada.obi@example.com')
+        self.tunde = make_ticket('Tunde Bakare', zone='Adeola Zone')
+
+    def _search(self, query, **params):
+        response = self.client.get('/api/tickets/', {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['full_name'] for row in results]
+
+    def test_word_prefixes_across_fields(self):
+        self.assertCountEqual(self._search('ade'), ['Adewale Johnson', 'Tunde Bakare'])
+        self.assertEqual(self._search('ada obi'), ['Ada Obi'])
+        self.assertEqual(self._search('ada.obi@example'), ['Ada Obi'])
+        self.assertEqual(self._search('grace'), ['Adewale Johnson'])
+        self.assertEqual(self._search(self.tunde.ticket_id), ['Tunde Bakare'])
+        self.assertEqual(self._search('nobody'), [])
+
+    def test_ranked_unless_ordering_requested(self):
+        # Both words of the query are in the name: a better match than the zone
+        make_ticket('Adeola Adeola')
+        self.assertEqual(self._search('adeola')[0], 'Adeola Adeola')
+        self.assertEqual(self._search('adeola', ordering='full_name'), ['Adeola Adeola', 'Tunde Bakare'])
+
+    def test_bulk_writes_stay_searchable(self):
+        Ticket.objects.filter(pk=self.adewale.pk).update(full_name='Amaka Johnson')
+        Ticket.objects.bulk_create([Ticket(
+            ticket_id='TKT-BULK-1', full_name='Bulk Kemi', age=15, category=Ticket.Category.TEENS,
+            gender=Ticket.Gender.FEMALE, phone='+2348012345679', province=User.Province.LAGOS_PROVINCE_9,
+            zone='Zone A', area='Area 1', parish='Parish', emergency_contact='Parent',
+            emergency_phone='+2348023456789', emergency_relationship='Mother', parent_name='Parent',
+            parent_email='parent@example.com', parent_phone='+2348023456789', parent_relationship='Mother',
+        )])
+        Ticket.objects.filter(pk=self.tunde.pk).delete()
+
+        self.assertEqual(self._search('amaka'), ['Amaka Johnson'])
+        self.assertEqual(self._search('adewale'), [])
+        self.assertEqual(self._search('kemi'), ['Bulk Kemi'])
+        self.assertEqual(self._search('tunde'), [])
+
+    def test_sqlite_index_rebuilt_when_triggers_are_lost(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite full-text index')
+        with connection.cursor() as cursor:
+            for name in search.FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {name}')
+        make_ticket('Lost Trigger')
+        search.install_sqlite_fts(connection)
+        self.assertEqual(self._search('lost'), ['Lost Trigger'])
+
+
+class TicketCursorPaginationTests(APITestCase):
+    """Opt-in keyset pages for the ticket list"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='cursoradmin',
+            email='cursoradmin@example.com',
+            password='adminpass',
+            first_name='Cursor',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        for n, age in enumerate([15, 13, 15, 17, 15]):
+            make_ticket(f'Teen {n}', age=age)
+
+    def _walk(self, params):
+        rows, pages = [], []
+        response = self.client.get('/api/tickets/', params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response)
+            rows += response.data['results']
+            if not response.data['next']:
+                return rows, pages
+            response = self.client.get(response.data['next'])
+
+    def test_walk_each_ordering_without_count(self):
+        for ordering in ['age', '-age', 'full_name', '-registered_at', 'status']:
+            field = ordering.lstrip('-')
+            expected = [
+                str(pk) for pk in Ticket.objects.order_by(ordering, ordering.replace(field, 'id')).values_list('id', flat=True)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                rows, pages = self._walk({'pagination': 'cursor', 'ordering': ordering, 'page_size': 2})
+            self.assertEqual([row['id'] for row in rows], expected, ordering)
+            self.assertEqual(len(pages), 3)
+            self.assertNotIn('count', pages[0].data)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+        previous = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(previous.data['results'], pages[1].data['results'])
+
+    def test_walk_without_view_ordering(self):
+        expected = [str(pk) for pk in Ticket.objects.order_by('-id').values_list('id', flat=True)]
+        with mock.patch.object(TicketViewSet, 'ordering', None):
+            rows, pages = self._walk({'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertEqual(len(pages), 3)
+
+    def test_cached_total_only_when_asked(self):
+        params = {'pagination': 'cursor', 'count': 'exact'}
+        self.assertEqual(self.client.get('/api/tickets/', params).data['count'], 5)
+        make_ticket('Teen 5', age=16)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tickets/', params)
+        self.assertEqual(response.data['count'], 5)
+        self.assertFalse(response.data['count_is_estimate'])
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_page_numbers_by_default(self):
+        response = self.client.get('/api/tickets/')
+        self.assertEqual(response.data['count'], 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/tickets/', {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TicketListProjectionTests(APITestCase):
+    """Compact list, ?fields= sparse fieldsets and the queries behind them"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='projectionadmin',
+            email='projectionadmin@example.com',
+            password='adminpass',
+            first_name='Projection',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.coordinators = [
+            User.objects.create_user(
+                username=f'projectioncoord{n}', email=f'projectioncoord{n}@example.com', password='pass',
+                first_name='Coord', last_name=str(n), role=User.Role.COORDINATOR,
+                province=User.Province.LAGOS_PROVINCE_9,
+            )
+            for n in range(3)
+        ]
+
+    def _add_tickets(self, count):
+        for n in range(count):
+            make_ticket(
+                f'Teen {n}', medical_conditions='Asthma',
+                registered_by=self.coordinators[n % 3], approved_by=self.admin,
+            )
+
+    def _list(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tickets/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'], queries.captured_queries
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self._add_tickets(2)
+        _, few = self._list()
+        self._add_tickets(6)
+        rows, many = self._list()
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(rows[0]['approved_by_name'], 'Projection Admin')
+
+    def test_compact_list(self):
+        self._add_tickets(2)
+        rows, _ = self._list(compact='true')
+        self.assertIn('status_display', rows[0])
+        self.assertIn('registered_by_name', rows[0])
+        self.assertNotIn('medical_conditions', rows[0])
+        self.assertNotIn('parent_phone', rows[0])
+
+    def test_tickets_without_a_registrar(self):
+        self._add_tickets(1)
+        Ticket.objects.update(registered_by=None)
+        for params in ({}, {'compact': 'true'}):
+            rows, _ = self._list(**params)
+            self.assertEqual(rows[0]['registered_by_name'], '')
+
+    def test_sparse_fields_narrow_the_select(self):
+        self._add_tickets(3)
+        rows, queries = self._list(fields='ticket_id,status_display,registered_by_name')
+        self.assertEqual(set(rows[0]), {'ticket_id', 'status_display', 'registered_by_name'})
+        self.assertTrue(rows[0]['registered_by_name'].startswith('Coord'))
+        select = next(query['sql'] for query in queries if '"tickets_ticket"."ticket_id"' in query['sql'])
+        self.assertNotIn('medical_conditions', select)
+        self.assertIn('"users_user"."first_name"', select)
+
+        ticket = Ticket.objects.first()
+        response = self.client.get(f'/api/tickets/{ticket.pk}/', {'fields': 'full_name,age_group'})
+        self.assertEqual(response.data, {'full_name': ticket.full_name, 'age_group': 'Teens'})
+
+    def test_unknown_field_rejected(self):
+        response = self.client.get('/api/tickets/', {'fields': 'ticket_id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/tickets/', {'compact': 'true', 'fields': 'medical_conditions'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': True, 'TIMEOUT': 300})
+class ResponseCacheTests(APITestCase):
+    """Role/province-scoped response cache with per-province versions"""
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.admin = User.objects.create_superuser(
+            username='cacheadmin',
+            email='cacheadmin@example.com',
+            password='adminpass',
+            first_name='Cache',
+            last_name='Admin'
+        )
+        self.coordinator = User.objects.create_user(
+            username='cachecoord', email='cachecoord@example.com', password='pass',
+            role=User.Role.COORDINATOR, province=User.Province.LAGOS_PROVINCE_9,
+        )
+        self.other_province = next(p for p in User.Province.values if p != User.Province.LAGOS_PROVINCE_9)
+        self.lagos = make_ticket('Lagos Teen')
+        self.elsewhere = make_ticket('Other Teen', province=self.other_province)
+
+    def _names(self, user, **params):
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/tickets/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['X-Cache'], sorted(row['full_name'] for row in response.data['results'])
+
+    def test_repeat_reads_hit_and_report_ratio(self):
+        self.assertEqual(self._names(self.coordinator), ('MISS', ['Lagos Teen']))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._names(self.coordinator), ('HIT', ['Lagos Teen']))
+        self.assertEqual(len(queries), 0)
+        # Same query, different parameter order and a blank parameter
+        self.client.get('/api/tickets/', {'ordering': 'age', 'status': ''})
+        self.assertEqual(self.client.get('/api/tickets/?status=&ordering=age')['X-Cache'], 'HIT')
+        self.assertEqual(self._names(self.admin)[0], 'MISS')
+        self.assertEqual(registry.get('response_cache.hit_ratio', endpoint='tickets.list'), 0.4)
+
+    def test_write_invalidates_only_its_province(self):
+        self._names(self.coordinator)
+        self._names(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.elsewhere.full_name = 'Renamed Teen'
+            self.elsewhere.save()
+        self.assertEqual(self._names(self.coordinator), ('HIT', ['Lagos Teen']))
+        self.assertEqual(self._names(self.admin), ('MISS', ['Lagos Teen', 'Renamed Teen']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.elsewhere.province = User.Province.LAGOS_PROVINCE_9
+            self.elsewhere.save()
+        self.assertEqual(self._names(self.coordinator), ('MISS', ['Lagos Teen', 'Renamed Teen']))
+
+    def test_responses_built_inside_a_write_are_not_reused(self):
+        self._names(self.coordinator)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lagos.full_name = 'Renamed Teen'
+            self.lagos.save()
+            # Read between the write and its commit: cached under the bumped version
+            self._names(self.coordinator)
+        self.assertEqual(self._names(self.coordinator), ('MISS', ['Renamed Teen']))
+
+    def test_bulk_updates_invalidate(self):
+        self._names(self.coordinator, status='approved')
+        tickets = Ticket.objects.filter(pk=self.lagos.pk)
+        tickets.update(status=Ticket.Status.APPROVED)
+        response_cache.invalidate_queryset(tickets)
+        self.assertEqual(self._names(self.coordinator, status='approved'), ('MISS', ['Lagos Teen']))
+
+    def test_dashboards_cached_per_scope(self):
+        self.client.force_authenticate(user=self.coordinator)
+        self.assertEqual(self.client.get('/api/dashboard/')['X-Cache'], 'MISS')
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual((response['X-Cache'], response.data['total_tickets']), ('HIT', 1))
+        make_ticket('Another Lagos Teen')
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual((response['X-Cache'], response.data['total_tickets']), ('MISS', 2))
+
+
+class TicketFacetTests(APITestCase):
+    """Filter counts returned with the ticket list"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='facetadmin',
+            email='facetadmin@example.com',
+            password='adminpass',
+            first_name='Facet',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.other_province = next(p for p in User.Province.values if p != User.Province.LAGOS_PROVINCE_9)
+        make_ticket('Ada Obi', gender=Ticket.Gender.FEMALE, status=Ticket.Status.APPROVED)
+        make_ticket('Tunde Bakare', status=Ticket.Status.APPROVED)
+        make_ticket('Kemi Eze', gender=Ticket.Gender.FEMALE)
+        make_ticket('Emeka Nwosu', province=self.other_province, payment_status=Ticket.PaymentStatus.PAID)
+
+    def _facets(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tickets/', {'facets': 'true', **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facet_counts = {
+            facet: {option['value']: option['count'] for option in options}
+            for facet, options in response.data['facets'].items()
+        }
+        return response, facet_counts, queries
+
+    def test_counts_apply_the_other_filters(self):
+        response, counts, queries = self._facets(status='approved')
+        self.assertEqual(response.data['count'], 2)
+        # Status options ignore the status filter itself
+        self.assertEqual(counts['status'], {'approved': 2, 'pending': 2})
+        self.assertEqual(counts['gender'], {'female': 1, 'male': 1})
+        self.assertEqual(counts['province'], {User.Province.LAGOS_PROVINCE_9: 2})
+        self.assertEqual(counts['payment_status'], {'unpaid': 2})
+        self.assertEqual(response.data['facets']['status'][0]['label'], 'Pending')
+        # Page, total and every facet: three queries
+        self.assertEqual(len(queries), 3)
+
+    def test_selected_option_listed_without_matches(self):
+        _, counts, _ = self._facets(gender='male', payment_status='paid')
+        self.assertEqual(counts['gender'], {'male': 1})
+        self.assertEqual(counts['payment_status'], {'paid': 1, 'unpaid': 1})
+        self.assertEqual(counts['province'], {self.other_province: 1})
+
+    def test_coordinator_counts_follow_search_and_scope(self):
+        coordinator = User.objects.create_user(
+            username='facetcoord', email='facetcoord@example.com', password='pass',
+            role=User.Role.COORDINATOR, province=User.Province.LAGOS_PROVINCE_9,
+        )
+        self.client.force_authenticate(user=coordinator)
+        _, counts, _ = self._facets()
+        self.assertEqual(counts['status'], {'approved': 2, 'pending': 1})
+        _, counts, _ = self._facets(search='ada')
+        self.assertEqual(counts['status'], {'approved': 1})
+
+    @override_settings(RESPONSE_CACHE={'ENABLED': True, 'TIMEOUT': 300})
+    def test_counts_cached_until_a_write(self):
+        cache.clear()
+        self._facets()
+        _, counts, queries = self._facets(status='pending')
+        # Only the page and its total; the combination counts came from the cache
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(counts['status'], {'approved': 2, 'pending': 2})
+        make_ticket('Bisi Ade')
+        _, counts, _ = self._facets(status='pending')
+        self.assertEqual(counts['status'], {'approved': 2, 'pending': 3})
+
+
+INSTRUMENTED = {'ENABLED': True, 'HEADER': True, 'SLOW_REQUEST_MS': 0, 'SLOW_SAMPLE_RATE': 1.0, 'TOP_QUERIES': 2}
+
+
+class InstrumentationTests(APITestCase):
+    """Per-request timings in Server-Timing headers and structured logs"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='timingadmin', email='timingadmin@example.com', password='adminpass',
+            first_name='Timing', last_name='Admin'
+        )
+        self.ticket = make_ticket('Timed Teen')
+        self.client.force_authenticate(user=self.admin)
+
+    @override_settings(INSTRUMENTATION=INSTRUMENTED, RESPONSE_CACHE={'ENABLED': True, 'TIMEOUT': 60})
+    def test_header_and_logs(self):
+        with self.assertLogs('backend.instrumentation', 'INFO') as logs:
+            response = self.client.get('/api/tickets/')
+            self.client.get('/api/tickets/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'serializer;dur=', 'cache;desc="0 hits, 1 misses"', 'total;dur='):
+            self.assertIn(metric, timing)
+
+        records = [vars(record) for record in logs.records]
+        request_lines = [r for r in records if r['msg'] == 'request']
+        self.assertEqual(request_lines[0]['view'], 'ticket-list')
+        self.assertEqual(json.loads(log_pipeline.JSONFormatter().format(logs.records[0]))['view'], 'ticket-list')
+        self.assertGreater(request_lines[0]['db_count'], 0)
+        self.assertEqual((request_lines[1]['cache_hits'], request_lines[1].get('db_count', 0)), (1, 0))
+        slow = [r for r in records if r['msg'] == 'slow request']
+        self.assertEqual(len(slow), 2)
+        self.assertLessEqual(len(slow[0]['slowest_queries']), 2)
+        self.assertIn('SELECT', slow[0]['slowest_queries'][0]['sql'])
+
+    @override_settings(INSTRUMENTATION=INSTRUMENTED)
+    async def test_queries_timed_under_asgi(self):
+        # The ORM runs in a sync_to_async thread, not the event loop's
+        response = await self.async_client.get('/api/scan/verify/', {'code': f'RCCG-{self.ticket.ticket_id}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_disabled_adds_nothing(self):
+        response = self.client.get('/api/tickets/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class FakeRedis:
+    """The hash commands backend.prometheus uses, in memory"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+    def hincrbyfloat(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(float(values.get(field, 0)) + amount)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+
+class MetricsEndpointTests(APITestCase):
+    """Prometheus metrics: per-view latency histograms and business counters"""
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.admin = User.objects.create_superuser(
+            username='metricsadmin', email='metricsadmin@example.com', password='adminpass',
+            first_name='Metrics', last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+
+    @override_settings(METRICS={'ENABLED': True, 'TOKEN': ''})
+    def test_histograms_and_counters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = make_ticket('Counted Teen')
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.approve(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            CheckInRecord.objects.create(ticket=ticket, checked_in_by=self.admin)
+        self.client.get('/api/tickets/')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",view="TicketViewSet.list",le="+Inf"} 1', body)
+        self.assertIn('http_requests_total{status="2xx",view="TicketViewSet.list"} 1', body)
+        self.assertIn(f'tickets_created_total{{province="{User.Province.LAGOS_PROVINCE_9}"}} 1', body)
+        self.assertIn('tickets_approved_total 1', body)
+        self.assertIn('check_ins_recorded_total{method="manual"} 1', body)
+        self.assertIn('check_ins_last_minute 1', body)
+
+    @override_settings(METRICS={'TOKEN': 'scrape-secret'})
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS={'TOKEN': '', 'ALLOWED_IPS': ['10.0.0.5']}, DEBUG=False, TESTING=False)
+    def test_open_only_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, status.HTTP_200_OK)
+
+    def test_recycled_workers_never_lower_the_totals(self):
+        redis = FakeRedis()
+        self.addCleanup(prometheus._published.clear)
+        with mock.patch('backend.prometheus._redis', return_value=redis):
+            registry.incr('tickets.created', 3, province='p')
+            registry.histogram('http.request.duration_seconds', 0.02, view='v')
+            prometheus.publish(force=True)
+            prometheus.retire()
+            self.assertNotIn(prometheus.WORKER_ID, redis.hashes[prometheus.WORKERS_KEY])
+
+            # A fresh worker starts counting from zero
+            registry.reset()
+            prometheus._published.clear()
+            registry.incr('tickets.created', province='p')
+            merged = prometheus.collect()
+
+        self.assertEqual(merged['counters'][('tickets.created', (('province', 'p'),))], 4)
+        histogram = merged['histograms'][('http.request.duration_seconds', (('view', 'v'),))]
+        self.assertEqual((histogram['count'], histogram['counts'][-1]), (1, 1))
+        self.assertEqual(histogram['buckets'][0], 0.005)
+
+    def test_merge_sums_workers(self):
+        registry.incr('tickets.created', province='p')
+        registry.histogram('http.request.duration_seconds', 0.02, view='v')
+        registry.set_gauge('http.requests_in_flight', 1)
+        snapshot = registry.snapshot()
+        merged = prometheus.merge({'a:1': snapshot, 'b:2': snapshot})
+
+        self.assertEqual(merged['counters'][('tickets.created', (('province', 'p'),))], 2)
+        histogram = merged['histograms'][('http.request.duration_seconds', (('view', 'v'),))]
+        self.assertEqual((histogram['count'], histogram['counts'][-1]), (2, 2))
+        self.assertEqual(len(merged['gauges']), 2)
+
+
+class LogPipelineTests(TestCase):
+    """Queued JSON logging with request IDs and sampling"""
+
+    def setUp(self):
+        registry.reset()
+
+    def test_request_id_header(self):
+        response = self.client.get('/health/', HTTP_X_REQUEST_ID='edge-1234')
+        self.assertEqual(response['X-Request-ID'], 'edge-1234')
+        response = self.client.get('/health/', HTTP_X_REQUEST_ID='not a valid id!')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_records_written_as_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = log_pipeline.QueuedHandler(filename=f'{directory}/app-{{pid}}.log', console=False)
+            handler.addFilter(log_pipeline.RequestIdFilter())
+            logger = logging.getLogger('tests.log_pipeline')
+            logger.addHandler(handler)
+            logger.propagate = False
+            token = log_pipeline._request_id.set('req-1')
+            try:
+                logger.warning('Ticket %s approved', 'R63-1', extra={'province': 'lagos'})
+                try:
+                    1 / 0
+                except ZeroDivisionError:
+                    logger.exception('Failed')
+            finally:
+                log_pipeline._request_id.reset(token)
+                logger.removeHandler(handler)
+                logger.propagate = True
+                handler.close()
+
+            with open(f'{directory}/app-{os.getpid()}.log') as f:
+                first, second = [json.loads(line) for line in f]
+        self.assertEqual(
+            (first['message'], first['request_id'], first['province'], first['level']),
+            ('Ticket R63-1 approved', 'req-1', 'lagos', 'WARNING'),
+        )
+        self.assertIn('ZeroDivisionError', second['exception'])
+
+    def test_sampling_keeps_warnings(self):
+        sampling = log_pipeline.SamplingFilter({'noisy': 0.0, 'noisy.important': 1.0})
+
+        def record(name, level):
+            return logging.LogRecord(name, level, __file__, 1, 'message', None, None)
+
+        self.assertFalse(sampling.filter(record('noisy.child', logging.INFO)))
+        self.assertTrue(sampling.filter(record('noisy.child', logging.WARNING)))
+        self.assertTrue(sampling.filter(record('noisy.important', logging.INFO)))
+        self.assertTrue(sampling.filter(record('quiet', logging.INFO)))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = log_pipeline.QueuedHandler(console=False, queue_size=1)
+        # Pretend the listener is running so nothing drains the queue
+        handler._pid = os.getpid()
+        for _ in range(3):
+            handler.handle(logging.LogRecord('busy', logging.INFO, __file__, 1, 'message', None, None))
+        self.assertEqual(registry.get('logging.dropped', logger='busy'), 2)
+
+
+REPLICATED = {'ENABLED': True, 'ALIAS': 'replica', 'MAX_LAG_SECONDS': 10, 'LAG_CHECK_INTERVAL': 5, 'STICKY_SECONDS': 15}
+
+
+@override_settings(REPLICA=REPLICATED)
+class ReplicaRoutingTests(APITestCase):
+    """Dashboards and exports read from the replica (a second SQLite database here)"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        replicas.reset_lag()
+        self.admin = User.objects.create_superuser(
+            username='replicaadmin', email='replicaadmin@example.com', password='adminpass',
+            first_name='Replica', last_name='Admin'
+        )
+        self.ticket = make_ticket('Primary Teen')
+        make_ticket('Replica Teen 1', using='replica', ticket_id='R63-REPLICA-1')
+        make_ticket('Replica Teen 2', using='replica', ticket_id='R63-REPLICA-2')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_dashboard_reads_replica(self):
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['total_tickets'], 2)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_writer_reads_own_writes(self):
+        response = self.client.post(
+            f'/api/tickets/{self.ticket.id}/update-status/', {'status': Ticket.Status.APPROVED}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(replicas.is_pinned(self.admin.pk))
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual((response.data['total_tickets'], response.data['approved_tickets']), (1, 1))
+
+    def test_lagging_replica_falls_back(self):
+        with mock.patch('backend.replicas.measure_lag', return_value=60.0):
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['total_tickets'], 1)
+
+    def test_reads_after_a_write_stay_on_default(self):
+        with replicas.replica_reads() as state:
+            self.assertEqual(Ticket.objects.count(), 2)
+            self.assertTrue(state['routed'])
+            make_ticket('Written Teen')
+            self.assertEqual(Ticket.objects.count(), 2)
+            self.assertEqual(Ticket.objects.filter(full_name='Written Teen').count(), 1)
+
+
+class DatabaseConnectionSettingsTests(SimpleTestCase):
+    """Persistent connections and per-worker pool sizing"""
+
+    def test_pool_sized_per_worker(self):
+        self.assertEqual(db_pool.pool_options(4, 8), {'min_size': 4, 'max_size': 8, 'timeout': 10})
+        # 20 workers share 90 connections: 4 each, below the 8 threads
+        self.assertEqual(db_pool.pool_options(20, 8, max_connections=100)['max_size'], 4)
+        self.assertEqual(db_pool.pool_options(200, 8, max_connections=100)['max_size'], 1)
+
+    def test_persistent_connections(self):
+        config = db_pool.database_config('postgres://app:secret@db:5432/r63', conn_max_age=60)
+        self.assertEqual((config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), (60, True))
+        self.assertNotIn('pool', config.get('OPTIONS', {}))
+
+    def test_pool_replaces_persistent_connections(self):
+        pool = db_pool.pool_options(2, 4)
+        with mock.patch('backend.db_pool.pooling_available', return_value=True):
+            config = db_pool.database_config('postgres://app:secret@db:5432/r63', 60, pool)
+        self.assertEqual((config['CONN_MAX_AGE'], config['OPTIONS']['pool']), (0, pool))
+
+        with mock.patch('backend.db_pool.pooling_available', return_value=False), \
+                self.assertWarns(UserWarning):
+            config = db_pool.database_config('postgres://app:secret@db:5432/r63', 60, pool)
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        # SQLite has no pool
+        config = db_pool.database_config('sqlite:////tmp/r63.db', 60, pool)
+        self.assertNotIn('pool', config.get('OPTIONS', {}))
+
+
+class ScanEndpointTests(TestCase):
+    """The async verify and check-in views answer like the TicketViewSet actions"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='scanadmin', email='scanadmin@example.com', password='adminpass',
+            first_name='Scan', last_name='Admin'
+        )
+        self.coordinator = User.objects.create_user(
+            username='scancoord', email='scancoord@example.com', password='coordpass',
+            first_name='Scan', last_name='Coordinator', role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_28
+        )
+        self.individual = User.objects.create_user(
+            username='scanindividual', email='scanindividual@example.com', password='pass',
+            first_name='Scan', last_name='Individual', role=User.Role.INDIVIDUAL
+        )
+        self.ticket = make_ticket('Scanned Teen', status=Ticket.Status.APPROVED, approved_by=self.admin)
+        self.pending = make_ticket('Pending Teen')
+
+    def _auth(self, user):
+        return {'Authorization': f'Bearer {stamp_claims(AccessToken.for_user(user), user)}'}
+
+    async def test_verify_matches_sync_view(self):
+        for params in ({'code': f'RCCG-{self.ticket.ticket_id}'}, {'ticket_id': str(self.ticket.id)},
+                       {'qr_data': f'RCCG_TICKET:{self.ticket.ticket_id}:Scanned Teen:approved'}):
+            response = await self.async_client.get('/api/scan/verify/', params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertTrue(body['valid'])
+            self.assertEqual(body['ticket']['approved_by'], 'Scan Admin')
+            expected = (await self.async_client.get('/api/tickets/verify/', params)).json()
+            del body['verification_time'], expected['verification_time']
+            self.assertEqual(body, expected)
+
+    async def test_verify_errors(self):
+        response = await self.async_client.get('/api/scan/verify/', {'ticket_id': self.pending.ticket_id})
+        self.assertEqual((response.status_code, response.json()['error']), (200, 'Ticket not approved'))
+        response = await self.async_client.post(
+            '/api/scan/verify/', {'code': 'RCCG-NOPE'}, content_type='application/json'
+        )
+        self.assertEqual((response.status_code, response.json()['error']), (404, 'Invalid verification code'))
+        response = await self.async_client.get('/api/scan/verify/')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_check_in(self):
+        url = f'/api/scan/tickets/{self.ticket.id}/check-in/'
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.post(
+            url, {'method': 'qr_scan'}, content_type='application/json', headers=self._auth(self.admin)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.json()['checked_in_by'], 'Scan Admin')
+        record = await CheckInRecord.objects.aget(ticket=self.ticket)
+        self.assertEqual(record.check_in_method, 'qr_scan')
+
+        response = await self.async_client.post(url, headers=self._auth(self.admin))
+        self.assertEqual(response.json()['message'], 'Ticket already checked in today')
+        self.assertEqual(await CheckInRecord.objects.acount(), 1)
+
+    async def test_check_in_records_the_trusted_address(self):
+        with self.settings(LOGIN_RATE_LIMIT={**settings.LOGIN_RATE_LIMIT, 'TRUSTED_PROXIES': 1}):
+            response = await self.async_client.post(
+                f'/api/scan/tickets/{self.ticket.id}/check-in/', headers={
+                    **self._auth(self.admin), 'X-Forwarded-For': '6.6.6.6, 203.0.113.7'
+                }
+            )
+        self.assertEqual(response.status_code, 200)
+        record = await CheckInRecord.objects.aget(ticket=self.ticket)
+        self.assertEqual(record.ip_address, '203.0.113.7')
+
+    async def test_check_in_scope(self):
+        response = await self.async_client.post(
+            f'/api/scan/tickets/{self.ticket.id}/check-in/', headers=self._auth(self.coordinator)
+        )
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.post(
+            f'/api/scan/tickets/{self.pending.id}/check-in/', headers=self._auth(self.admin)
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_check_in_refuses_other_roles_before_the_lookup(self):
+        for pk in (self.ticket.id, uuid.uuid4()):
+            response = await self.async_client.post(
+                f'/api/scan/tickets/{pk}/check-in/', headers=self._auth(self.individual)
+            )
+            self.assertEqual(response.status_code, 403)
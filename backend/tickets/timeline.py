@@ -0,0 +1,193 @@
+"""
+Ticket timeline: audit records, payments, gateway transaction logs and
+check-ins for one ticket as a single newest-first stream.
+
+Each source is read with one indexed query limited to a page past the
+cursor, and the sorted results are merged in memory. Events are ordered by
+``(timestamp, source, pk)``, with the pk in its own type so the merge
+agrees with each query's ``-pk`` order, and the cursor (the last event's
+key) is exact even when sources share timestamps.
+
+Pages are cached under a per-ticket version that is bumped whenever the
+ticket, its payments or its check-ins change (see tickets.signals and
+payments.signals); TICKET_TIMELINE_CACHE_TIMEOUT bounds staleness for
+writes that fire no signal.
+"""
+
+import base64
+import heapq
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from payments.models import Payment, TransactionLog
+from .models import CheckInRecord, TicketAuditLog
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key):
+    timestamp, source, pk = key
+    payload = {'t': timestamp.isoformat(), 's': source, 'i': pk if isinstance(pk, int) else str(pk)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(encoded):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        timestamp = parse_datetime(payload['t'])
+        if timestamp is None or payload['s'] not in SOURCES or not isinstance(payload['i'], (int, str)):
+            raise ValueError
+        # _after() converts the pk to the source's own type
+        return timestamp, payload['s'], payload['i']
+    except (TypeError, ValueError, KeyError):
+        raise InvalidCursor(encoded)
+
+
+# -- Sources ----------------------------------------------------------------
+
+def _audit(ticket):
+    return TicketAuditLog.objects.filter(ticket=ticket).select_related('user'), 'timestamp'
+
+
+def _check_ins(ticket):
+    return CheckInRecord.objects.filter(ticket=ticket).select_related('checked_in_by'), 'checked_in_at'
+
+
+def _payments(ticket):
+    # Payment.tickets covers single and bulk payments
+    return Payment.objects.filter(tickets=ticket), 'initiated_at'
+
+
+def _transactions(ticket):
+    return TransactionLog.objects.filter(payment__tickets=ticket), 'timestamp'
+
+
+def _display_name(user):
+    return user.get_display_name() if user else 'System'
+
+
+def _audit_event(record):
+    return {
+        'action': record.action,
+        'user': _display_name(record.user),
+        'old_values': record.old_values,
+        'new_values': record.new_values,
+    }
+
+
+def _check_in_event(record):
+    return {
+        'method': record.check_in_method,
+        'checked_in_by': _display_name(record.checked_in_by),
+        'notes': record.notes,
+    }
+
+
+def _payment_event(payment):
+    return {
+        'reference': payment.reference,
+        'amount': str(payment.amount),
+        'currency': payment.currency,
+        'status': payment.status,
+        'payment_method': payment.payment_method,
+        'is_bulk': bool(payment.metadata and payment.metadata.get('is_bulk')),
+        'completed_at': payment.completed_at.isoformat() if payment.completed_at else None,
+    }
+
+
+def _transaction_event(log):
+    return {
+        'transaction_type': log.transaction_type,
+        'payment_id': str(log.payment_id) if log.payment_id else None,
+        'is_successful': log.is_successful,
+        'error_message': log.error_message,
+    }
+
+
+# Source name -> (queryset builder, event serializer). Names double as the
+# tie-break between sources, so keep them stable.
+SOURCES = {
+    'audit': (_audit, _audit_event),
+    'check_in': (_check_ins, _check_in_event),
+    'payment': (_payments, _payment_event),
+    'transaction': (_transactions, _transaction_event),
+}
+
+
+def _after(queryset, field, source, cursor):
+    """Rows whose (timestamp, source, id) key sorts before the cursor"""
+    timestamp, cursor_source, pk = cursor
+    if source < cursor_source:
+        return queryset.filter(**{f'{field}__lte': timestamp})
+    if source > cursor_source:
+        return queryset.filter(**{f'{field}__lt': timestamp})
+    try:
+        pk = queryset.model._meta.pk.to_python(pk)
+    except ValidationError:
+        raise InvalidCursor(pk)
+    return queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk}))
+
+
+def _stream(ticket, source, cursor, limit):
+    build, serialize = SOURCES[source]
+    queryset, field = build(ticket)
+    if cursor is not None:
+        queryset = _after(queryset, field, source, cursor)
+    for row in queryset.order_by(f'-{field}', '-pk')[:limit]:
+        yield (getattr(row, field), source, row.pk), serialize(row)
+
+
+def build_page(ticket, cursor=None, page_size=20):
+    """
+    One page of the ticket's timeline after ``cursor`` (a decoded cursor
+    key or None). Returns ``{'results': [...], 'next': <cursor or None>}``.
+    """
+    # One row past the page tells us whether there is another page
+    streams = [_stream(ticket, source, cursor, page_size + 1) for source in SOURCES]
+    merged = list(heapq.merge(*streams, key=lambda item: item[0], reverse=True))[:page_size + 1]
+
+    events = [
+        {'type': source, 'id': str(pk), 'timestamp': timestamp.isoformat(), **data}
+        for (timestamp, source, pk), data in merged[:page_size]
+    ]
+    has_more = len(merged) > page_size
+    return {
+        'results': events,
+        'next': encode_cursor(merged[page_size - 1][0]) if has_more else None,
+    }
+
+
+# -- Caching ----------------------------------------------------------------
+
+def _version_key(ticket_id):
+    return f'ticket-timeline:{ticket_id}:version'
+
+
+def invalidate(*ticket_ids):
+    """Start a new cache version for each ticket once the change commits"""
+    versions = {_version_key(ticket_id): uuid.uuid4().hex for ticket_id in ticket_ids if ticket_id}
+    if versions:
+        # After commit, so a concurrent read can't cache the old rows under the new version
+        transaction.on_commit(lambda: cache.set_many(versions, None))
+
+
+def get_page(ticket, encoded_cursor=None, page_size=20):
+    """``build_page`` through the cache; raises InvalidCursor for a bad cursor"""
+    cursor = decode_cursor(encoded_cursor) if encoded_cursor else None
+    version = cache.get_or_set(_version_key(ticket.pk), lambda: uuid.uuid4().hex, None)
+    key = f'ticket-timeline:{ticket.pk}:{version}:{page_size}:{encoded_cursor or ""}'
+
+    page = cache.get(key)
+    if page is None:
+        page = build_page(ticket, cursor, page_size)
+        cache.set(key, page, getattr(settings, 'TICKET_TIMELINE_CACHE_TIMEOUT', 300))
+    return page
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import scan, views
 
 router = DefaultRouter()
 router.register(r'tickets', views.TicketViewSet, basename='ticket')
@@ -29,4 +29,8 @@ urlpatterns = [
     
     # Verification endpoint (public)
     path('verify/', views.TicketViewSet.as_view({'get': 'verify', 'post': 'verify'}), name='verify_ticket'),
+    
+    # Async fast path for gate scanners (same responses as verify/ and check_in/)
+    path('scan/verify/', scan.verify, name='scan_verify'),
+    path('scan/tickets/<uuid:pk>/check-in/', scan.check_in, name='scan_check_in'),
 ]
\ No newline at end of file
@@ -3,10 +3,13 @@ from rest_framework import viewsets, generics, status, filters, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.utils.urls import replace_query_param
 from django.db.models import Count, Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.paginator import Paginator
 from django.db import transaction
 import csv
@@ -14,15 +17,21 @@ import io
 
 from .models import Ticket, BulkUpload, TicketAuditLog, CheckInRecord
 from .serializers import (
-    TicketSerializer, TicketCreateSerializer, TicketUpdateSerializer,
+    TicketSerializer, TicketListSerializer, TicketCreateSerializer, TicketUpdateSerializer,
     TicketStatusUpdateSerializer, BulkUploadSerializer,
     BulkUploadCreateSerializer, TicketAuditLogSerializer,
     CheckInRecordSerializer, TicketPaymentUploadSerializer
 )
 from .permissions import TicketPermission, CanApproveTicket
+from .search import TicketSearchFilter
 from .utils import UUIDEncoder, convert_uuid_to_string
+from . import audit, facets, scan, timeline
+from backend import audit_buffer
+from backend.replicas import read_from_replica
+from backend.response_cache import cached_response
+from backend.pagination import KeysetPagination, PageOrCursorPagination
 from .services import QRCodeService, PDFService
-from users.permissions import IsAdmin, IsCoordinator, ProvinceAccessPermission
+from users.permissions import IsAdmin, IsCoordinator, ProvinceAccessPermission, can_access_object
 
 User = get_user_model()
 
@@ -31,30 +40,53 @@ class TicketViewSet(viewsets.ModelViewSet):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [TicketPermission]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = [
-        'full_name', 'ticket_id', 'email', 'phone',
-        'province', 'zone', 'area', 'parish'
-    ]
+    # Search covers ticket ID, name, email, phone, province, zone, area and
+    # parish via Ticket.search_document; it ranks after OrderingFilter applies
+    filter_backends = [filters.OrderingFilter, TicketSearchFilter]
     ordering_fields = ['registered_at', 'full_name', 'age', 'status']
     ordering = ['-registered_at']
+    # ?pagination=cursor pages by (ordering field, id) with no COUNT(*)
+    pagination_class = PageOrCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
             return TicketCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return TicketUpdateSerializer
+        elif self.action == 'list' and self.request.query_params.get('compact') in ('1', 'true'):
+            return TicketListSerializer
         return TicketSerializer
     
-    def get_queryset(self):
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ['list', 'retrieve']:
+            kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+    
+    def requested_fields(self):
+        """Serializer fields named by ?fields=a,b (None for all of them)"""
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return None
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = self.get_serializer_class().unknown_fields(fields)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(unknown)}"})
+        return fields
+    
+    def project(self, queryset):
+        """Load only the columns the response uses, joining the users it names"""
+        columns = self.get_serializer_class().projection(self.requested_fields())
+        if columns is None:
+            return queryset.select_related('registered_by', 'approved_by')
+        # Ordering and the pagination cursor read these whatever is serialized
+        columns += ['id', *self.ordering_fields]
+        related = {column.split('__')[0] for column in columns if '__' in column}
+        return queryset.select_related(*related).only(*columns)
+    
+    def scoped_queryset(self):
+        """Tickets the user may see, before any query-parameter filters"""
         user = self.request.user
         
-        # Apply filters from query parameters
-        status_filter = self.request.query_params.get('status')
-        province_filter = self.request.query_params.get('province')
-        category_filter = self.request.query_params.get('category')
-        gender_filter = self.request.query_params.get('gender')
-        
         # Allow public access for specific actions
         if self.action in ['upload_proof', 'verify', 'qr_code', 'check_in']:
             queryset = Ticket.objects.all()
@@ -63,25 +95,38 @@ class TicketViewSet(viewsets.ModelViewSet):
         else:
             queryset = Ticket.objects.all()
         
-        
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        
-        if province_filter:
-            queryset = queryset.filter(province=province_filter)
-        
-        if category_filter:
-            queryset = queryset.filter(category=category_filter)
-        
-        if gender_filter:
-            queryset = queryset.filter(gender=gender_filter)
-        
         # Apply role-based filtering
         if user.is_authenticated and user.role == User.Role.COORDINATOR:
             queryset = queryset.filter(province=user.province)
         
         return queryset
     
+    def get_queryset(self):
+        queryset = self.scoped_queryset()
+        
+        # Apply filters from query parameters (status, category, gender,
+        # province, payment_status)
+        for field, value in facets.selected(self.request.query_params).items():
+            queryset = queryset.filter(**{field: value})
+        
+        if self.action in ['list', 'retrieve']:
+            queryset = self.project(queryset)
+        
+        return queryset
+    
+    @cached_response('tickets.list')
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = self.facet_counts()
+        return response
+    
+    def facet_counts(self):
+        """Option counts for each filter, under the search and the other filters"""
+        query = self.request.query_params.get(TicketSearchFilter.search_param, '').strip()
+        queryset = TicketSearchFilter().filter_queryset(self.request, self.scoped_queryset(), self)
+        return facets.facet_counts(queryset, self.request, search_active=bool(query))
+    
     def create(self, request, *args, **kwargs):
         """Create a ticket and return full ticket data"""
         # Use the create serializer for validation
@@ -94,18 +139,15 @@ class TicketViewSet(viewsets.ModelViewSet):
             registered_at=timezone.now()
         )
         
-        # Create audit log
-        ticket_data = TicketSerializer(ticket).data
-        ticket_data = convert_uuid_to_string(ticket_data)
-        
-        TicketAuditLog.objects.create(
+        # Create audit log (non-default fields only; see tickets.audit)
+        audit_buffer.record(TicketAuditLog(
             user=request.user,
             action=TicketAuditLog.ActionType.CREATE,
             ticket=ticket,
-            new_values=ticket_data,
+            new_values=audit.creation_values(ticket),
             ip_address=self.get_client_ip(),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
         
         # Return the full ticket data using the main serializer
         serializer = TicketSerializer(ticket)
@@ -136,17 +178,15 @@ class TicketViewSet(viewsets.ModelViewSet):
     
     def perform_update(self, serializer):
         """Update ticket with audit logging"""
-        old_instance = self.get_object()
-        old_values = TicketSerializer(old_instance).data
-        old_values = convert_uuid_to_string(old_values)
-        
         ticket = serializer.save()
         
-        new_values = TicketSerializer(ticket).data
-        new_values = convert_uuid_to_string(new_values)
+        # Only the fields that changed, compared against the loaded instance
+        old_values, new_values = audit.changes(ticket)
+        if not new_values:
+            return
         
         # Create audit log
-        TicketAuditLog.objects.create(
+        audit_buffer.record(TicketAuditLog(
             user=self.request.user,
             action=TicketAuditLog.ActionType.UPDATE,
             ticket=ticket,
@@ -154,7 +194,7 @@ class TicketViewSet(viewsets.ModelViewSet):
             new_values=new_values,
             ip_address=self.get_client_ip(),
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
     
     @action(detail=True, methods=['post'], permission_classes=[CanApproveTicket])
     def update_status(self, request, pk=None):
@@ -166,7 +206,6 @@ class TicketViewSet(viewsets.ModelViewSet):
         )
         
         if serializer.is_valid():
-            old_status = ticket.status
             new_status = serializer.validated_data['status']
             
             # Update ticket
@@ -181,15 +220,16 @@ class TicketViewSet(viewsets.ModelViewSet):
             ticket.save()
             
             # Create audit log
-            TicketAuditLog.objects.create(
+            old_values, new_values = audit.changes(ticket)
+            audit_buffer.record(TicketAuditLog(
                 user=request.user,
                 action=TicketAuditLog.ActionType.STATUS_CHANGE,
                 ticket=ticket,
-                old_values={'status': old_status},
-                new_values={'status': new_status},
+                old_values=old_values,
+                new_values=new_values,
                 ip_address=self.get_client_ip(),
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            ))
             
             return Response(TicketSerializer(ticket).data)
         
@@ -208,20 +248,23 @@ class TicketViewSet(viewsets.ModelViewSet):
             ticket.save()
             
             # Create audit log
-            TicketAuditLog.objects.create(
+            old_values, new_values = audit.changes(ticket)
+            audit_buffer.record(TicketAuditLog(
                 user=request.user if request.user.is_authenticated else None,
                 action='update', # Using generic update or could add PAYMENT_UPLOAD
                 ticket=ticket,
-                new_values={'payment_status': 'verification_pending'},
+                old_values=old_values,
+                new_values=new_values,
                 ip_address=self.get_client_ip(),
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            ))
             
             return Response(TicketSerializer(ticket).data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
+    @read_from_replica
     def export(self, request):
         """Export tickets as CSV"""
         queryset = self.filter_queryset(self.get_queryset())
@@ -272,13 +315,88 @@ class TicketViewSet(viewsets.ModelViewSet):
             ip = self.request.META.get('REMOTE_ADDR')
         return ip
     
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsAdmin])
+    def history(self, request, pk=None):
+        """
+        Audit history of a ticket.
+
+        ?at=<ISO datetime> returns the ticket's field values as of that time,
+        ?version=<n> the values after the n-th change (1-based); otherwise
+        every change is listed.
+        """
+        ticket = self.get_object()
+        
+        at = request.query_params.get('at')
+        if at:
+            as_of = parse_datetime(at)
+            if as_of is None:
+                return Response({'error': 'Invalid "at" datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+            values = audit.reconstruct(ticket, at=as_of)
+            if values is None:
+                return Response({'error': 'No history before that time'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'ticket_id': ticket.ticket_id, 'as_of': as_of, 'values': values})
+        
+        versions = audit.history(ticket)
+        version = request.query_params.get('version')
+        if version:
+            if not version.isdigit() or not 1 <= int(version) <= len(versions):
+                return Response({'error': 'Unknown version'}, status=status.HTTP_404_NOT_FOUND)
+            record, values = versions[int(version) - 1]
+            return Response({
+                'ticket_id': ticket.ticket_id,
+                'version': int(version),
+                'as_of': record.timestamp,
+                'values': values,
+            })
+        
+        return Response({
+            'ticket_id': ticket.ticket_id,
+            'changes': [
+                {
+                    'version': index,
+                    'action': record.action,
+                    'user': record.user.get_display_name() if record.user else 'System',
+                    'timestamp': record.timestamp,
+                    'old_values': record.old_values,
+                    'new_values': record.new_values,
+                }
+                for index, (record, _) in enumerate(versions, start=1)
+            ]
+        })
+    
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Audit records, payments, gateway logs and check-ins for the ticket,
+        newest first. Follow ``next`` for older events; ?page_size= (max 100).
+        """
+        ticket = self.get_object()
+        
+        page_size = request.query_params.get('page_size', '')
+        page_size = min(int(page_size), 100) if page_size.isdigit() and int(page_size) > 0 else 20
+        try:
+            page = timeline.get_page(ticket, request.query_params.get('cursor'), page_size)
+        except timeline.InvalidCursor:
+            raise NotFound('Invalid cursor')
+        
+        next_link = None
+        if page['next']:
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', page['next'])
+        return Response({
+            'ticket_id': ticket.ticket_id,
+            'next': next_link,
+            'results': page['results'],
+        })
+    
     @action(detail=True, methods=['get'])
     def qr_code(self, request, pk=None):
         """Get QR code for a ticket"""
         ticket = self.get_object()
         
         # Check permissions
-        if not self.request.user.has_perm('tickets.view_ticket', ticket):
+        if not can_access_object(request.user, ticket):
             return Response(
                 {'error': 'Permission denied'},
                 status=status.HTTP_403_FORBIDDEN
@@ -314,7 +432,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         ticket = self.get_object()
         
         # Check permissions
-        if not self.request.user.has_perm('tickets.view_ticket', ticket):
+        if not can_access_object(request.user, ticket):
             return Response(
                 {'error': 'Permission denied'},
                 status=status.HTTP_403_FORBIDDEN
@@ -330,6 +448,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         return response
     
     @action(detail=False, methods=['get'])
+    @read_from_replica
     def export_pdf(self, request):
         """Export tickets as PDF"""
         queryset = self.filter_queryset(self.get_queryset())
@@ -357,146 +476,16 @@ class TicketViewSet(viewsets.ModelViewSet):
         
         This endpoint is public and can be used by scanners/check-in staff
         """
-        # Get verification method from query params or request data
-        if request.method == 'GET':
-            verification_code = request.query_params.get('code')
-            ticket_id = request.query_params.get('ticket_id')
-            qr_data = request.query_params.get('qr_data')
-        else:  # POST
-            verification_code = request.data.get('code')
-            ticket_id = request.data.get('ticket_id')
-            qr_data = request.data.get('qr_data')
-        
-        # Determine which method to use
-        if qr_data:
-            # Parse QR code data
-            # Format: RCCG_TICKET:{ticket_id}:{full_name}:{status}
-            try:
-                if qr_data.startswith('RCCG_TICKET:'):
-                    parts = qr_data.split(':')
-                    if len(parts) >= 2:
-                        ticket_identifier = parts[1]
-                        # Try to find by ticket_id
-                        try:
-                            ticket = Ticket.objects.get(ticket_id=ticket_identifier)
-                        except Ticket.DoesNotExist:
-                            # Try by UUID
-                            try:
-                                ticket = Ticket.objects.get(id=ticket_identifier)
-                            except (Ticket.DoesNotExist, ValueError):
-                                return Response(
-                                    {'valid': False, 'error': 'Ticket not found'},
-                                    status=status.HTTP_404_NOT_FOUND
-                                )
-                    else:
-                        return Response(
-                            {'valid': False, 'error': 'Invalid QR code format'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                else:
-                    # Try to parse as ticket ID directly
-                    try:
-                        ticket = Ticket.objects.get(ticket_id=qr_data)
-                    except Ticket.DoesNotExist:
-                        try:
-                            ticket = Ticket.objects.get(id=qr_data)
-                        except (Ticket.DoesNotExist, ValueError):
-                            return Response(
-                                {'valid': False, 'error': 'Invalid QR code'},
-                                status=status.HTTP_404_NOT_FOUND
-                            )
-            except Exception as e:
-                return Response(
-                    {'valid': False, 'error': f'Error parsing QR code: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        elif verification_code:
-            # Parse verification code (format: RCCG-{ticket_id})
-            if verification_code.startswith('RCCG-'):
-                ticket_id_from_code = verification_code[5:]  # Remove 'RCCG-'
-                try:
-                    ticket = Ticket.objects.get(ticket_id=ticket_id_from_code)
-                except Ticket.DoesNotExist:
-                    return Response(
-                        {'valid': False, 'error': 'Invalid verification code'},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-            else:
-                # Try direct ticket ID
-                try:
-                    ticket = Ticket.objects.get(ticket_id=verification_code)
-                except Ticket.DoesNotExist:
-                    return Response(
-                        {'valid': False, 'error': 'Invalid verification code'},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-        
-        elif ticket_id:
-            # Find by ticket ID (could be ticket_id or UUID)
-            try:
-                ticket = Ticket.objects.get(ticket_id=ticket_id)
-            except Ticket.DoesNotExist:
-                try:
-                    ticket = Ticket.objects.get(id=ticket_id)
-                except (Ticket.DoesNotExist, ValueError):
-                    return Response(
-                        {'valid': False, 'error': 'Ticket not found'},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-        
-        else:
-            return Response(
-                {'valid': False, 'error': 'No verification method provided. Use code, ticket_id, or qr_data parameter.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if ticket is approved
-        if ticket.status != Ticket.Status.APPROVED:
-            return Response({
-                'valid': False,
-                'error': 'Ticket not approved',
-                'ticket_id': ticket.ticket_id,
-                'full_name': ticket.full_name,
-                'status': ticket.status,
-                'status_display': ticket.get_status_display(),
-                'suggestion': 'This ticket needs to be approved before it can be used.'
-            })
-        
-        # Check if ticket has already been used (if you have a check-in system)
-        # For now, we'll just return success
-        
-        # Create check-in record (if implementing check-in tracking)
-        # CheckInRecord.objects.create(ticket=ticket, checked_in_by=user, checked_in_at=timezone.now())
+        params = request.query_params if request.method == 'GET' else request.data
+        lookups, error, error_status = scan.verification_lookups(
+            params.get('code'), params.get('ticket_id'), params.get('qr_data')
+        )
+        ticket = scan.find_ticket(lookups) if lookups else None
+        if ticket is None:
+            return Response({'valid': False, 'error': error}, status=error_status)
         
-        return Response({
-            'valid': True,
-            'ticket': {
-                'ticket_id': ticket.ticket_id,
-                'full_name': ticket.full_name,
-                'age': ticket.age,
-                'category': ticket.category,
-                'category_display': ticket.get_category_display(),
-                'gender': ticket.gender,
-                'gender_display': ticket.get_gender_display(),
-                'province': ticket.province,
-                'zone': ticket.zone,
-                'area': ticket.area,
-                'parish': ticket.parish,
-                'registered_at': ticket.registered_at,
-                'registered_by': ticket.registered_by.get_display_name() if ticket.registered_by else '',
-                'approved_at': ticket.approved_at,
-                'approved_by': ticket.approved_by.get_display_name() if ticket.approved_by else '',
-                'medical_conditions': ticket.medical_conditions,
-                'dietary_restrictions': ticket.dietary_restrictions,
-                'parent_name': ticket.parent_name,
-                'parent_phone': ticket.parent_phone,
-                'emergency_contact': ticket.emergency_contact,
-                'emergency_phone': ticket.emergency_phone
-            },
-            'verification_time': timezone.now().isoformat(),
-            'message': 'Ticket is valid and approved'
-        })
+        # Unapproved tickets get valid: False with a 200, as before
+        return Response(scan.verification_data(ticket))
     
     @action(detail=True, methods=['post'])
     def check_in(self, request, pk=None):
@@ -602,7 +591,9 @@ class BulkUploadView(generics.CreateAPIView, generics.ListAPIView):
         
         # Process in background (simplified synchronous processing for now)
         try:
-            self.process_csv(bulk_upload)
+            # Audit rows are bulk-inserted in batches rather than one per row
+            with audit_buffer.audit_scope():
+                self.process_csv(bulk_upload)
             bulk_upload.status = BulkUpload.Status.COMPLETED
             bulk_upload.processed_at = timezone.now()
         except Exception as e:
@@ -661,14 +652,15 @@ class BulkUploadView(generics.CreateAPIView, generics.ListAPIView):
                     )
                     
                     # Create audit log for bulk upload
-                    TicketAuditLog.objects.create(
+                    audit_buffer.record(TicketAuditLog(
                         user=bulk_upload.uploaded_by,
                         action=TicketAuditLog.ActionType.BULK_UPLOAD,
                         ticket=ticket,
                         bulk_upload=bulk_upload,
+                        new_values=audit.creation_values(ticket),
                         ip_address=self.get_client_ip(self.request),
                         user_agent=self.request.META.get('HTTP_USER_AGENT', '')
-                    )
+                    ))
                     
                     successful += 1
                 else:
@@ -703,6 +695,9 @@ class DashboardView(APIView):
     """Dashboard statistics view"""
     permission_classes = [permissions.IsAuthenticated]
     
+    # Recent activity includes the coordinator's own actions in any province
+    @cached_response('tickets.dashboard', per_user=True)
+    @read_from_replica
     def get(self, request):
         user = request.user
         queryset = Ticket.objects.all()
@@ -748,9 +743,9 @@ class DashboardView(APIView):
         
         # Recent activity (last 10 audit logs)
         if user.role == User.Role.ADMIN:
-            recent_activity = TicketAuditLog.objects.all().order_by('-timestamp')[:10]
+            recent_activity = TicketAuditLog.objects.select_related('user', 'ticket').order_by('-timestamp')[:10]
         else:
-            recent_activity = TicketAuditLog.objects.filter(
+            recent_activity = TicketAuditLog.objects.select_related('user', 'ticket').filter(
                 Q(user=user) | Q(ticket__in=queryset)
             ).order_by('-timestamp')[:10]
         
@@ -777,9 +772,14 @@ class TicketAuditLogView(generics.ListAPIView):
     """View for ticket audit logs"""
     serializer_class = TicketAuditLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    pagination_class = KeysetPagination
+
+    @read_from_replica
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
-        queryset = TicketAuditLog.objects.all()
+        queryset = TicketAuditLog.objects.select_related('user', 'ticket')
         
         # Filter by ticket ID
         ticket_id = self.request.query_params.get('ticket_id')
@@ -804,7 +804,8 @@ class TicketAuditLogView(generics.ListAPIView):
         if end_date:
             queryset = queryset.filter(timestamp__lte=end_date)
         
-        return queryset.order_by('-timestamp')
+        # Ordered newest first on (timestamp, id) by KeysetPagination
+        return queryset
     
     
 class CheckInRecordViewSet(viewsets.ReadOnlyModelViewSet):
@@ -846,12 +847,18 @@ class CheckInRecordViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(checked_in_by=user)
         
         return queryset.order_by('-checked_in_at')
+    
+    @cached_response('check_ins.list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 
 class CheckInDashboardView(APIView):
     """Dashboard for check-in statistics"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @cached_response('check_ins.dashboard', vary=lambda request: timezone.now().date().isoformat())
+    @read_from_replica
     def get(self, request):
         user = request.user
         queryset = CheckInRecord.objects.all()
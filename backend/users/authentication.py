@@ -0,0 +1,144 @@
+"""
+JWT authentication without a user query per request.
+
+Tokens issued at login carry the user's username, role, province and
+superuser flag as signed claims (``stamp_claims``). For those tokens
+``ClaimsJWTAuthentication`` builds the user from the claims alone: a
+``ClaimsUser`` whose other columns are deferred and load together, from
+the short-lived user cache or else in one query, the first time anything
+reads one. Role and province checks (users.permissions) cost nothing; a
+view that needs, say, the user's email pays for one row.
+
+Tokens without the claims (issued before they were added) load the user
+through the same cache. Cached rows are dropped whenever a user is saved
+or deleted. The claims are as old as the token, so saving a change to a
+user's role, province or active flag revokes their tokens
+(users.signals); revoking a user's or province's tokens
+(users.token_store) takes effect at once.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from backend import async_cache
+from backend.instrumentation import cache_lookup
+from . import token_store
+from .models import ClaimsUser, User
+
+# User columns copied into claims; all must be present to skip the lookup
+CLAIMS = ('username', 'role', 'province', 'is_superuser')
+
+
+def stamp_claims(token, user):
+    """Sign ``user``'s role and province into ``token`` (and tokens made from it)"""
+    for claim in CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token_store.stamp(token, user)
+
+
+# Columns of the cached user row: not the password hash, which
+# authentication never reads and which loads from the database on demand
+ROW_ATTNAMES = [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+
+def _row_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def cached_user_row(user_id):
+    """
+    ``{attname: value}`` for the user's ROW_ATTNAMES, through the cache;
+    None if there is no such user.
+    """
+    key = _row_key(user_id)
+    row = cache.get(key)
+    cache_lookup(row is not None)
+    if row is None:
+        row = User.objects.filter(pk=user_id).values(*ROW_ATTNAMES).first()
+        if row is None:
+            return None
+        cache.set(key, row, settings.AUTH_USER_CACHE_TIMEOUT)
+    return row
+
+
+async def acached_user_row(user_id):
+    """``cached_user_row`` for async views"""
+    key = _row_key(user_id)
+    row = await async_cache.aget(key)
+    cache_lookup(row is not None)
+    if row is None:
+        row = await User.objects.filter(pk=user_id).values(*ROW_ATTNAMES).afirst()
+        if row is None:
+            return None
+        await async_cache.aset(key, row, settings.AUTH_USER_CACHE_TIMEOUT)
+    return row
+
+
+def forget_user(user_id):
+    cache.delete(_row_key(user_id))
+
+
+def user_from_claims(user_id, token):
+    """A ClaimsUser holding only the id and claimed columns"""
+    known = {claim: token[claim] for claim in CLAIMS}
+    known.update(id=User._meta.pk.to_python(user_id), is_active=True)
+    # from_db() takes the values in column order
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in known]
+    return ClaimsUser.from_db(DEFAULT_DB_ALIAS, names, [known[name] for name in names])
+
+
+def _user_from_row(row):
+    if row is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    user = User.from_db(DEFAULT_DB_ALIAS, list(row), list(row.values()))
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that trusts the token's claims instead of loading the user"""
+
+    def get_user(self, validated_token):
+        user_id = _user_id(validated_token)
+        if all(claim in validated_token for claim in CLAIMS):
+            user = user_from_claims(user_id, validated_token)
+        else:
+            user = _user_from_row(cached_user_row(user_id))
+
+        if token_store.is_revoked(validated_token, user.province):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        ``authenticate`` for async (non-DRF) views: ``(user, token)``, or
+        None without a bearer token; raises AuthenticationFailed/InvalidToken.
+        """
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        user_id = _user_id(validated_token)
+        if all(claim in validated_token for claim in CLAIMS):
+            user = user_from_claims(user_id, validated_token)
+        else:
+            user = _user_from_row(await acached_user_row(user_id))
+
+        if await token_store.ais_revoked(validated_token, user.province):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user, validated_token
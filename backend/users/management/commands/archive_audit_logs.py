@@ -0,0 +1,50 @@
+"""
+Django management command to move old audit, login and transaction logs into cold storage
+Usage: python manage.py archive_audit_logs [--table ticket_audit] [--older-than-days 365] [--rebuild-manifest]
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.archive import TABLES, archive, rebuild_manifest
+
+
+class Command(BaseCommand):
+    help = 'Archives log rows older than the retention period into per-day gzipped JSONL partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table', action='append', choices=sorted(TABLES),
+            help='Table to archive (repeatable; default: all)'
+        )
+        parser.add_argument(
+            '--older-than-days', type=int,
+            help='Archive rows older than this many days (default: AUDIT_ARCHIVE RETENTION_DAYS, '
+                 'or TRANSACTION_LOG_RETENTION_DAYS for transaction_logs)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--rebuild-manifest', action='store_true',
+            help='Only regenerate each manifest.json from its partition files'
+        )
+
+    def handle(self, *args, **options):
+        for name in options['table'] or sorted(TABLES):
+            table = TABLES[name]
+            if options['rebuild_manifest']:
+                manifest = rebuild_manifest(table)
+                self.stdout.write(f"{name}: {len(manifest['partitions'])} partitions indexed")
+                continue
+
+            days = options['older_than_days']
+            if days is None:
+                days = (settings.TRANSACTION_LOG_RETENTION_DAYS if name == 'transaction_logs'
+                        else settings.AUDIT_ARCHIVE['RETENTION_DAYS'])
+            before = timezone.now() - timedelta(days=days)
+            count = archive(table, before, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: archived {count} rows older than {before:%Y-%m-%d %H:%M} to {table.directory}'
+            ))
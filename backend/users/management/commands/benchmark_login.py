@@ -0,0 +1,164 @@
+"""
+Django management command to benchmark the login endpoint under credential stuffing
+Usage: python manage.py benchmark_login [--attempts 200] [--ips 5] [--accounts 200] [--legit-every 20] [--cleanup]
+
+Replays the same stream of login attempts - leaked usernames (mostly real
+accounts, some made up) with guessed passwords from a few addresses, with a member's genuine login
+every ``--legit-every`` requests from their own address - against the login view as
+it was (authenticate() and full-row saves, no rate limit) and as it is.
+Uses Redis for the rate limiter when it is reachable, otherwise LocMemCache.
+"""
+
+import random
+from collections import Counter
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend import token_bucket
+from backend.benchmarking import StepRecorder, format_table
+from users.models import LoginHistory, User
+from users.serializers import LoginSerializer, UserSerializer
+from users.views import CustomTokenObtainPairView
+
+SEED_PREFIX = 'bench_login_'
+PASSWORD = 'correct-horse-battery'
+MEMBERS = 10
+
+
+class LegacyLoginView(CustomTokenObtainPairView):
+    """The login view before the single-fetch pipeline and rate limiting"""
+
+    def post(self, request, *args, **kwargs):
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        username = serializer.validated_data['username']
+        password = serializer.validated_data['password']
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            LoginHistory.objects.create(user=None, ip_address=self.get_client_ip(request), success=False)
+            return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+        if user.account_locked_until and user.account_locked_until > timezone.now():
+            return Response({"detail": "Account is temporarily locked."}, status=status.HTTP_423_LOCKED)
+        user = authenticate(username=username, password=password)
+        if user is None:
+            user = User.objects.get(username=username)
+            user.failed_login_attempts += 1
+            if user.failed_login_attempts >= 5:
+                user.account_locked_until = timezone.now() + timezone.timedelta(minutes=15)
+            user.save()
+            LoginHistory.objects.create(user=user, ip_address=self.get_client_ip(request), success=False)
+            return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+        user.failed_login_attempts = 0
+        user.account_locked_until = None
+        user.save()
+        user.last_login = timezone.now()
+        user.save()
+        LoginHistory.objects.create(user=user, ip_address=self.get_client_ip(request), success=True)
+        refresh = RefreshToken.for_user(user)
+        return Response({'access': str(refresh.access_token), 'refresh': str(refresh),
+                         'user': UserSerializer(user).data})
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks login throughput under a credential-stuffing simulation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200)
+        parser.add_argument('--ips', type=int, default=5, help='Attacking addresses')
+        parser.add_argument('--accounts', type=int, default=200, help='Real accounts in the leaked list')
+        parser.add_argument('--legit-every', type=int, default=20)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded users afterwards')
+
+    def handle(self, *args, **options):
+        users = self._seed(MEMBERS + options['accounts'])
+        members, victims = users[:MEMBERS], users[MEMBERS:]
+        rng = random.Random(42)
+        stream = []
+        for n in range(options['attempts']):
+            if n % options['legit_every'] == 0:
+                index = n // options['legit_every'] % MEMBERS
+                stream.append((f'10.99.0.{index + 1}', members[index].username, PASSWORD))
+                continue
+            target = rng.choice(victims).username if rng.random() < 0.8 else f'guess{rng.randint(0, 10**6)}'
+            stream.append((f'203.0.113.{rng.randint(1, options["ips"])}', target, f'hunter{rng.randint(0, 10**6)}'))
+
+        overrides = {'LOGIN_RATE_LIMIT': {
+            'ENABLED': True, 'IP_CAPACITY': 20, 'IP_PER_MINUTE': 10,
+            'USERNAME_CAPACITY': 5, 'USERNAME_PER_MINUTE': 2,
+        }}
+        if not self._redis_reachable():
+            self.stdout.write('Redis unreachable; rate limiting with process-local buckets')
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+        recorder = StepRecorder()
+        outcomes = {}
+        with override_settings(**overrides):
+            for label, view in (('legacy', LegacyLoginView), ('pipeline', CustomTokenObtainPairView)):
+                self._reset(users)
+                outcomes[label] = self._run(recorder, label, view.as_view(), stream, {user.username for user in members})
+
+        self.stdout.write(format_table(recorder.summary()))
+        for label, counts in outcomes.items():
+            summary = ', '.join(f'{key}: {value}' for key, value in sorted(counts.items()))
+            self.stdout.write(f'{label:<10}{summary}')
+
+        if options['cleanup']:
+            LoginHistory.objects.filter(user__username__startswith=SEED_PREFIX).delete()
+            deleted, _ = User.objects.filter(username__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f'Removed {deleted} seeded rows')
+
+    def _run(self, recorder, label, view, stream, members):
+        factory = APIRequestFactory()
+        counts = Counter()
+        reset_queries()
+        for ip, username, password in stream:
+            request = factory.post(
+                '/api/auth/login/', {'username': username, 'password': password},
+                format='json', REMOTE_ADDR=ip,
+            )
+            with recorder.step(label):
+                response = view(request)
+                response.render()
+            if username in members:
+                counts[f'legit {response.status_code}'] += 1
+            else:
+                counts[f'attack {response.status_code}'] += 1
+        return counts
+
+    def _redis_reachable(self):
+        try:
+            from django_redis import get_redis_connection
+            get_redis_connection('default').ping()
+            return True
+        except Exception:
+            return False
+
+    def _reset(self, users):
+        token_bucket.reset_local()
+        if hasattr(cache, 'delete_pattern'):
+            cache.delete_pattern('token-bucket:*')
+        User.objects.filter(pk__in=[user.pk for user in users]).update(
+            failed_login_attempts=0, account_locked_until=None
+        )
+
+    def _seed(self, count):
+        users = list(User.objects.filter(username__startswith=SEED_PREFIX).order_by('username'))
+        if len(users) >= count:
+            return users
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'{SEED_PREFIX}{n:04d}', email=f'{SEED_PREFIX}{n:04d}@example.com', password=password)
+            for n in range(len(users), count)
+        ])
+        return list(User.objects.filter(username__startswith=SEED_PREFIX).order_by('username'))
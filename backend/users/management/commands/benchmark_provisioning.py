@@ -0,0 +1,68 @@
+"""
+Django management command to benchmark bulk account provisioning
+Usage: python manage.py benchmark_provisioning [--users 100] [--workers N]
+
+Creates the same set of coordinator accounts the way create_provincial_users
+does (create_user() per account: one hash and one INSERT at a time) and
+with users.provisioning, deleting them after each run.
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand
+
+from users import provisioning
+
+User = get_user_model()
+
+SEED_PREFIX = 'bench_provision_'
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks one-by-one versus bulk account provisioning'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--workers', type=int, help='Hashing processes (default: PROVISIONING_HASH_WORKERS)')
+
+    def handle(self, *args, **options):
+        provinces = list(User.Province.values)
+        rows = [
+            {
+                'username': f'{SEED_PREFIX}{n:04d}',
+                'email': f'{SEED_PREFIX}{n:04d}@example.com',
+                'first_name': 'Parish',
+                'last_name': f'Coordinator {n}',
+                'province': provinces[n % len(provinces)],
+                'parish': f'Parish {n}',
+            }
+            for n in range(options['users'])
+        ]
+
+        self.stdout.write(f"{'method':<14}{'accounts':>9}{'seconds':>9}{'accounts/s':>12}{'queries':>9}")
+        for label, run in (
+            ('create_user', lambda: self._one_by_one(rows)),
+            ('provision', lambda: provisioning.provision(rows, workers=options['workers'])),
+        ):
+            User.objects.filter(username__startswith=SEED_PREFIX).delete()
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{label:<14}{len(rows):>9}{elapsed:>9.2f}{len(rows) / elapsed:>12.1f}{len(queries):>9}'
+            )
+        User.objects.filter(username__startswith=SEED_PREFIX).delete()
+
+    def _one_by_one(self, rows):
+        for row in rows:
+            User.objects.create_user(
+                password=provisioning.generate_password(),
+                role=User.Role.COORDINATOR,
+                phone='+2348000000000',
+                **row,
+            )
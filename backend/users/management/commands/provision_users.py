@@ -0,0 +1,70 @@
+"""
+Django management command to create user accounts in bulk from CSV or JSON
+Usage: python manage.py provision_users FILE [--output FILE] [--key KEY] [--workers N]
+       python manage.py provision_users --decrypt FILE [--key KEY]
+
+Columns / keys: username, email, first_name, last_name and optionally
+phone, role (coordinator or individual), province, zone, area, parish.
+Accounts that already exist are skipped, so the command can be re-run.
+The generated passwords are written only to the encrypted output file;
+without --key (or PROVISIONING_CREDENTIALS_KEY) a new key is generated
+and shown once.
+"""
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users import provisioning
+
+
+class Command(BaseCommand):
+    help = 'Creates user accounts in bulk from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='CSV or JSON file of users')
+        parser.add_argument('--output', help='Encrypted credentials file (default: FILE.credentials.enc)')
+        parser.add_argument('--key', help='Fernet key for the credentials file')
+        parser.add_argument('--workers', type=int, help='Password hashing processes')
+        parser.add_argument('--decrypt', metavar='FILE', help='Print a credentials file instead')
+
+    def handle(self, *args, **options):
+        key = options['key'] or settings.PROVISIONING_CREDENTIALS_KEY
+
+        if options['decrypt']:
+            if not key:
+                raise CommandError('--decrypt needs --key or PROVISIONING_CREDENTIALS_KEY')
+            self.stdout.write(provisioning.decrypt_credentials(Path(options['decrypt']).read_bytes(), key))
+            return
+
+        if not options['file']:
+            raise CommandError('Give the file of users to create')
+        source = Path(options['file'])
+        try:
+            rows = provisioning.read_rows(source.read_bytes(), source.name)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        result = provisioning.provision(rows, workers=options['workers'])
+
+        for username in result['existing']:
+            self.stdout.write(self.style.WARNING(f'User {username} already exists. Skipping...'))
+        for error in result['errors']:
+            self.stdout.write(self.style.ERROR(error))
+
+        if result['created']:
+            generated = not key
+            key = key or provisioning.generate_key()
+            output = Path(options['output'] or f'{source}.credentials.enc')
+            output.write_bytes(provisioning.encrypt_credentials(result['created'], key))
+            output.chmod(0o600)
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {len(result['created'])} accounts; credentials written to {output}"
+            ))
+            if generated:
+                self.stdout.write(self.style.WARNING(
+                    f'Credentials key (shown once, store it securely): {key}'
+                ))
+        else:
+            self.stdout.write('No new accounts to create')
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_audit_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginhistory',
+            index=models.Index(fields=['login_time'], name='loginhistory_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginhistory',
+            index=models.Index(fields=['user', 'login_time'], name='loginhistory_user_time_idx'),
+        ),
+    ]
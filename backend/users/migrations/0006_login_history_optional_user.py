@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_login_history_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loginhistory',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='login_history', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
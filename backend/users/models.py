@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Case, F, Value, When
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from django.core.validators import MinLengthValidator, RegexValidator
@@ -110,6 +111,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     password_reset_required = models.BooleanField(default=False)
     failed_login_attempts = models.IntegerField(default=0)
     account_locked_until = models.DateTimeField(null=True, blank=True)
+    MAX_FAILED_LOGINS = 5
+    LOCKOUT_MINUTES = 15
     
     # Audit fields
     created_by = models.ForeignKey(
@@ -137,6 +140,17 @@ class User(AbstractBaseUser, PermissionsMixin):
         ]
         ordering = ['-date_joined']
     
+    # Tokens are only good for the values they were issued under (users.signals)
+    ACCESS_FIELDS = ('is_active', 'role', 'province')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_access = {
+            name: value for name, value in zip(field_names, values) if name in cls.ACCESS_FIELDS
+        }
+        return instance
+
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
     
@@ -165,23 +179,61 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.province == province_name
     
     def increment_failed_login(self):
-        """Increment failed login attempts and lock if needed"""
-        self.failed_login_attempts += 1
-        if self.failed_login_attempts >= 5:
-            self.account_locked_until = timezone.now() + timezone.timedelta(minutes=15)
-        self.save()
+        """
+        Count a failed login and lock the account once MAX_FAILED_LOGINS is
+        reached, in one UPDATE so concurrent failures can't lose a count.
+        """
+        locked_until = timezone.now() + timezone.timedelta(minutes=self.LOCKOUT_MINUTES)
+        type(self).objects.filter(pk=self.pk).update(
+            failed_login_attempts=F('failed_login_attempts') + 1,
+            # Compared against the value before this increment
+            account_locked_until=Case(
+                When(failed_login_attempts__gte=self.MAX_FAILED_LOGINS - 1, then=Value(locked_until)),
+                default=F('account_locked_until'),
+            ),
+        )
+        self.refresh_from_db(fields=['failed_login_attempts', 'account_locked_until'])
     
     def reset_failed_logins(self):
         """Reset failed login attempts"""
         self.failed_login_attempts = 0
         self.account_locked_until = None
-        self.save()
+        self.save(update_fields=['failed_login_attempts', 'account_locked_until'])
+
+
+class ClaimsUser(User):
+    """
+    A User built from access token claims (see users.authentication). The
+    first read of a column the token doesn't carry loads the whole row,
+    from the user cache when it has it, rather than one query per column.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is None or not deferred.intersection(fields):
+            return super().refresh_from_db(using, fields, from_queryset)
+
+        from .authentication import cached_user_row
+        row = cached_user_row(self.pk)
+        if row is None:
+            raise User.DoesNotExist('User matching the token no longer exists.')
+        # Claimed columns too, so a later save() can't write back stale claims
+        self.__dict__.update(row)
+        self._loaded_access = {name: row[name] for name in self.ACCESS_FIELDS if name in row}
+        # Columns the cache doesn't hold (the password hash) come from the database
+        missing = self.get_deferred_fields().intersection(fields)
+        if missing:
+            super().refresh_from_db(using, list(missing), from_queryset)
 
 
 class LoginHistory(models.Model):
     """Track user login history"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_history')
+    # Null for attempts on a username that doesn't exist
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='login_history')
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
     login_time = models.DateTimeField(auto_now_add=True)
@@ -190,9 +242,13 @@ class LoginHistory(models.Model):
     class Meta:
         verbose_name_plural = 'Login Histories'
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['login_time'], name='loginhistory_time_idx'),
+            models.Index(fields=['user', 'login_time'], name='loginhistory_user_time_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.login_time}"
+        return f"{self.user.username if self.user else 'unknown user'} - {self.login_time}"
 
 
 class AuditLog(models.Model):
@@ -220,12 +276,19 @@ class AuditLog(models.Model):
     new_values = models.JSONField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by audit_buffer.record() when the change happens, not when the
+    # buffered row is finally inserted
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
+        # Every filter the audit log view supports, followed by the
+        # (timestamp, id) keyset it pages on
         indexes = [
-            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['timestamp', 'id'], name='auditlog_time_idx'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='auditlog_user_time_idx'),
+            models.Index(fields=['action', 'timestamp', 'id'], name='auditlog_action_time_idx'),
+            models.Index(fields=['entity_type', 'timestamp', 'id'], name='auditlog_entity_time_idx'),
             models.Index(fields=['entity_type', 'entity_id']),
         ]
     
@@ -2,6 +2,22 @@ from rest_framework import permissions
 from .models import User
 
 
+def can_access_object(user, obj):
+    """
+    Whether ``user`` may see ``obj``: admins see everything, coordinators
+    objects in their province. Decided from the user's role and province
+    alone (token claims, see users.authentication), so unlike
+    ``user.has_perm`` it never queries the permission tables.
+    """
+    if not user or not user.is_authenticated:
+        return False
+    if user.is_superuser or user.role == User.Role.ADMIN:
+        return True
+    if user.role == User.Role.COORDINATOR and getattr(obj, 'province', None):
+        return user.can_access_province(obj.province)
+    return False
+
+
 class IsAdmin(permissions.BasePermission):
     """Permission check for admin users"""
     def has_permission(self, request, view):
@@ -1,10 +1,18 @@
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from backend.instrumentation import TimedSerializerMixin
+from . import token_store
+from .authentication import stamp_claims
 from .models import User, LoginHistory, AuditLog
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for User model"""
     full_name = serializers.SerializerMethodField()
     role_display = serializers.CharField(source='get_role_display', read_only=True)
@@ -155,9 +163,88 @@ class TokenResponseSerializer(serializers.Serializer):
     user = UserSerializer()
 
 
-class LoginHistorySerializer(serializers.ModelSerializer):
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh against the cache-backed blacklist (users.token_store)
+    that re-reads the role/province claims from the user's row.
+    """
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        province = refresh.get('province')
+        if token_store.is_blacklisted(refresh) or token_store.is_revoked(refresh, province):
+            raise InvalidToken('Token is blacklisted')
+        
+        user = User.objects.filter(pk=refresh.payload.get(api_settings.USER_ID_CLAIM)).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            # Loses to a concurrent refresh with the same token
+            if not token_store.blacklist(refresh):
+                raise InvalidToken('Token is blacklisted')
+        stamp_claims(refresh, user)
+        
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class LogoutSerializer(serializers.Serializer):
+    """Refresh token to blacklist on logout"""
+    refresh = serializers.CharField()
+    
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class RevokeTokensSerializer(serializers.Serializer):
+    """Whose tokens to revoke: one user, or everyone in a province"""
+    user_id = serializers.UUIDField(required=False)
+    province = serializers.ChoiceField(choices=User.Province.choices, required=False)
+    
+    def validate(self, data):
+        if bool(data.get('user_id')) == bool(data.get('province')):
+            raise serializers.ValidationError("Give exactly one of user_id or province.")
+        return data
+
+
+class ProvisionUserSerializer(serializers.Serializer):
+    """One row of a bulk provisioning file (see users.provisioning)"""
+    username = serializers.CharField(max_length=150, validators=User._meta.get_field('username').validators)
+    email = serializers.EmailField()
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100)
+    phone = serializers.CharField(
+        max_length=20, required=False, allow_blank=True, default='',
+        validators=User._meta.get_field('phone').validators
+    )
+    # Admin accounts are not provisioned in bulk
+    role = serializers.ChoiceField(
+        choices=[User.Role.COORDINATOR, User.Role.INDIVIDUAL], default=User.Role.COORDINATOR
+    )
+    province = serializers.ChoiceField(choices=User.Province.choices, required=False, allow_blank=True, default='')
+    zone = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    area = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    parish = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    
+    def validate(self, data):
+        if data['role'] == User.Role.COORDINATOR and not data['province']:
+            raise serializers.ValidationError({"province": "Coordinators need a province."})
+        data['province'] = data['province'] or None
+        return data
+
+
+class LoginHistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for login history"""
-    user_username = serializers.CharField(source='user.username', read_only=True)
+    user_username = serializers.CharField(source='user.username', read_only=True, allow_null=True)
     
     class Meta:
         model = LoginHistory
@@ -165,7 +252,7 @@ class LoginHistorySerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class AuditLogSerializer(serializers.ModelSerializer):
+class AuditLogSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for audit logs"""
     user_display = serializers.SerializerMethodField()
     action_display = serializers.CharField(source='get_action_display', read_only=True)
@@ -1,3 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import token_store
+from .authentication import forget_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Drop the row token authentication caches for the user"""
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_access(sender, instance, created, **kwargs):
+    """End the sessions issued under the user's old status, role or province"""
+    if created:
+        instance._loaded_access = {name: getattr(instance, name) for name in User.ACCESS_FIELDS}
+        return
+    loaded = getattr(instance, '_loaded_access', None)
+    if not loaded:
+        return
+    current = {name: getattr(instance, name) for name in loaded}
+    if current != loaded:
+        token_store.revoke_user(instance.pk)
+    instance._loaded_access = current
+
+
 # from django.db.models.signals import post_save, pre_delete
 # from django.dispatch import receiver
 # from django.contrib.auth import get_user_model
@@ -1,8 +1,29 @@
-from django.test import TestCase
+import importlib.util
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
-from .models import User
+from rest_framework_simplejwt.tokens import AccessToken
+from backend import archive, token_bucket
+from backend.metrics import registry
+from tickets.models import Ticket
+from . import provisioning
+from .authentication import ClaimsJWTAuthentication
+from .models import User, AuditLog, LoginHistory
+from .permissions import can_access_object
 
 
 class UserModelTests(TestCase):
@@ -92,4 +113,422 @@ class AuthenticationTests(APITestCase):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
-        self.assertIn('detail', response.data)
\ No newline at end of file
+        self.assertIn('detail', response.data)
+
+
+class AuditArchiveTests(APITestCase):
+    """Cold storage of old audit rows and searching across it"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='archiveadmin',
+            email='archiveadmin@example.com',
+            password='adminpass',
+            first_name='Archive',
+            last_name='Admin'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        overrides = self.settings(AUDIT_ARCHIVE={'DIR': self.archive_dir.name, 'RETENTION_DAYS': 365})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.old_time = timezone.now() - timedelta(days=400)
+        self.old = [
+            AuditLog.objects.create(user=self.admin, action=AuditLog.ActionType.UPDATE,
+                                    entity_type='Ticket', entity_id=entity_id)
+            for entity_id in ('TKT-1', 'TKT-1', 'TKT-2')
+        ]
+        AuditLog.objects.filter(pk__in=[log.pk for log in self.old]).update(timestamp=self.old_time)
+        self.recent = AuditLog.objects.create(user=self.admin, action=AuditLog.ActionType.UPDATE,
+                                              entity_type='Ticket', entity_id='TKT-1')
+
+    def _archive(self):
+        return archive.archive(archive.TABLES['audit'], timezone.now() - timedelta(days=365))
+
+    def test_archive_writes_partition_and_manifest(self):
+        self.assertEqual(self._archive(), 3)
+        self.assertEqual(list(AuditLog.objects.values_list('pk', flat=True)), [self.recent.pk])
+
+        directory = Path(self.archive_dir.name) / 'audit'
+        day = self.old_time.date().isoformat()
+        self.assertTrue((directory / f'{day}.jsonl.gz').exists())
+        partition = archive.load_manifest(directory)['partitions'][day]
+        self.assertEqual(partition['rows'], 3)
+        self.assertEqual(partition['index']['entity_id'], ['TKT-1', 'TKT-2'])
+
+    def test_rerun_after_an_interrupted_archive_is_idempotent(self):
+        # The rows reach the partition but the run dies before deleting them
+        with patch('django.db.models.query.QuerySet.delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._archive()
+        self.assertEqual(self._archive(), 3)
+
+        directory = Path(self.archive_dir.name) / 'audit'
+        day = self.old_time.date().isoformat()
+        self.assertEqual(archive.load_manifest(directory)['partitions'][day]['rows'], 3)
+        self.assertEqual(len(list(archive._read_partition(directory / f'{day}.jsonl.gz'))), 3)
+
+    def test_search_spans_hot_and_archived_rows(self):
+        self._archive()
+        response = self.client.get('/api/auth/audit-logs/archive/audit/', {'entity_id': 'TKT-1'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [row['id'] for row in response.data['results']]
+        self.assertEqual(ids[0], str(self.recent.pk))
+        self.assertEqual(sorted(ids[1:]), sorted(str(log.pk) for log in self.old[:2]))
+
+    def test_search_skips_partitions_by_date_and_entity(self):
+        self._archive()
+        table = archive.TABLES['audit']
+        with patch.object(archive, '_read_partition', wraps=archive._read_partition) as read:
+            self.assertEqual(archive.search(table, entity_id='TKT-9'), [])
+            self.assertEqual(archive.search(table, start=timezone.now() - timedelta(days=30)), [
+                archive.serialize(self.recent)
+            ])
+        read.assert_not_called()
+
+    def test_search_rejects_bad_input(self):
+        response = self.client.get('/api/auth/audit-logs/archive/audit/', {'user_id': 'not-a-uuid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/auth/audit-logs/archive/nope/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LoginPipelineTests(APITestCase):
+    """Single-fetch login with atomic lockout counters and rate limiting"""
+    url = '/api/auth/login/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='loginuser',
+            email='loginuser@example.com',
+            password='testpass123',
+            role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_9
+        )
+
+    def _login(self, password, username='loginuser'):
+        return self.client.post(self.url, {'username': username, 'password': password}, format='json')
+
+    def test_success_fetches_once_and_writes_only_last_login(self):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self._login('testpass123')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([q for q in sql if q.startswith('SELECT') and 'FROM "users_user"' in q]), 1)
+        updates = [q for q in sql if q.startswith('UPDATE "users_user"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"last_login"', updates[0])
+        self.assertNotIn('"password"', updates[0])
+        self.assertTrue(LoginHistory.objects.filter(user=self.user, success=True).exists())
+
+    def test_failures_count_atomically_and_lock(self):
+        stale = User.objects.get(pk=self.user.pk)
+        stale.increment_failed_login()
+        # A second copy loaded before the first failure must not overwrite it
+        self.user.increment_failed_login()
+        self.assertEqual(self.user.failed_login_attempts, 2)
+
+        for _ in range(3):
+            self.assertEqual(self._login('wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 5)
+        self.assertIsNotNone(self.user.account_locked_until)
+        self.assertEqual(self._login('testpass123').status_code, status.HTTP_423_LOCKED)
+
+        User.objects.filter(pk=self.user.pk).update(account_locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._login('testpass123').status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.failed_login_attempts, self.user.account_locked_until), (0, None))
+
+    def test_unknown_username_recorded_without_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._login('x', username='nobody').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(LoginHistory.objects.filter(user=None, success=False).exists())
+
+    @override_settings(LOGIN_RATE_LIMIT={
+        'ENABLED': True, 'IP_CAPACITY': 3, 'IP_PER_MINUTE': 1, 'USERNAME_CAPACITY': 2, 'USERNAME_PER_MINUTE': 1,
+    })
+    def test_floods_refused_before_any_lookup(self):
+        token_bucket.reset_local()
+        self.addCleanup(token_bucket.reset_local)
+        self._login('wrong')
+        self._login('wrong')
+        with CaptureQueriesContext(connection) as queries:
+            response = self._login('testpass123')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(len(queries), 0)
+
+        # Another username from the same address still has the IP's last token
+        self.assertEqual(self._login('x', username='other').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._login('x', username='third').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_ip_bucket_ignores_client_sent_forwarded_for(self):
+        token_bucket.reset_local()
+        self.addCleanup(token_bucket.reset_local)
+        limits = {'ENABLED': True, 'IP_CAPACITY': 2, 'IP_PER_MINUTE': 1, 'USERNAME_CAPACITY': 10, 'USERNAME_PER_MINUTE': 1}
+
+        def login(forwarded_for, username):
+            return self.client.post(
+                self.url, {'username': username, 'password': 'x'}, format='json', HTTP_X_FORWARDED_FOR=forwarded_for
+            ).status_code
+
+        with self.settings(LOGIN_RATE_LIMIT=limits):
+            self.assertEqual(login('1.1.1.1', 'a'), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(login('2.2.2.2', 'b'), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(login('3.3.3.3', 'c'), status.HTTP_429_TOO_MANY_REQUESTS)
+
+        with self.settings(LOGIN_RATE_LIMIT=dict(limits, TRUSTED_PROXIES=1)):
+            self.assertEqual(login('9.9.9.9, 10.0.0.1', 'd'), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(login('8.8.8.8, 10.0.0.1', 'e'), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(login('7.7.7.7, 10.0.0.1', 'f'), status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(login('10.0.0.2', 'g'), status.HTTP_401_UNAUTHORIZED)
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    """Role/province claims in tokens, authenticated without a user query"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='claimsuser',
+            email='claimsuser@example.com',
+            password='testpass123',
+            first_name='Claims',
+            last_name='User',
+            role=User.Role.COORDINATOR,
+            province=User.Province.LAGOS_PROVINCE_9
+        )
+        response = self.client.post(
+            '/api/auth/login/', {'username': 'claimsuser', 'password': 'testpass123'}, format='json'
+        )
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+
+    def _authenticate(self, access=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access or self.access}')
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_access_token_carries_role_and_province(self):
+        token = AccessToken(self.access)
+        self.assertEqual(token['role'], User.Role.COORDINATOR)
+        self.assertEqual(token['province'], User.Province.LAGOS_PROVINCE_9)
+
+    def test_password_hash_never_cached(self):
+        user = self._authenticate()
+        self.assertEqual(user.email, 'claimsuser@example.com')
+        self.assertNotIn('password', cache.get(f'auth-user:{self.user.pk}'))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpass123'))
+
+    def test_claims_authenticate_without_queries(self):
+        with self.assertNumQueries(0):
+            user = self._authenticate()
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertTrue(user.is_coordinator)
+            self.assertTrue(can_access_object(user, Ticket(province=User.Province.LAGOS_PROVINCE_9)))
+            self.assertFalse(can_access_object(user, Ticket(province=User.Province.REGIONAL_HQ)))
+
+    def test_other_columns_load_once_then_from_cache(self):
+        with self.assertNumQueries(1):
+            user = self._authenticate()
+            self.assertEqual(user.email, 'claimsuser@example.com')
+            self.assertEqual(user.get_display_name(), 'Claims User')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._authenticate().phone, self.user.phone)
+
+        # Saving the user drops the cached row
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self._authenticate().first_name, 'Renamed')
+
+    def test_refresh_restamps_claims(self):
+        User.objects.filter(pk=self.user.pk).update(province=User.Province.REGIONAL_HQ)
+        response = self.client.post('/api/auth/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['province'], User.Province.REGIONAL_HQ)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/auth/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_without_claims_load_the_user(self):
+        access = str(AccessToken.for_user(self.user))
+        with self.assertNumQueries(1):
+            self.assertEqual(self._authenticate(access).email, 'claimsuser@example.com')
+
+    def test_read_endpoint_with_bearer_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tickets/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "users_user"' in q['sql']])
+
+
+class TokenStoreTests(APITestCase):
+    """Refresh rotation, logout and revocation against the cache token store"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username='storeadmin', email='storeadmin@example.com', password='testpass123',
+            role=User.Role.ADMIN
+        )
+        self.user = User.objects.create_user(
+            username='storeuser', email='storeuser@example.com', password='testpass123',
+            role=User.Role.COORDINATOR, province=User.Province.LAGOS_PROVINCE_9
+        )
+
+    def _login(self, username='storeuser'):
+        response = self.client.post(
+            '/api/auth/login/', {'username': username, 'password': 'testpass123'}, format='json'
+        )
+        return response.data['access'], response.data['refresh']
+
+    def _refresh(self, refresh):
+        return self.client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+
+    def _me(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.get('/api/auth/me/')
+        self.client.credentials()
+        return response.status_code
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        _, refresh = self._login()
+        response = self._refresh(refresh)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._refresh(response.data['refresh']).status_code, status.HTTP_200_OK)
+
+    def test_blacklist_check_needs_no_query(self):
+        _, refresh = self._login()
+        self._refresh(refresh)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_blacklists_refresh_token(self):
+        _, refresh = self._login()
+        response = self.client.post('/api/auth/logout/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_user_and_province(self):
+        access, refresh = self._login()
+        admin_access, _ = self._login('storeadmin')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {admin_access}')
+        response = self.client.post('/api/auth/revoke-tokens/', {'user_id': str(self.user.pk)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials()
+        self.assertEqual(self._me(access), status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Tokens issued after the revocation work
+        access, _ = self._login()
+        self.assertEqual(self._me(access), status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {admin_access}')
+        self.client.post('/api/auth/revoke-tokens/', {'province': User.Province.LAGOS_PROVINCE_9}, format='json')
+        self.assertEqual(self._me(access), status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._me(admin_access), status.HTTP_200_OK)
+
+    def test_failed_revocation_is_reported(self):
+        registry.reset()
+        admin_access, _ = self._login('storeadmin')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {admin_access}')
+        with patch.object(cache, 'set'), self.assertLogs('users.token_store', 'ERROR'):
+            response = self.client.post('/api/auth/revoke-tokens/', {'user_id': str(self.user.pk)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(registry.get('token_store.revoke_failures'), 1)
+
+    def test_access_changes_revoke_sessions(self):
+        access, _ = self._login()
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertEqual(self._me(access), status.HTTP_200_OK)
+
+        user.province = User.Province.LAGOS_PROVINCE_28
+        user.save()
+        self.assertEqual(self._me(access), status.HTTP_401_UNAUTHORIZED)
+
+        access, _ = self._login()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        self.assertEqual(self._me(access), status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_other_sessions(self):
+        old_access, _ = self._login()
+        access, _ = self._login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.post(
+            '/api/auth/change-password/',
+            {'current_password': 'testpass123', 'new_password': 'newpass456!'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials()
+        self.assertEqual(self._me(old_access), status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._me(response.data['access']), status.HTTP_200_OK)
+
+
+class ProvisioningTests(APITestCase):
+    """Bulk account creation from CSV/JSON"""
+    csv_rows = (
+        'username,email,first_name,last_name,province,parish\n'
+        'zone_a,zone_a@example.com,Zone,A,lagos_province_9,Grace\n'
+        'zone_b,zone_b@example.com,Zone,B,lagos_province_28,Mercy\n'
+        'zone_c,zone_c@example.com,Zone,C,,Hope\n'
+        'zone_a,other@example.com,Zone,A2,lagos_province_9,\n'
+    )
+
+    def test_creates_in_one_insert_and_is_idempotent(self):
+        rows = provisioning.read_rows(self.csv_rows.encode(), 'users.csv')
+        with CaptureQueriesContext(connection) as queries:
+            result = provisioning.provision(rows)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "users_user"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([c['username'] for c in result['created']], ['zone_a', 'zone_b'])
+        # Coordinator without a province, and a username repeated in the file
+        self.assertEqual(len(result['errors']), 2)
+
+        user = User.objects.get(username='zone_a')
+        self.assertTrue(user.check_password(result['created'][0]['password']))
+        self.assertEqual((user.role, user.parish), (User.Role.COORDINATOR, 'Grace'))
+        self.assertTrue(user.password_reset_required)
+
+        again = provisioning.provision(rows)
+        self.assertEqual(again['created'], [])
+        self.assertEqual(again['existing'], ['zone_a', 'zone_b'])
+        self.assertEqual(User.objects.filter(username__startswith='zone_').count(), 2)
+
+    def test_json_rows_and_pool_hashing(self):
+        rows = provisioning.read_rows(json.dumps([
+            {'username': 'parish_x', 'email': 'parish_x@example.com', 'first_name': 'P', 'last_name': 'X',
+             'role': 'individual'},
+        ]).encode(), 'users.json')
+        self.assertEqual(len(provisioning.provision(rows)['created']), 1)
+        self.assertEqual(User.objects.get(username='parish_x').role, User.Role.INDIVIDUAL)
+
+        passwords = [f'secret-{n}' for n in range(provisioning.POOL_THRESHOLD)]
+        hashes = provisioning.hash_passwords(passwords, workers=2)
+        self.assertTrue(all(check_password(p, h) for p, h in zip(passwords, hashes)))
+
+    @skipUnless(importlib.util.find_spec('cryptography'), 'cryptography is not installed')
+    def test_api_returns_encrypted_credentials(self):
+        key = provisioning.generate_key()
+        admin = User.objects.create_user(
+            username='provadmin', email='provadmin@example.com', password='testpass123', role=User.Role.ADMIN
+        )
+        self.client.force_authenticate(user=admin)
+        upload = SimpleUploadedFile('users.csv', self.csv_rows.encode(), content_type='text/csv')
+        with override_settings(PROVISIONING_CREDENTIALS_KEY=key):
+            response = self.client.post('/api/auth/users/provision/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        credentials = provisioning.decrypt_credentials(response.data['credentials'].encode(), key)
+        self.assertIn('zone_b,zone_b@example.com,lagos_province_28,', credentials)
+        self.assertEqual(User.objects.get(username='zone_b').created_by, admin)
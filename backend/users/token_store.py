@@ -0,0 +1,108 @@
+"""
+Refresh token blacklist and token revocation in the shared cache.
+
+A used (rotated) or logged-out refresh token's ``jti`` is kept in the cache
+until the token would have expired anyway, so checking it on refresh is
+one key lookup and the store never grows past the tokens still alive.
+Blacklisting is a set-if-absent: of two refreshes racing with the same
+token, only one wins.
+
+Revocation works by version: each user and each province has a version
+key, and tokens are stamped with the versions current when they were
+issued (``stamp``). ``revoke_user`` / ``revoke_province`` set a new version,
+which invalidates every token issued before it in one write. The version
+keys live for the refresh token lifetime; once one has expired so has
+every token that was stamped with an older value. If the cache can't be
+reached, tokens are accepted; a revocation that could not be stored is
+logged and counted (``token_store.revoke_failures``) and reported to the
+caller instead of passing silently.
+"""
+
+import logging
+import time
+
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+from backend import async_cache
+from backend.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+USER_CLAIM = 'user_rev'
+PROVINCE_CLAIM = 'province_rev'
+
+
+def _remaining(token):
+    return max(1, int(token['exp'] - time.time()))
+
+
+def _blacklist_key(token):
+    return f'jwt:blacklist:{token[api_settings.JTI_CLAIM]}'
+
+
+def blacklist(token):
+    """Blacklist ``token``; False if it already was (the token was reused)"""
+    return cache.add(_blacklist_key(token), 1, _remaining(token)) is not False
+
+
+def is_blacklisted(token):
+    return cache.get(_blacklist_key(token)) is not None
+
+
+def _version_key(scope):
+    return f'jwt:revocation:{scope}'
+
+
+def _scopes(user_id, province):
+    return _version_key(f'user:{user_id}'), _version_key(f'province:{province}')
+
+
+def _revoke(scope):
+    key = _version_key(scope)
+    version = time.time_ns()
+    cache.set(key, version, int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+    # The cache swallows its errors (IGNORE_EXCEPTIONS): check the write landed
+    if cache.get(key) != version:
+        metrics.incr('token_store.revoke_failures')
+        logger.error("Could not store the token revocation for %s; its tokens stay valid until they expire", scope)
+        return False
+    return True
+
+
+def revoke_user(user_id):
+    """Invalidate every token issued to the user so far; False if the cache could not store it"""
+    return _revoke(f'user:{user_id}')
+
+
+def revoke_province(province):
+    """Invalidate every token issued so far to users in ``province``; False if the cache could not store it"""
+    return _revoke(f'province:{province}')
+
+
+def stamp(token, user):
+    """Record the user's and province's current versions in ``token``"""
+    user_key, province_key = _scopes(user.pk, user.province)
+    versions = cache.get_many([user_key, province_key])
+    token[USER_CLAIM] = versions.get(user_key)
+    token[PROVINCE_CLAIM] = versions.get(province_key)
+    return token
+
+
+def _revoked(token, versions, user_key, province_key):
+    return any(
+        versions.get(key) is not None and versions[key] != token.get(claim)
+        for key, claim in ((user_key, USER_CLAIM), (province_key, PROVINCE_CLAIM))
+    )
+
+
+def is_revoked(token, province):
+    """Whether a revocation for the token's user or ``province`` postdates it"""
+    user_key, province_key = _scopes(token[api_settings.USER_ID_CLAIM], province)
+    return _revoked(token, cache.get_many([user_key, province_key]), user_key, province_key)
+
+
+async def ais_revoked(token, province):
+    """``is_revoked`` for async views"""
+    user_key, province_key = _scopes(token[api_settings.USER_ID_CLAIM], province)
+    return _revoked(token, await async_cache.aget_many([user_key, province_key]), user_key, province_key)
@@ -1,6 +1,5 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 
 router = DefaultRouter()
@@ -9,7 +8,9 @@ router.register(r'users', views.UserViewSet, basename='user')
 urlpatterns = [
     # Authentication
     path('login/', views.CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('refresh/', views.ClaimsTokenRefreshView.as_view(), name='token_refresh'),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
+    path('revoke-tokens/', views.RevokeTokensView.as_view(), name='revoke_tokens'),
     
     # Current user
     path('me/', views.CurrentUserView.as_view(), name='current_user'),
@@ -21,6 +22,10 @@ urlpatterns = [
     
     # Audit logs
     path('audit-logs/', views.AuditLogView.as_view(), name='audit_logs'),
+    path('audit-logs/archive/<str:table>/', views.AuditArchiveView.as_view(), name='audit_archive'),
+    
+    # Bulk account provisioning
+    path('users/provision/', views.ProvisionUsersView.as_view(), name='provision_users'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -1,23 +1,54 @@
+from datetime import datetime, time
+
 from rest_framework import viewsets, generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
-from django.contrib.auth import authenticate
+from django.utils.dateparse import parse_date, parse_datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import Q
 
 from .models import User, LoginHistory, AuditLog
 from .serializers import (
     UserSerializer, UserCreateSerializer, UserUpdateSerializer,
-    LoginSerializer, TokenResponseSerializer,
+    LoginSerializer, TokenResponseSerializer, ClaimsTokenRefreshSerializer,
+    LogoutSerializer, RevokeTokensSerializer,
     LoginHistorySerializer, AuditLogSerializer
 )
 from .permissions import IsAdmin, IsSelfOrAdmin, ProvinceAccessPermission
+from .authentication import stamp_claims
+from backend import archive, audit_buffer, token_bucket
+from . import provisioning, token_store
+from backend.pagination import KeysetPagination
+from backend.replicas import read_from_replica
+
+
+def trusted_client_ip(request):
+    """
+    The client's address. Clients can send any X-Forwarded-For, so only the
+    entry appended by the outermost trusted proxy (counting TRUSTED_PROXIES
+    hops from the right) is believed; otherwise REMOTE_ADDR.
+    """
+    hops = settings.LOGIN_RATE_LIMIT.get('TRUSTED_PROXIES', 0)
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if hops and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR')
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
-    """Custom token obtain view with login history tracking"""
+    """
+    Login with lockout, rate limiting and login history.
+
+    Per-IP and per-username token buckets refuse floods before any password
+    is hashed; the user is then fetched once and only the changed columns
+    are written. The tokens carry the user's role and province as claims
+    (see users.authentication).
+    """
     
     def post(self, request, *args, **kwargs):
         serializer = LoginSerializer(data=request.data)
@@ -25,17 +56,25 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         
         username = serializer.validated_data['username']
         password = serializer.validated_data['password']
+        ip_address = self.get_client_ip(request)
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
         
-        # Check if user exists
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            LoginHistory.objects.create(
+        wait = self.rate_limit_wait(self.rate_limit_ip(request), username)
+        if wait:
+            return Response(
+                {"detail": "Too many login attempts. Try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(wait)}
+            )
+        
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            audit_buffer.record(LoginHistory(
                 user=None,
-                ip_address=self.get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
+                ip_address=ip_address,
+                user_agent=user_agent,
                 success=False
-            )
+            ), critical=False)
             return Response(
                 {"detail": "Invalid credentials"},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -48,20 +87,16 @@ class CustomTokenObtainPairView(TokenObtainPairView):
                 status=status.HTTP_423_LOCKED
             )
         
-        # Authenticate user
-        user = authenticate(username=username, password=password)
-        
-        if user is None:
-            # Failed login attempt
-            user = User.objects.get(username=username)
+        # Same checks as ModelBackend, on the user we already have
+        if not (user.check_password(password) and user.is_active):
             user.increment_failed_login()
             
-            LoginHistory.objects.create(
+            audit_buffer.record(LoginHistory(
                 user=user,
-                ip_address=self.get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
+                ip_address=ip_address,
+                user_agent=user_agent,
                 success=False
-            )
+            ), critical=False)
             
             return Response(
                 {"detail": "Invalid credentials"},
@@ -69,20 +104,24 @@ class CustomTokenObtainPairView(TokenObtainPairView):
             )
         
         # Successful login
-        user.reset_failed_logins()
         user.last_login = timezone.now()
-        user.save()
+        update_fields = ['last_login']
+        if user.failed_login_attempts or user.account_locked_until:
+            user.failed_login_attempts = 0
+            user.account_locked_until = None
+            update_fields += ['failed_login_attempts', 'account_locked_until']
+        user.save(update_fields=update_fields)
         
         # Track login history
-        LoginHistory.objects.create(
+        audit_buffer.record(LoginHistory(
             user=user,
-            ip_address=self.get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            ip_address=ip_address,
+            user_agent=user_agent,
             success=True
-        )
+        ), critical=False)
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = stamp_claims(RefreshToken.for_user(user), user)
         
         response_data = {
             'access': str(refresh.access_token),
@@ -92,6 +131,21 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         
         return Response(response_data)
     
+    def rate_limit_wait(self, ip_address, username):
+        """Seconds the client must wait before another attempt (0 if none)"""
+        config = settings.LOGIN_RATE_LIMIT
+        if not config['ENABLED']:
+            return 0
+        by_ip = token_bucket.TokenBucket('login-ip', config['IP_CAPACITY'], config['IP_PER_MINUTE'])
+        by_username = token_bucket.TokenBucket(
+            'login-username', config['USERNAME_CAPACITY'], config['USERNAME_PER_MINUTE']
+        )
+        return token_bucket.take((by_ip, ip_address), (by_username, username.lower()))
+
+    def rate_limit_ip(self, request):
+        """The address the IP bucket is keyed on"""
+        return trusted_client_ip(request)
+    
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
@@ -101,6 +155,43 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         return ip
 
 
+class ClaimsTokenRefreshView(TokenRefreshView):
+    """Token refresh that brings the role/province claims up to date"""
+    serializer_class = ClaimsTokenRefreshSerializer
+
+
+class LogoutView(APIView):
+    """Blacklist a refresh token so it can't be used again"""
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token_store.blacklist(serializer.validated_data['refresh'])
+        return Response({"detail": "Logged out."})
+
+
+class RevokeTokensView(APIView):
+    """Revoke every token issued so far to a user or to a province"""
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    
+    def post(self, request):
+        serializer = RevokeTokensSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = serializer.validated_data.get('user_id')
+        if user_id:
+            revoked, scope = token_store.revoke_user(user_id), {"user_id": str(user_id)}
+        else:
+            province = serializer.validated_data['province']
+            revoked, scope = token_store.revoke_province(province), {"province": province}
+        if not revoked:
+            return Response(
+                {"detail": "The revocation could not be stored. Try again."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response({"revoked": scope})
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """ViewSet for User management"""
     queryset = User.objects.all()
@@ -136,7 +227,7 @@ class UserViewSet(viewsets.ModelViewSet):
         user = serializer.save()
         
         # Log the creation
-        AuditLog.objects.create(
+        audit_buffer.record(AuditLog(
             user=self.request.user,
             action=AuditLog.ActionType.CREATE,
             entity_type='User',
@@ -144,16 +235,17 @@ class UserViewSet(viewsets.ModelViewSet):
             new_values=UserSerializer(user).data,
             ip_address=self.get_client_ip(self.request),
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
     
     def perform_update(self, serializer):
         old_instance = self.get_object()
         old_data = UserSerializer(old_instance).data
         
+        # Sessions issued under the old role/province/status end on save (users.signals)
         instance = serializer.save()
         
         # Log the update
-        AuditLog.objects.create(
+        audit_buffer.record(AuditLog(
             user=self.request.user,
             action=AuditLog.ActionType.UPDATE,
             entity_type='User',
@@ -162,11 +254,11 @@ class UserViewSet(viewsets.ModelViewSet):
             new_values=UserSerializer(instance).data,
             ip_address=self.get_client_ip(self.request),
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
     
     def perform_destroy(self, instance):
         # Log before deletion
-        AuditLog.objects.create(
+        audit_buffer.record(AuditLog(
             user=self.request.user,
             action=AuditLog.ActionType.DELETE,
             entity_type='User',
@@ -174,8 +266,9 @@ class UserViewSet(viewsets.ModelViewSet):
             old_values=UserSerializer(instance).data,
             ip_address=self.get_client_ip(self.request),
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
         
+        token_store.revoke_user(instance.pk)
         instance.delete()
     
     def get_client_ip(self, request):
@@ -187,6 +280,40 @@ class UserViewSet(viewsets.ModelViewSet):
         return ip
 
 
+class ProvisionUsersView(APIView):
+    """
+    Create accounts in bulk from an uploaded CSV or JSON file. Accounts
+    that already exist are skipped, so a file can be sent again after
+    fixing the rows that failed. The generated passwords come back only
+    inside ``credentials``, encrypted with PROVISIONING_CREDENTIALS_KEY.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    parser_classes = [MultiPartParser, FormParser]
+    
+    def post(self, request):
+        key = settings.PROVISIONING_CREDENTIALS_KEY
+        if not key:
+            return Response(
+                {"detail": "Provisioning is not configured (PROVISIONING_CREDENTIALS_KEY)."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({"detail": "Upload the users as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = provisioning.read_rows(file.read(), file.name)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        result = provisioning.provision(rows, actor=request.user)
+        return Response({
+            'created': len(result['created']),
+            'existing': result['existing'],
+            'errors': result['errors'],
+            'credentials': provisioning.encrypt_credentials(result['created'], key).decode(),
+        }, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+
 class CurrentUserView(APIView):
     """Get current user info"""
     permission_classes = [permissions.IsAuthenticated]
@@ -219,18 +346,26 @@ class ChangePasswordView(APIView):
         
         user.set_password(new_password)
         user.save()
+        # Every session must log in again with the new password; this one
+        # gets fresh tokens below
+        token_store.revoke_user(user.pk)
         
         # Log password change
-        AuditLog.objects.create(
+        audit_buffer.record(AuditLog(
             user=user,
             action=AuditLog.ActionType.PASSWORD_CHANGE,
             entity_type='User',
             entity_id=str(user.id),
             ip_address=self.get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        ))
         
-        return Response({"detail": "Password changed successfully."})
+        refresh = stamp_claims(RefreshToken.for_user(user), user)
+        return Response({
+            "detail": "Password changed successfully.",
+            "access": str(refresh.access_token),
+            "refresh": str(refresh),
+        })
     
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -259,15 +394,25 @@ class AuditLogView(generics.ListAPIView):
     """View audit logs"""
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    pagination_class = KeysetPagination
+
+    @read_from_replica
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
-        queryset = AuditLog.objects.all()
+        queryset = AuditLog.objects.select_related('user')
         
         # Filter by entity type
         entity_type = self.request.query_params.get('entity_type')
         if entity_type:
             queryset = queryset.filter(entity_type=entity_type)
         
+        # Filter by action
+        action = self.request.query_params.get('action')
+        if action:
+            queryset = queryset.filter(action=action)
+        
         # Filter by user
         user_id = self.request.query_params.get('user_id')
         if user_id:
@@ -281,4 +426,50 @@ class AuditLogView(generics.ListAPIView):
         if end_date:
             queryset = queryset.filter(timestamp__lte=end_date)
         
-        return queryset
\ No newline at end of file
+        return queryset
+
+
+class AuditArchiveView(APIView):
+    """Search a log table across hot rows and archived partitions"""
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    max_limit = 1000
+
+    @read_from_replica
+    def get(self, request, table):
+        try:
+            table = archive.get_table(table)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            start = self._parse_time(request.query_params.get('start_date'))
+            end = self._parse_time(request.query_params.get('end_date'), end_of_day=True)
+        except ValueError:
+            return Response({'error': 'Invalid start_date or end_date'}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = request.query_params.get('limit', '100')
+        limit = min(int(limit), self.max_limit) if limit.isdigit() and int(limit) > 0 else 100
+        filters = {
+            field: request.query_params[field]
+            for field in table.filter_fields if request.query_params.get(field)
+        }
+
+        try:
+            rows = archive.search(table, start=start, end=end, limit=limit, **filters)
+        except (ValueError, ValidationError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'table': table.name, 'count': len(rows), 'results': rows})
+
+    def _parse_time(self, value, end_of_day=False):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            parsed = datetime.combine(day, time.max if end_of_day else time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed